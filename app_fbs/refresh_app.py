@@ -41,9 +41,10 @@ shutil.copy2(
     os.path.join("EPO_OB","app_fbs","src","main","resources","base")
 )
 
-shutil.copy2(
-    os.path.join("EPO_OB","epo_ob.py"),
-    os.path.join("EPO_OB","app_fbs","src","main","python")
-)
+for module in ["epo_ob.py","epo_core.py","epo_reports.py","epo_server.py","epo_publish.py","epo_export.py","epo_engine.py","epo_shm.py","epo_receipts.py","epo_devices.py","epo_journal.py","epo_replica.py"]:
+    shutil.copy2(
+        os.path.join("EPO_OB",module),
+        os.path.join("EPO_OB","app_fbs","src","main","python")
+    )
 
 print("Done!")
\ No newline at end of file
@@ -4,9 +4,12 @@ from PyQt5.QtWidgets import QMainWindow
 from epo_ob import EPOGUI
 
 import sys
+import multiprocessing
 
 if __name__ == '__main__':
 
+    multiprocessing.freeze_support()
+
     app_context = ApplicationContext()       # 1. Instantiate ApplicationContext
 
     qapp = QApplication(sys.argv)
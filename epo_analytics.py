@@ -0,0 +1,143 @@
+"""
+EPO_OB analytics
+================
+Offline statistics of finished events (does not need Qt).
+
+For every event CSV computes finish time distribution, peak number of runners
+in forest, histogram of intervals between starts and score distribution.
+Results are written as CSV tables and PNG charts, one summary row per event is
+written into 'summary.csv'. Files are processed in parallel.
+
+Usage:
+    python epo_analytics.py EPO_221004.csv data.csv -o analytics
+
+by vovo
+
+https://github.com/vojtavozda/EPO_OB
+
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from epo_core import sec2str, loadEvent
+from epo_reports import Timeline, getInForest
+
+# Columns of event dataframe (see `epo_ob.EPOGUI.cols`)
+COLS = ['ID','Name','Gender','Start','Finish','Score','Note','Registered','Fee']
+
+def histogram(values:np.ndarray,binWidth:float):
+    """ Return dataframe of histogram (bin start, bin end, count) """
+
+    if len(values) == 0:
+        return pd.DataFrame({'From':[],'To':[],'Count':[]})
+    lo = np.floor(np.min(values)/binWidth)*binWidth
+    hi = np.floor(np.max(values)/binWidth)*binWidth+binWidth
+    counts,edges = np.histogram(values,bins=np.arange(lo,hi+binWidth/2,binWidth))
+    return pd.DataFrame({'From':edges[:-1],'To':edges[1:],'Count':counts})
+
+def analyseEvent(filename:str,outdir:str,binMinutes:float=5):
+    """ Compute statistics of one event, write tables and chart, return summary """
+
+    name = os.path.splitext(os.path.basename(filename))[0]
+    df = loadEvent(filename,COLS)
+
+    start = df['Start'].to_numpy(dtype=float)
+    finish = df['Finish'].to_numpy(dtype=float)
+    time = df['Time'].to_numpy(dtype=float)
+    started = start[~np.isnan(start)]
+    finishedMask = ~np.isnan(time)
+    times = time[finishedMask]
+
+    # Finish times
+    finishHist = histogram(times,binMinutes*60)
+    # Runners in forest
+    inForestX, inForestN = getInForest(started,finish[finishedMask])
+    # Intervals between consecutive starts
+    intervals = np.diff(np.sort(started))
+    intervalHist = histogram(intervals,60)
+    # Scores
+    scores = df['Score'].dropna().value_counts().sort_index()
+    scores = pd.DataFrame({'Score':scores.index,'Count':scores.to_numpy()})
+
+    prefix = os.path.join(outdir,name)
+    finishHist.assign(From=finishHist['From'].map(sec2str),To=finishHist['To'].map(sec2str)).to_csv(
+        f"{prefix}_finish_times.csv",index=False)
+    intervalHist.to_csv(f"{prefix}_start_intervals.csv",index=False)
+    scores.to_csv(f"{prefix}_scores.csv",index=False)
+
+    # Chart
+    fig = Figure(figsize=(12,8),dpi=100)
+    FigureCanvasAgg(fig)
+    ax1 = fig.add_subplot(221)
+    Timeline(ax1,ax1.twinx()).setData(df)
+    ax1.set_title('Runners in forest')
+    ax = fig.add_subplot(222)
+    ax.bar(finishHist['From']/60,finishHist['Count'],width=binMinutes,align='edge')
+    ax.set_xlabel('Time [min]')
+    ax.set_title('Finish times')
+    ax = fig.add_subplot(223)
+    ax.bar(intervalHist['From']/60,intervalHist['Count'],width=1,align='edge')
+    ax.set_xlabel('Interval [min]')
+    ax.set_title('Intervals between starts')
+    ax = fig.add_subplot(224)
+    ax.bar(scores['Score'],scores['Count'])
+    ax.set_xlabel('Score')
+    ax.set_title('Scores')
+    fig.suptitle(name)
+    fig.tight_layout()
+    fig.savefig(f"{prefix}.png")
+
+    peak = int(np.argmax(inForestN)) if len(inForestN) else None
+    quantiles = np.quantile(times,[0.1,0.25,0.5,0.75,0.9]) if len(times) else [np.nan]*5
+    return {
+        'Event':            name,
+        'Runners':          len(df),
+        'Started':          len(started),
+        'Finished':         len(times),
+        'BestTime':         sec2str(np.min(times)) if len(times) else '',
+        'P10Time':          sec2str(quantiles[0]),
+        'P25Time':          sec2str(quantiles[1]),
+        'MedianTime':       sec2str(quantiles[2]),
+        'P75Time':          sec2str(quantiles[3]),
+        'P90Time':          sec2str(quantiles[4]),
+        'MeanTime':         sec2str(np.mean(times)) if len(times) else '',
+        'PeakInForest':     int(inForestN[peak]) if peak is not None else 0,
+        'PeakTime':         sec2str(inForestX[peak]) if peak is not None else '',
+        'MedianStartInterval':  sec2str(np.median(intervals)) if len(intervals) else '',
+        'MeanScore':        df['Score'].mean(),
+    }
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Statistics of finished EPO events")
+    parser.add_argument('files',nargs='+',help="event CSV files")
+    parser.add_argument('-o','--out',default='analytics',help="output directory (default: %(default)s)")
+    parser.add_argument('-j','--jobs',type=int,default=None,help="number of parallel processes (default: CPU count)")
+    parser.add_argument('--bin',type=float,default=5,help="bin width of finish time histogram in minutes (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out,exist_ok=True)
+
+    summaries = []
+    with ProcessPoolExecutor(args.jobs) as pool:
+        futures = {pool.submit(analyseEvent,f,args.out,args.bin): f for f in args.files}
+        for future,filename in futures.items():
+            try:
+                summaries.append(future.result())
+                print(f"{filename}: done")
+            except Exception as e:
+                print(f"{filename}: failed ({e})",file=sys.stderr)
+
+    pd.DataFrame(summaries).to_csv(os.path.join(args.out,'summary.csv'),index=False)
+    return 0 if len(summaries)==len(args.files) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,701 @@
+"""
+EPO_OB core
+===========
+Functions working with the results dataframe which do not need Qt. They are
+used by the GUI in `epo_ob.py` as well as by command line scripts.
+
+by vovo
+
+https://github.com/vojtavozda/EPO_OB
+
+"""
+
+import io
+import os
+import json
+import bisect
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+
+# Categories with separate standings. Key is prefix of derived columns
+# (`<key>Rank`, `<key>Loss`), value is function returning category of each
+# runner as `pd.Series` (NaN if runner does not belong to any category).
+CATEGORIES = {
+    'Gender':   lambda df: df['Gender'].where(df['Gender'].isin(['M','W'])),
+    'EPO':      lambda df: df['Note'].where(df['Note']=='EPO'),
+}
+
+# Columns of event CSV with declared types (times and fee are converted later)
+EVENT_DTYPES = {
+    'ID':           'int64',
+    'Name':         str,
+    'Gender':       str,
+    'Start':        str,
+    'Finish':       str,
+    'Score':        'float64',
+    'Note':         str,
+    'Registered':   str,
+    'Fee':          str,
+    'Punches':      str,
+}
+# Columns computed from other columns, not read from event CSV
+DERIVED_COLS = {'Time','Loss','Rank'} | {f'{c}Rank' for c in CATEGORIES} | {f'{c}Loss' for c in CATEGORIES}
+# Number of rows of event CSV parsed at once
+CSV_CHUNK_SIZE = 2000
+# Fee rules `(column, value, fee)`, the first matching rule wins. Rule with
+# column None matches every runner (default fee). Event may override them by
+# 'fee_rules.csv' (see `loadFeeRules()`).
+FEE_RULES = [
+    ('Note',    'EPO',  70),
+    ('Note',    'Late', 140),
+    (None,      None,   90),
+]
+# Score-O: time limit [s] and penalty in points per started minute over it
+SCORE_TIME_LIMIT = 60*60
+SCORE_PENALTY = 1
+# Format of cache of parsed event (increase when dataframe layout changes)
+CACHE_VERSION = 3
+
+def str2sec(time_str:str):
+
+    """ Convert string '+-HH:MM:SS' to seconds """
+
+    if time_str == '': return np.nan
+
+    try:
+        time_str = time_str.replace('+','')
+        sign = 1 if '-' not in time_str else -1
+        time_str = time_str.replace('-','')
+        h,m,s = time_str.split(':')
+        # print(f'str2sec({time_str})',sign,h,m,s)
+        return sign*(int(h)*3600 + int(m)*60 + int(s))
+    except:
+        return np.nan
+
+def sec2str(seconds:int,add_sign=False):
+
+    """ Convert seconds to string 'HH:MM:SS' """
+
+    if np.isnan(seconds): return np.nan
+
+    if seconds >= 0:
+        if add_sign:
+            sign = '+'
+        else:
+            sign = ''
+    else:
+        sign = '-'
+    seconds = abs(seconds)
+
+    m, s = divmod(seconds,60)
+    h, m = divmod(m,60)
+    return sign + '%02d:%02d:%02d'%(h,m,s)
+
+def parseTimes(times:pd.Series):
+    """ Vectorized `str2sec()`: convert strings '+-HH:MM:SS' to seconds """
+
+    parts = times.astype('string').str.extract(r'^\s*([+-]?)(\d+):(\d+):(\d+)\s*$')
+    seconds = parts[1].astype(float)*3600 + parts[2].astype(float)*60 + parts[3].astype(float)
+    return seconds.where(parts[0]!='-',-seconds).to_numpy(dtype=float)
+
+def formatSeconds(seconds,add_sign:bool=False):
+    """ Vectorized `sec2str()`: return object array of 'HH:MM:SS' ('' if NaN) """
+
+    seconds = pd.to_numeric(pd.Series(seconds),errors='coerce').to_numpy(dtype=float)
+    valid = ~np.isnan(seconds)
+    total = np.abs(np.where(valid,seconds,0)).astype(np.int64)
+    m, s = np.divmod(total,60)
+    h, m = np.divmod(m,60)
+    sign = np.where(seconds<0,'-','+' if add_sign else '')
+    text = np.char.add(np.char.add(np.char.add(sign,np.char.mod('%02d:',h)),np.char.mod('%02d:',m)),np.char.mod('%02d',s))
+    return np.where(valid,text,'').astype(object)
+
+def formatInt(values):
+    """ Return object array of integers as strings ('' if not a number) """
+
+    values = pd.to_numeric(pd.Series(values),errors='coerce').to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+    return np.where(valid,np.char.mod('%d',np.where(valid,values,0)),'').astype(object)
+
+def formatText(values):
+    """ Return object array of strings ('' if missing) """
+
+    return pd.Series(values).fillna('').astype(str).to_numpy(dtype=object)
+
+def getFees(df:pd.DataFrame,rules:list=FEE_RULES):
+    """ Return fee of every runner of `df` by the first matching rule (NaN if none) """
+
+    conditions = [np.ones(len(df),dtype=bool) if col is None else (df[col]==value).to_numpy(dtype=bool)
+        for col,value,_ in rules]
+    return np.select(conditions,[float(fee) for _,_,fee in rules],default=np.nan)
+
+def loadFeeRules(filename:str):
+    """ Return fee rules from CSV with columns `Column`, `Value` and `Fee`
+    (empty `Column` = default), `FEE_RULES` if the file does not exist """
+
+    if not os.path.isfile(filename): return FEE_RULES
+    df = pd.read_csv(filename,dtype=str,keep_default_na=False,encoding='utf-8')
+    return [(row['Column'] or None, row['Value'] or None, float(row['Fee'])) for _,row in df.iterrows()]
+
+def parseBool(values:pd.Series):
+    """ Convert strings 'True'/'1'/'1.0' to True, anything else to False """
+
+    return values.astype('string').str.strip().str.lower().isin(['true','1','1.0']).to_numpy(dtype=bool)
+
+def isNumber(num:str):
+
+    try:
+        float(num)
+        if np.isnan(float(num)):
+            return False
+        return True
+    except:
+        return False
+
+def diff_times(start_str:str,finish_str:str):
+
+    if start_str=='' or finish_str=='': return ''
+
+    sec1 = str2sec(start_str)
+    sec2 = str2sec(finish_str)
+    if sec1 is None or sec2 is None: return None
+
+    diff = sec2-sec1
+    m, s = divmod(diff,60)
+    h, m = divmod(m,60)
+    return '%02d:%02d:%02d'%(h,m,s)
+
+def formatTimes(df:pd.DataFrame):
+    """ Return copy of `df` with times converted to strings """
+
+    df = df.copy()
+    for col in ['Start','Finish','Time']:
+        df[col] = df[col].apply(lambda x: sec2str(x))
+    for col in [c for c in df.columns if c.endswith('Loss')]:
+        df[col] = df[col].apply(lambda x: sec2str(x,add_sign=True))
+    return df
+
+def rankOrder(df:pd.DataFrame):
+    """ Return positions of runners sorted by `Score` (desc) and `Time` (asc)
+
+    Same order as `df.sort_values(by=['Score','Time'],ascending=[False,True])`
+    (NaN last, stable) but without copying the dataframe.
+    """
+
+    score = pd.to_numeric(df['Score'],errors='coerce').to_numpy(dtype=float)
+    time = pd.to_numeric(df['Time'],errors='coerce').to_numpy(dtype=float)
+    return np.lexsort((time,-score))
+
+def getStandings(df:pd.DataFrame,leaders:dict=None,changed=None,categories:dict=CATEGORIES):
+    """ Compute overall and per-category rank and loss in one sorted pass
+
+    Runners are sorted once and rank within every category is obtained by
+    grouped cumulative count over this order. Leader of each category group is
+    cached in `leaders` (`{(category,group): (ID,time)}`) and it is refreshed
+    only for groups which contain some of `changed` IDs (or had such leader).
+    All groups are refreshed if `changed` is None.
+
+    Returns dataframe with columns `Rank`, `Loss`, `<category>Rank` and
+    `<category>Loss` aligned with `df.index` and updated `leaders`.
+    """
+
+    leaders = {} if leaders is None else dict(leaders)
+    changed = None if changed is None else set(changed)
+
+    order = rankOrder(df)
+    ids = df.index.to_numpy()[order]
+    time = pd.to_numeric(df['Time'],errors='coerce').to_numpy(dtype=float)[order]
+
+    groups = {'': pd.Series('All',index=df.index)}
+    for name,func in categories.items():
+        groups[name] = func(df)
+
+    standings = pd.DataFrame(index=df.index)
+    inv = np.empty_like(order)
+    inv[order] = np.arange(len(order))
+
+    for name,group in groups.items():
+
+        key = pd.Series(group.to_numpy()[order])
+        member = key.notna().to_numpy()
+
+        # Rank within group (everyone is ranked, unfinished are last)
+        rank = np.full(len(key),np.nan)
+        rank[member] = key[member].groupby(key[member],sort=False).cumcount().to_numpy()+1
+
+        # Leaders: first member of each group in sorted order
+        present = set(key[member])
+        for cached in [k for k in leaders if k[0]==name and k[1] not in present]:
+            del leaders[cached]
+        if changed is not None:
+            changedGroups = set(key[member & np.isin(ids,list(changed))])
+        first = np.flatnonzero(member & ~key.duplicated().to_numpy())
+        for i in first:
+            k = (name,key[i])
+            if (changed is None or k not in leaders
+                or k[1] in changedGroups or leaders[k][0] in changed
+            ):
+                leaders[k] = (ids[i],time[i])
+
+        leaderTime = key.map({k[1]:v[1] for k,v in leaders.items() if k[0]==name})
+        leaderTime = leaderTime.to_numpy(dtype=float)
+
+        # Store back in the original order
+        standings[f'{name}Rank'] = pd.array(rank[inv],dtype='Int64')
+        standings[f'{name}Loss'] = (time-leaderTime)[inv]
+
+    return standings, leaders
+
+def getLeader(leaders:dict,category:str='',group='All'):
+    """ Return (ID,time) of cached leader or (None,NaN) if group is empty """
+
+    return leaders.get((category,group),(None,np.nan))
+
+def prepareEventChunk(df:pd.DataFrame,cols:list,offset:int=0):
+    """ Convert chunk of event CSV into dataframe used by the GUI
+
+    Index is set to `ID` (numbered from `offset`+1 if missing), missing `cols`
+    are added and times, fee and registration are converted.
+    """
+
+    if 'ID' not in df.columns:
+        df['ID'] = np.arange(offset+1,offset+len(df)+1)
+    df = df.set_index('ID')
+
+    for col in cols:
+        if col != 'ID' and col not in df.columns: df[col] = np.nan
+
+    df['Start'] = parseTimes(df['Start'])
+    df['Finish'] = parseTimes(df['Finish'])
+    df['Fee'] = np.floor(pd.to_numeric(df['Fee'],errors='coerce'))
+    df['Registered'] = parseBool(df['Registered'])
+    if 'Punches' in df.columns:
+        # Hex strings (column of NaN if the event has no punches yet)
+        df['Punches'] = df['Punches'].astype(object)
+    return df
+
+def iterEventCSV(filename:str,cols:list,chunksize:int=CSV_CHUNK_SIZE):
+    """ Parse event CSV in chunks
+
+    Yields (chunk, bytes read, file size) where chunk is converted by
+    `prepareEventChunk()`. Raises `ValueError` if column `Name` is missing.
+    """
+
+    total = os.path.getsize(filename)
+    offset = 0
+    with open(filename,'rb') as fh:
+        reader = pd.read_csv(fh,
+            chunksize = chunksize,
+            dtype = EVENT_DTYPES,
+            usecols = lambda col: col not in DERIVED_COLS,
+            encoding = 'utf-8',
+        )
+        for chunk in reader:
+            if 'Name' not in chunk.columns:
+                raise ValueError("CSV file must contain at least following columns: Name")
+            yield prepareEventChunk(chunk,cols,offset), fh.tell(), total
+            offset += len(chunk)
+
+def loadEvent(filename:str,cols:list):
+    """ Return dataframe of event CSV with `Time`, ranks and losses """
+
+    chunks = [chunk for chunk,_,_ in iterEventCSV(filename,cols)]
+    df = pd.concat(chunks) if chunks else pd.DataFrame(columns=[c for c in cols if c != 'ID'])
+    df['Time'] = df['Finish'] - df['Start']
+    standings,_ = getStandings(df)
+    for col in standings.columns:
+        df[col] = standings[col]
+    return df
+
+class DisplayCache:
+    """ Formatted text of table cells kept for every runner and column
+
+    `update()` compares values of runners with the ones formatted last time
+    and formats only changed cells (all formatters are vectorized). Column in
+    which every cell changed (e.g. first update) is formatted at once without
+    gathering cached text. Views read text by `get()`.
+    """
+
+    def __init__(self,cols:list,lossCols:list):
+
+        self.cols = [c for c in cols if c != 'ID']
+        self.formatters = {}
+        for col in self.cols:
+            if col in ['Start','Finish','Time']:
+                self.formatters[col] = formatSeconds
+            elif col in lossCols:
+                self.formatters[col] = lambda v: formatSeconds(v,add_sign=True)
+            elif col.endswith('Rank') or col in ['Score','Fee']:
+                self.formatters[col] = formatInt
+            elif col == 'Registered':
+                self.formatters[col] = lambda v: formatText(pd.Series(v).fillna(False).astype(bool))
+            else:
+                self.formatters[col] = formatText
+
+        self.index = pd.Index([],name='ID')
+        self.values = pd.DataFrame(columns=self.cols)   # values formatted last time
+        self.text = {col: np.empty(0,dtype=object) for col in self.cols}
+
+    def format(self,df:pd.DataFrame):
+        """ Return `{column: text array}` of all cells of `df` (not cached) """
+
+        text = {col: self.formatters[col](df[col].to_numpy()) for col in self.cols}
+        text['ID'] = df.index.astype(str).to_numpy(dtype=object)
+        return text
+
+    def update(self,df:pd.DataFrame):
+        """ Format cells of `df` whose values changed since last update,
+        return index of runners with any changed cell """
+
+        pos = self.index.get_indexer(df.index)
+        known = pos >= 0
+        old = self.values.reindex(df.index)
+        anyChanged = ~known
+
+        for col in self.cols:
+            new = df[col]
+            # Compare as objects with None for any missing value (NaN, NA)
+            a = new.astype(object).where(new.notna(),None).to_numpy()
+            b = old[col].astype(object).where(old[col].notna(),None).to_numpy()
+            changed = (a != b) | ~known
+            anyChanged |= changed
+            if changed.all():
+                self.text[col] = self.formatters[col](new.to_numpy())
+            else:
+                # Runners which are not known have `changed` set
+                text = self.text[col][pos]
+                if changed.any():
+                    text[changed] = self.formatters[col](new.to_numpy()[changed])
+                self.text[col] = text
+
+        self.index = df.index.copy()
+        self.values = df[self.cols].copy()
+        return df.index[anyChanged]
+
+    def get(self,index):
+        """ Return `{column: text array}` of runners `index` (must be cached) """
+
+        pos = self.index.get_indexer(index)
+        text = {col: self.text[col][pos] for col in self.cols}
+        text['ID'] = pd.Index(index).astype(str).to_numpy(dtype=object)
+        return text
+
+class ControlTable:
+    """ Controls of score-O course with their points
+
+    Punches of a runner are stored as bitset (bit `i` = control `i` of the
+    table) written as hexadecimal number in column `Punches`. For computation
+    bitsets are unpacked into array of 64-bit words, points are summed by
+    lookup table of every byte value (weighted popcount) for all runners at
+    once.
+    """
+
+    def __init__(self,codes,points,timeLimit:float=SCORE_TIME_LIMIT,penalty:float=SCORE_PENALTY):
+
+        self.codes = [str(c).strip() for c in codes]
+        if len(set(self.codes)) != len(self.codes):
+            raise ValueError("Control codes must be unique")
+        self.bits = {code: i for i,code in enumerate(self.codes)}
+        self.points = np.asarray(points,dtype=float)
+        self.timeLimit = timeLimit
+        self.penalty = penalty
+        self.nWords = max(1,-(-len(self.codes)//64))
+
+        # Points of every value (256) of every byte of bitset
+        self.lut = np.zeros((self.nWords*8,256))
+        values = np.arange(256)
+        for bit,points in enumerate(self.points):
+            byte,b = divmod(bit,8)
+            self.lut[byte,(values>>b)&1 == 1] += points
+
+    @classmethod
+    def load(cls,filename:str,**kwargs):
+        """ Return control table from CSV with columns `Code` and `Points` """
+
+        df = pd.read_csv(filename,dtype={'Code':str},encoding='utf-8')
+        if not {'Code','Points'} <= set(df.columns):
+            raise ValueError("Controls CSV must contain columns: Code, Points")
+        return cls(df['Code'],df['Points'],**kwargs)
+
+    @property
+    def maxPoints(self):
+        return self.points.sum()
+
+    def unpack(self,punches):
+        """ Return array (runners, words) of bitsets given as hex strings """
+
+        words = np.zeros((len(punches),self.nWords),dtype=np.uint64)
+        for i,text in enumerate(punches):
+            if not isinstance(text,str) or text == '': continue
+            value = int(text,16)
+            for w in range(self.nWords):
+                words[i,w] = (value >> 64*w) & 0xFFFFFFFFFFFFFFFF
+        return words
+
+    def punch(self,punches,codes):
+        """ Add control `codes` to bitset `punches` (hex string or NaN)
+
+        Returns new hex string and list of codes which are not in the table.
+        """
+
+        value = int(punches,16) if isinstance(punches,str) and punches else 0
+        unknown = []
+        for code in codes:
+            code = str(code).strip()
+            if code in self.bits:   value |= 1 << self.bits[code]
+            else:                   unknown.append(code)
+        return f"{value:x}", unknown
+
+    def punchedCodes(self,punches):
+        """ Return codes of controls in bitset `punches` (hex string or NaN) """
+
+        value = int(punches,16) if isinstance(punches,str) and punches else 0
+        return [code for code,bit in self.bits.items() if value >> bit & 1]
+
+    def getPoints(self,words:np.ndarray):
+        """ Return sum of points of punched controls of every runner """
+
+        nBytes = self.nWords*8
+        bytes_ = np.ascontiguousarray(words.astype('<u8')).view(np.uint8).reshape(len(words),nBytes)
+        return self.lut[np.arange(nBytes),bytes_].sum(axis=1)
+
+    def getPenalties(self,times):
+        """ Return penalty for time over limit (0 if time is unknown) """
+
+        times = np.asarray(times,dtype=float)
+        over = np.maximum(np.nan_to_num(times-self.timeLimit,nan=0),0)
+        return self.penalty*np.ceil(over/60)
+
+    def getScores(self,punches,times):
+        """ Return scores (points minus penalty, at least 0) of runners with
+        bitsets `punches` (hex strings) and `times` in seconds """
+
+        points = self.getPoints(self.unpack(punches))
+        return np.maximum(points-self.getPenalties(times),0)
+
+class IDPrefixIndex:
+    """ IDs as sorted strings for lookup of IDs starting with typed digits """
+
+    def __init__(self,index:pd.Index):
+
+        # IDs this was built from, caller rebuilds the prefix index when the
+        # current index is not equal (`Index.equals()`) to this one
+        self.index = index
+        self.keys = sorted(str(ID) for ID in index)
+
+    def find(self,prefix:str,limit:int=10):
+        """ Return up to `limit` IDs starting with `prefix` (shortest first) """
+
+        lo = bisect.bisect_left(self.keys,prefix)
+        hi = bisect.bisect_left(self.keys,prefix+':')     # ':' follows '9'
+        matches = self.keys[lo:hi]
+        if len(matches) > limit:
+            # Shorter IDs are sorted after their longer extensions (e.g. '1',
+            # '10', '100', ...), pick the shortest ones
+            matches = sorted(matches,key=lambda k: (len(k),k))[:limit]
+        else:
+            matches = sorted(matches,key=lambda k: (len(k),k))
+        return [int(k) for k in matches]
+
+def getPunchState(start,finish):
+    """ Return what punch of runner does: 'START!', 'FINISH!' or 'PRINT!'
+
+    Works for scalars as well as for arrays of times.
+    """
+
+    start = np.asarray(start,dtype=float)
+    finish = np.asarray(finish,dtype=float)
+    state = np.where(np.isnan(start),'START!',np.where(np.isnan(finish),'FINISH!','PRINT!'))
+    return state if state.ndim else str(state)
+
+def writeAtomic(filename:str,data:bytes):
+    """ Write `data` into file atomically
+
+    Data are written into temporary file in the same directory, flushed to
+    disk and renamed over `filename`, so the file is never left truncated.
+    """
+
+    tmpname = f"{filename}.tmp"
+    with open(tmpname,'wb') as fh:
+        fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmpname,filename)
+
+    # Make the rename itself durable (not supported on Windows)
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(filename)),os.O_RDONLY)
+        try:        os.fsync(fd)
+        finally:    os.close(fd)
+    except OSError:
+        pass
+
+def writeCSVAtomic(filename:str,df:pd.DataFrame):
+    """ Write `df` (times in seconds) into CSV file atomically, return its digest """
+
+    data = formatTimes(df).to_csv().encode('utf-8')
+    writeAtomic(filename,data)
+    return hashlib.sha1(data).hexdigest()
+
+def cacheFilename(filename:str):
+    """ Return name of cache of parsed event CSV, e.g. 'event.epocache' """
+
+    return f"{os.path.splitext(filename)[0]}.epocache"
+
+def fileKey(filename:str,digest:str=None):
+    """ Return (size, mtime, SHA-1) identifying content of file """
+
+    if digest is None:
+        with open(filename,'rb') as fh:
+            digest = hashlib.sha1(fh.read()).hexdigest()
+    stat = os.stat(filename)
+    return (stat.st_size,stat.st_mtime_ns,digest)
+
+def saveCache(filename:str,df:pd.DataFrame,cols:list,digest:str=None):
+    """ Store parsed and derived dataframe of event CSV `filename` into cache
+
+    Cache is valid only for current content of the CSV file (see `fileKey()`).
+    It is `.npz` archive of plain arrays with JSON header (no pickle), so
+    cache of event from someone else cannot run any code when loaded.
+    Columns of numpy dtype are stored as they are, nullable integers and
+    flags (e.g. `Registered` with missing values) as values and mask, other
+    columns as text and mask.
+    """
+
+    arrays = {'index': df.index.to_numpy(dtype='int64')}
+    columns = []
+    for i,col in enumerate(df.columns):
+        series = df[col]
+        if isinstance(series.dtype,np.dtype) and series.dtype.kind in 'biuf':
+            kind = 'numpy'
+            arrays[f'c{i}'] = series.to_numpy()
+        else:
+            mask = series.isna().to_numpy()
+            if pd.api.types.is_integer_dtype(series.dtype):
+                kind = 'integer'
+                arrays[f'c{i}'] = series.to_numpy(dtype='int64',na_value=0)
+            elif pd.api.types.is_bool_dtype(series.dtype) or all(isinstance(v,(bool,np.bool_)) for v in series[~mask]):
+                kind = 'bool'
+                arrays[f'c{i}'] = np.array([False if m else bool(v) for v,m in zip(series,mask)],dtype=bool)
+            else:
+                kind = 'text'
+                arrays[f'c{i}'] = np.array(['' if m else str(v) for v,m in zip(series,mask)],dtype=str)
+            arrays[f'm{i}'] = mask
+        columns.append([col,kind,str(series.dtype)])
+
+    header = {
+        'version':  CACHE_VERSION,
+        'key':      list(fileKey(filename,digest)),
+        'cols':     list(cols),
+        'index':    df.index.name,
+        'columns':  columns,
+    }
+    arrays['header'] = np.array(json.dumps(header))
+    buffer = io.BytesIO()
+    np.savez(buffer,**arrays)
+    writeAtomic(cacheFilename(filename),buffer.getvalue())
+
+def loadCache(filename:str,cols:list):
+    """ Return cached dataframe of event CSV or None if cache is missing or stale """
+
+    try:
+        with np.load(cacheFilename(filename),allow_pickle=False) as cache:
+            header = json.loads(str(cache['header']))
+            if (header['version'] != CACHE_VERSION or header['cols'] != list(cols)
+                or header['key'] != list(fileKey(filename))):
+                return None
+            index = pd.Index(cache['index'],name=header['index'])
+            data = {}
+            for i,(col,kind,dtype) in enumerate(header['columns']):
+                values = cache[f'c{i}']
+                if kind == 'numpy':
+                    data[col] = pd.Series(values,index=index,dtype=dtype)
+                    continue
+                mask = cache[f'm{i}']
+                if kind in ['text','bool']:
+                    values = values.astype(object)
+                    values[mask] = np.nan
+                data[col] = pd.Series(values,index=index,dtype=dtype)
+                if kind == 'integer':
+                    data[col][mask] = pd.NA
+        return pd.DataFrame(data,index=index)
+    except Exception:
+        return None
+
+class SnapshotWriter:
+    """ Write snapshots of event dataframe into CSV in background thread
+
+    Only the newest snapshot of each file is written, bursts of `submit()`
+    calls collapse into one write. Snapshot must not be modified after it is
+    submitted. Cache of parsed event (see `saveCache()`) is refreshed after
+    every write. Errors are collected for the caller, see `takeErrors()`.
+    """
+
+    def __init__(self,cols:list):
+
+        self.cols = cols
+        self.pending = {}           # {filename: (dataframe, write CSV)}
+        self.writing = False
+        self.closed = False
+        self.errors = []            # messages not taken by `takeErrors()` yet
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.run,name='SnapshotWriter',daemon=True)
+        self.thread.start()
+
+    def submit(self,filename:str,df:pd.DataFrame,writeCSV:bool=True):
+        """ Queue snapshot for writing (`writeCSV=False` refreshes cache only) """
+
+        with self.cond:
+            if filename in self.pending:
+                writeCSV = writeCSV or self.pending[filename][1]
+            self.pending[filename] = (df,writeCSV)
+            self.cond.notify_all()
+
+    def run(self):
+
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if not self.pending: return
+                filename,(df,writeCSV) = self.pending.popitem()
+                self.writing = True
+
+            error = None
+            try:
+                digest = writeCSVAtomic(filename,df) if writeCSV else None
+            except Exception as e:
+                error = f"Saving of '{filename}' failed: {e}"
+            else:
+                try:
+                    saveCache(filename,df,self.cols,digest)
+                except Exception as e:
+                    error = f"Saving of cache of '{filename}' failed: {e}"
+
+            with self.cond:
+                if error is not None: self.errors.append(error)
+                self.writing = False
+                self.cond.notify_all()
+
+    def takeErrors(self):
+        """ Return errors of writes since last call """
+
+        with self.cond:
+            errors, self.errors = self.errors, []
+        return errors
+
+    def flush(self,timeout=None):
+        """ Wait until all submitted snapshots are written """
+
+        with self.cond:
+            return self.cond.wait_for(lambda: not self.pending and not self.writing,timeout)
+
+    def close(self):
+        """ Write pending snapshots and stop the thread """
+
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
@@ -0,0 +1,202 @@
+"""
+EPO_OB devices
+==============
+Punches read from input devices: barcode scanners and serial/RFID readers
+sending one ID per line (serial port, pty, named pipe or stdin as '-').
+
+Every device is read by its own thread, so a silent or slow device never
+blocks the GUI. Punch time is taken when the line is read. Readers repeat the
+same chip while it lies on them, so reads of the same ID within `window`
+seconds of its previous read are dropped (`DuplicateFilter`). Punches read in
+a burst are delivered to the GUI by one signal.
+
+Serial port (tty) is switched to raw mode at `baud` (POSIX only), so the
+reader does not get its lines echoed back and the line discipline does not
+alter them. Windows COM ports keep settings given by the system.
+
+by vovo
+
+https://github.com/vojtavozda/EPO_OB
+
+"""
+
+import os
+import re
+import sys
+import select
+import threading
+if os.name == 'posix':
+    import tty
+    import termios
+from time import monotonic
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+# Reads of the same ID within this interval are one punch [s]
+DUPLICATE_WINDOW = 3
+# ID is the first number on the line
+ID_PATTERN = r'(\d+)'
+# Interval of checking whether reading should stop (POSIX only) [s]
+POLL_INTERVAL = 0.2
+# Default speed of serial port
+BAUD_RATE = 9600
+
+class DuplicateFilter:
+    """ IDs read within last `window` seconds kept in hash sets of time buckets
+
+    Bucket `k` holds IDs read in `[k*window, (k+1)*window)` with time of their
+    last read, only the current and the previous bucket are kept, so lookup
+    and memory do not grow with the number of reads.
+    """
+
+    def __init__(self,window:float=DUPLICATE_WINDOW):
+
+        self.window = window
+        self.buckets = {}               # {bucket: {ID: time}}
+
+    def isDuplicate(self,ID:int,t:float):
+        """ Return True if `ID` was read within `window` before `t`, the read
+        is remembered either way (chip kept on reader stays suppressed) """
+
+        k = int(t//self.window)
+        if len(self.buckets) > 2 or k not in self.buckets:
+            self.buckets = {b: ids for b,ids in self.buckets.items() if b >= k-1}
+        duplicate = any(t-ids[ID] < self.window for ids in self.buckets.values() if ID in ids)
+        self.buckets.setdefault(k,{})[ID] = t
+        return duplicate
+
+def setRaw(fd:int,baud:int=BAUD_RATE):
+    """ Switch tty `fd` to raw mode (no echo, no line editing) at `baud` """
+
+    speed = getattr(termios,f'B{baud}',None)
+    if speed is None:
+        raise ValueError(f"Unsupported baud rate {baud}")
+    try:
+        tty.setraw(fd)
+        attrs = termios.tcgetattr(fd)
+        attrs[2] |= termios.CLOCAL | termios.CREAD      # no modem control, receive
+        attrs[4] = attrs[5] = speed                     # input and output speed
+        termios.tcsetattr(fd,termios.TCSANOW,attrs)
+        termios.tcflush(fd,termios.TCIFLUSH)
+    except termios.error as e:
+        raise OSError(*e.args)
+
+def parseID(line:bytes,pattern:str=ID_PATTERN):
+    """ Return ID from line sent by device or None """
+
+    match = re.search(pattern,line.decode('ascii',errors='replace'))
+    return int(match.group(1)) if match else None
+
+class DeviceInput(QObject):
+    """ Read punches from device `path` in background thread
+
+    Punches `[(ID, time)]` are collected in `self.punches` and `punched` is
+    emitted when the first of them arrives, receiver takes all of them by
+    `take()`. `clock()` returns time of punch (seconds of the day). Serial
+    port is read at `baud`.
+    """
+
+    punched = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self,path:str,clock,window:float=DUPLICATE_WINDOW,pattern:str=ID_PATTERN,
+            baud:int=BAUD_RATE):
+        super().__init__()
+
+        self.path = path
+        self.baud = baud
+        self.clock = clock
+        self.pattern = pattern
+        self.filter = DuplicateFilter(window)
+        self.reads = 0
+        self.duplicates = 0
+
+        self.punches = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run,name=f'Device {path}',daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        """ Stop reading (thread ends within `POLL_INTERVAL` on POSIX) """
+
+        self.stopped.set()
+
+    def take(self):
+        """ Return punches read since last call """
+
+        with self.lock:
+            punches, self.punches = self.punches, []
+        return punches
+
+    def open(self):
+
+        if self.path == '-':
+            return sys.stdin.fileno(),False
+        flags = os.O_RDONLY | getattr(os,'O_NOCTTY',0) | getattr(os,'O_BINARY',0)
+        fd = os.open(self.path,flags)
+        if os.name == 'posix' and os.isatty(fd):
+            try:
+                setRaw(fd,self.baud)
+            except BaseException:
+                os.close(fd)
+                raise
+        return fd,True
+
+    def read(self,fd:int):
+        """ Return available bytes, None if device should stop, b'' at end """
+
+        if os.name == 'posix':
+            while not self.stopped.is_set():
+                ready,_,_ = select.select([fd],[],[],POLL_INTERVAL)
+                if ready: return os.read(fd,4096)
+            return None
+        # Windows cannot select on files, read blocks until data come
+        return os.read(fd,4096)
+
+    def run(self):
+
+        try:
+            fd,close = self.open()
+        except (OSError,ValueError) as e:
+            self.failed.emit(f"Device '{self.path}' could not be opened: {e}")
+            return
+
+        buffer = b''
+        try:
+            while not self.stopped.is_set():
+                data = self.read(fd)
+                if not data:
+                    if data is not None:
+                        self.failed.emit(f"Device '{self.path}' closed")
+                    break
+                # Time of punch is time of reading, not of processing
+                now, t = self.clock(), monotonic()
+                buffer += data
+                *lines, buffer = re.split(rb'[\r\n]',buffer)
+                self.addLines(lines,now,t)
+        except OSError as e:
+            self.failed.emit(f"Reading of device '{self.path}' failed: {e}")
+        finally:
+            if close: os.close(fd)
+
+    def addLines(self,lines:list,now,t:float):
+
+        punches = []
+        for line in lines:
+            ID = parseID(line,self.pattern)
+            if ID is None: continue
+            self.reads += 1
+            if self.filter.isDuplicate(ID,t):
+                self.duplicates += 1
+                continue
+            punches.append((ID,now))
+        if not punches: return
+
+        with self.lock:
+            notify = not self.punches
+            self.punches += punches
+        # One signal per burst, receiver takes all punches at once
+        if notify: self.punched.emit()
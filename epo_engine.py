@@ -0,0 +1,302 @@
+"""
+EPO_OB engine
+=============
+Single writer of the event dataframe.
+
+GUI never modifies the dataframe itself. Every change is a command (function
+`func(df, *args) -> (df, changed IDs, result)`) queued into `RaceEngine`,
+which applies commands in its own thread. Commands queued meanwhile are applied
+as one batch, standings are recomputed once per batch and immutable snapshot of
+the dataframe is sent back to the GUI by signal `changed` together with results
+of the commands. Saving and publishing of the snapshot runs in the engine
+thread as well, so the GUI only redraws. Changed fields of runners are
+appended into journal of the station (see `epo_journal`) and streamed to
+standby stations (see `epo_replica`).
+
+Times of punches are taken by the GUI when the command is queued, so neither
+busy GUI nor busy engine shifts a recorded time.
+
+by vovo
+
+https://github.com/vojtavozda/EPO_OB
+
+"""
+
+import queue
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from epo_core import getStandings, getFees
+from epo_journal import diffRunners
+
+@dataclass(frozen=True)
+class Command:
+    """ Queued change of the dataframe """
+
+    seq: int                # order of command (see `RaceEngine.submitted`)
+    func: callable          # func(df, *args) -> (df, changed IDs or None for all, result)
+    args: tuple
+    callback: callable      # called by GUI with result of `func` (or None)
+
+@dataclass(frozen=True)
+class EngineSnapshot:
+    """ Dataframe after a batch of commands, must not be modified """
+
+    version: int
+    seq: int                # last applied command
+    df: pd.DataFrame
+    leaders: dict           # see `epo_core.getStandings()`
+
+# Commands ---------------------------------------------------------------------
+
+def getEmptyID(df:pd.DataFrame):
+    """ Return smallest ID which is missing in the dataframe """
+
+    return next(i for i, e in enumerate(sorted(df.index.to_list())+[None],1) if i!= e)
+
+def punch(df,ID:int,now:int,maxScore:int,controls=None,role:str='both'):
+    """ Start runner or finish started runner at `now`
+
+    Station with `role` 'start' only starts runners, 'finish' only finishes
+    them (start is in journal of start station, see `epo_journal`). Result is
+    'started', 'finished', 'already started', 'already finished' or 'missing'.
+    """
+
+    if ID not in df.index:
+        return df,[],'missing'
+
+    start = df.loc[ID,'Start']
+    if role != 'finish' and np.isnan(start):
+        df.loc[ID,'Start'] = now
+        return df,[ID],'started'
+
+    if role == 'start':
+        return df,[],'already started'
+
+    if not np.isnan(df.loc[ID,'Finish']):
+        return df,[],'already finished'
+
+    df.loc[ID,'Finish'] = now
+    if controls is None:
+        df.loc[ID,'Score'] = maxScore
+    else:
+        # Penalty for time cannot be counted without start
+        time = 0 if np.isnan(start) else now-start
+        df.loc[ID,'Score'] = controls.getScores([df.loc[ID,'Punches']],[time])[0]
+    return df,[ID],'finished'
+
+def setValues(df,IDs:list,values:dict):
+    """ Set `values` `{column: value}` of runners `IDs` (missing are skipped) """
+
+    IDs = [ID for ID in IDs if ID in df.index]
+    for col,value in values.items():
+        df.loc[IDs,col] = value
+    return df,IDs,IDs
+
+def addRunner(df,name:str,gender:str,note:str):
+    """ Add runner with the lowest free ID, result is the ID """
+
+    ID = getEmptyID(df)
+    newdf = pd.DataFrame({'Name':name,'Gender':gender,'Note':note},index=[ID])
+    newdf.index.name = 'ID'
+    return pd.concat([df,newdf]),[ID],ID
+
+def removeRunner(df,ID:int):
+
+    if ID not in df.index:
+        return df,[],None
+    return df.drop(ID),[ID],ID
+
+def registerRunners(df,IDs:list,rules:list):
+    """ Register runners with fees by `rules`, result is (IDs, fees) """
+
+    # Runners could be removed meanwhile
+    IDs = [ID for ID in IDs if ID in df.index]
+    if not IDs:
+        return df,[],(IDs,np.array([]))
+    fees = getFees(df.loc[IDs],rules)
+    df.loc[IDs,'Fee'] = fees
+    df.loc[IDs,'Registered'] = True
+    return df,IDs,(IDs,fees)
+
+def addPunches(df,ID:int,codes:list,controls):
+    """ Add control punches and update score, result is (punched codes,
+    unknown codes) or None if runner is missing """
+
+    if ID not in df.index:
+        return df,[],None
+    punches,unknown = controls.punch(df.loc[ID,'Punches'],codes)
+    df.loc[ID,'Punches'] = punches
+    df.loc[ID,'Score'] = controls.getScores([punches],[df.loc[ID,'Finish']-df.loc[ID,'Start']])[0]
+    return df,[ID],(controls.punchedCodes(punches),unknown)
+
+def recompute(df):
+    """ Recompute standings of all runners """
+
+    return df,None,None
+
+# Engine -----------------------------------------------------------------------
+
+class RaceEngine(QThread):
+    """ Apply queued commands to the dataframe in background thread
+
+    `publish(df, csvFile, sortBy)` (e.g. saving and upload) is called from the
+    engine thread with every new snapshot, `sortBy` is order of runners in
+    saved CSV set by the GUI. Changes are recorded into `journal`
+    (`epo_journal.Journal`, closed when the engine stops) and sent to
+    `replica` (`epo_replica.ReplicaServer`) if given. Failures of journal and
+    publishing are collected for the GUI, see `takeErrors()`.
+    """
+
+    # Snapshot (None if no runner changed), [(callback, result)], last applied command
+    changed = pyqtSignal(object,list,int)
+
+    def __init__(self,df:pd.DataFrame,csvFile:str,publish=None,journal=None,replica=None,
+            sortBy:str='Rank'):
+        super().__init__()
+
+        self.df = df
+        self.csvFile = csvFile
+        self.publish = publish
+        self.sortBy = sortBy
+        self.journal = journal
+        self.replica = replica
+        self.leaders = {}
+        self.version = 0
+        self.queue = queue.Queue()
+        self.submitted = 0
+        self.applied = 0
+        self.stopped = False
+        self.errors = []                # failures not taken by `takeErrors()` yet
+        self.failing = {}               # {source: last failure} of failing sources
+        self.errorLock = threading.Lock()
+
+        # Standings of loaded dataframe are computed before thread starts
+        self.updateStandings(None)
+        # Dataframe of the last snapshot (journal records differences to it)
+        self.last = self.df.copy()
+        # Standbys start over with the loaded dataframe
+        if replica is not None:
+            replica.publish(self.last,self.version,None)
+
+    def snapshot(self):
+        """ Return immutable copy of current state """
+
+        return EngineSnapshot(self.version,self.applied,self.df.copy(),dict(self.leaders))
+
+    def submit(self,func,*args,callback=None):
+        """ Queue command `func(df, *args)`, return its sequence number """
+
+        if self.stopped: return None
+        self.submitted += 1
+        self.queue.put(Command(self.submitted,func,args,callback))
+        return self.submitted
+
+    def stop(self,wait:bool=True):
+        """ Stop thread after queued commands are applied (if `wait`) """
+
+        if self.stopped: return
+        self.stopped = True
+        self.queue.put(None)
+        if wait: self.wait()
+
+    def takeErrors(self):
+        """ Return failures of journal and publishing since last call """
+
+        with self.errorLock:
+            errors, self.errors = self.errors, []
+        return errors
+
+    def setError(self,source:str,error:str=None):
+        """ Report failure of `source` (None if it succeeded), failure
+        repeating in following batches is reported once """
+
+        with self.errorLock:
+            if error is not None and self.failing.get(source) != error:
+                self.errors.append(error)
+            self.failing[source] = error
+
+    def setReplica(self,replica):
+        """ Stream changes to `replica` (None to stop) from the next batch """
+
+        self.replica = replica
+        # Replica gets current state with the next snapshot
+        if replica is not None: self.submit(recompute)
+
+    def updateStandings(self,IDs):
+        """ Update `Time` and overall and category `Rank` and `Loss` of
+        categories of runners `IDs` (all if None) """
+
+        self.df['Time'] = self.df['Finish'] - self.df['Start']
+        if self.df.empty:
+            self.leaders = {}
+            return
+        standings,self.leaders = getStandings(self.df,self.leaders,IDs)
+        for col in standings.columns:
+            self.df[col] = standings[col]
+
+    def run(self):
+
+        stop = False
+        while not stop:
+            commands = [self.queue.get()]
+            # Everything queued meanwhile is applied as one batch
+            while True:
+                try:
+                    commands.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            changed = set()
+            recomputeAll = False
+            results = []
+            for command in commands:
+                if command is None:
+                    stop = True
+                    continue
+                try:
+                    self.df,IDs,result = command.func(self.df,*command.args)
+                except Exception as e:
+                    # Reported by the GUI as result of the command
+                    IDs,result = [],e
+                if IDs is None:
+                    recomputeAll = True
+                else:
+                    changed.update(IDs)
+                results.append((command.callback,result))
+                self.applied = command.seq
+
+            snapshot = None
+            if recomputeAll or changed:
+                replica = self.replica
+                changes = []
+                if changed and (self.journal is not None or replica is not None):
+                    changes = list(diffRunners(self.last,self.df,changed))
+                if self.journal is not None and changes:
+                    try:
+                        self.journal.record(changes)
+                        self.setError('journal')
+                    except Exception as e:
+                        self.setError('journal',f"Journal '{self.journal.filename}' could not be written: {e}")
+                self.updateStandings(None if recomputeAll else changed)
+                self.version += 1
+                snapshot = self.snapshot()
+                self.last = snapshot.df
+                if self.publish is not None:
+                    try:
+                        self.publish(snapshot.df,self.csvFile,self.sortBy)
+                        self.setError('publish')
+                    except Exception as e:
+                        self.setError('publish',f"Publishing of results failed: {e}")
+                if replica is not None:
+                    replica.publish(snapshot.df,snapshot.version,changes)
+
+            if results:
+                self.changed.emit(snapshot,results,self.applied)
+
+        if self.journal is not None:
+            self.journal.close()
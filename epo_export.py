@@ -0,0 +1,222 @@
+"""
+EPO_OB export
+=============
+Export of results into standard formats:
+
+- IOF XML 3.0 `ResultList` (https://orienteering.sport/iof/it/data-standard-3-0/)
+- JSON (`{"format": "epo-results", "version": 1, "event": {...}, "results": [...]}`)
+
+Both are written by generators which walk the ranked runners once, reading
+column arrays of the dataframe directly, so memory needed by export does not
+grow with the number of runners (no formatted copy of results is built).
+
+Usage:
+    python epo_export.py EPO_221004.csv -o EPO_221004.xml
+
+by vovo
+
+https://github.com/vojtavozda/EPO_OB
+
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import datetime
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+
+from epo_core import sec2str, rankOrder, loadEvent, CATEGORIES
+
+# Columns of event dataframe (see `epo_ob.EPOGUI.cols`)
+COLS = ['ID','Name','Gender','Start','Finish','Score','Note','Registered','Fee']
+# Columns read by export
+EXPORT_COLS = ['Rank','Name','Gender','Start','Finish','Time','Loss','Score','Note'] + \
+    [f'{c}{x}' for c in CATEGORIES for x in ('Rank','Loss')]
+
+IOF_NAMESPACE = 'http://www.orienteering.org/datastandard/3.0'
+# IOF sex of values in `Gender` column
+IOF_SEX = {'M':'M','W':'F'}
+
+def toNumber(value):
+    """ Return int/float for JSON and XML (None if missing) """
+
+    try:
+        value = float(value)
+    except (TypeError,ValueError):
+        return None
+    if np.isnan(value): return None
+    return int(value) if value.is_integer() else value
+
+def toText(value):
+    """ Return string value (None if missing) """
+
+    if value is None or (isinstance(value,float) and np.isnan(value)): return None
+    return str(value)
+
+def getStatus(start,finish):
+    """ Return IOF result status of runner """
+
+    if toNumber(start) is None: return 'Inactive'
+    if toNumber(finish) is None: return 'Active'
+    return 'OK'
+
+def eventDate(filename:str):
+    """ Return date of event from filename ('EPO_YYMMDD.csv') or today """
+
+    match = re.search(r'(\d{2})(\d{2})(\d{2})',os.path.basename(filename))
+    if match:
+        try:
+            yy,mm,dd = (int(x) for x in match.groups())
+            return datetime.date(2000+yy,mm,dd)
+        except ValueError:
+            pass
+    return datetime.date.today()
+
+def iterRunners(df):
+    """ Yield (ID, row dict) of runners in rank order
+
+    Only one row dict exists at a time, columns are read from arrays of `df`.
+    """
+
+    ids = df.index.to_numpy()
+    arrays = {col: df[col].to_numpy() for col in EXPORT_COLS if col in df.columns}
+    for i in rankOrder(df):
+        yield ids[i], {col: values[i] for col,values in arrays.items()}
+
+def iterIOFXML(df,event:str='EPO',date:datetime.date=None,status:str='Snapshot'):
+    """ Yield IOF XML 3.0 `ResultList` with one class (overall results) """
+
+    date = date or datetime.date.today()
+    midnight = datetime.datetime.combine(date,datetime.time())
+    created = datetime.datetime.now().astimezone().isoformat(timespec='seconds')
+
+    def dateTime(seconds):
+        return (midnight+datetime.timedelta(seconds=seconds)).isoformat()
+
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield (f'<ResultList xmlns="{IOF_NAMESPACE}" iofVersion="3.0" '
+        f'createTime="{created}" creator="EPO_OB" status="{status}">\n')
+    yield (f'  <Event>\n    <Name>{escape(event)}</Name>\n'
+        f'    <StartTime>\n      <Date>{date.isoformat()}</Date>\n    </StartTime>\n  </Event>\n')
+    yield '  <ClassResult>\n    <Class>\n      <Name>Overall</Name>\n    </Class>\n'
+
+    for ID,row in iterRunners(df):
+        name = toText(row['Name']) or ''
+        given,_,family = name.strip().rpartition(' ')
+        sex = IOF_SEX.get(toText(row['Gender']))
+        start = toNumber(row['Start'])
+        finish = toNumber(row['Finish'])
+        time = toNumber(row['Time'])
+        loss = toNumber(row['Loss'])
+        rank = toNumber(row['Rank'])
+        score = toNumber(row['Score'])
+
+        lines = ['    <PersonResult>',
+            f'      <Person{f" sex={quoteattr(sex)}" if sex else ""}>',
+            f'        <Id>{ID}</Id>',
+            f'        <Name>',
+            f'          <Family>{escape(family)}</Family>']
+        if given: lines.append(f'          <Given>{escape(given)}</Given>')
+        lines += ['        </Name>','      </Person>','      <Result>']
+        if start is not None:   lines.append(f'        <StartTime>{dateTime(start)}</StartTime>')
+        if finish is not None:  lines.append(f'        <FinishTime>{dateTime(finish)}</FinishTime>')
+        if time is not None:    lines.append(f'        <Time>{time}</Time>')
+        status = getStatus(start,finish)
+        if status == 'OK':
+            if loss is not None:    lines.append(f'        <TimeBehind>{loss}</TimeBehind>')
+            if rank is not None:    lines.append(f'        <Position>{rank}</Position>')
+        lines.append(f'        <Status>{status}</Status>')
+        if score is not None:   lines.append(f'        <Score>{score}</Score>')
+        lines += ['      </Result>','    </PersonResult>']
+        yield '\n'.join(lines)+'\n'
+
+    yield '  </ClassResult>\n</ResultList>\n'
+
+def iterJSON(df,event:str='EPO',date:datetime.date=None):
+    """ Yield JSON document with one object per runner in rank order """
+
+    date = date or datetime.date.today()
+    header = {
+        'format':   'epo-results',
+        'version':  1,
+        'event':    {'name': event, 'date': date.isoformat()},
+        'created':  datetime.datetime.now().astimezone().isoformat(timespec='seconds'),
+    }
+    # Header without closing brace, results are appended one by one
+    yield json.dumps(header,ensure_ascii=False)[:-1]+',"results":['
+
+    sep = '\n'
+    for ID,row in iterRunners(df):
+        categories = {}
+        for cat in CATEGORIES:
+            rank = toNumber(row.get(f'{cat}Rank'))
+            if rank is not None:
+                categories[cat] = {'rank': rank, 'loss': toNumber(row.get(f'{cat}Loss'))}
+        runner = {
+            'id':       toNumber(ID),
+            'rank':     toNumber(row['Rank']),
+            'name':     toText(row['Name']),
+            'gender':   toText(row['Gender']),
+            'note':     toText(row['Note']),
+            'status':   getStatus(row['Start'],row['Finish']),
+            'start':    toText(sec2str(row['Start'])),
+            'finish':   toText(sec2str(row['Finish'])),
+            'time':     toNumber(row['Time']),
+            'loss':     toNumber(row['Loss']),
+            'score':    toNumber(row['Score']),
+            'categories':   categories,
+        }
+        yield sep+json.dumps(runner,ensure_ascii=False)
+        sep = ',\n'
+
+    yield '\n]}\n'
+
+# Generators of export formats by file extension
+FORMATS = {
+    '.xml':     iterIOFXML,
+    '.json':    iterJSON,
+}
+
+def exportResults(df,filename:str,event:str=None,date:datetime.date=None):
+    """ Write results into `filename`, format is given by its extension
+    (see `FORMATS`), raise `ValueError` for unknown extension """
+
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError(f"Unknown export format '{ext}' (use {', '.join(FORMATS)})")
+
+    chunks = FORMATS[ext](df,event=event or 'EPO',date=date)
+    tmpname = f"{filename}.tmp"
+    with open(tmpname,'w',encoding='utf-8') as fh:
+        for chunk in chunks:
+            fh.write(chunk)
+    os.replace(tmpname,filename)
+    return filename
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Export results of EPO event into IOF XML 3.0 or JSON")
+    parser.add_argument('file',help="event CSV file")
+    parser.add_argument('-o','--out',help="output file, '.xml' or '.json' (default: <file>.xml)")
+    parser.add_argument('--event',help="name of event (default: name of file)")
+    parser.add_argument('--date',type=datetime.date.fromisoformat,help="date of event YYYY-MM-DD (default: from name of file)")
+    args = parser.parse_args(argv)
+
+    base = os.path.splitext(args.file)[0]
+    out = args.out or f"{base}.xml"
+    try:
+        exportResults(loadEvent(args.file,COLS),out,
+            event = args.event or os.path.basename(base),
+            date = args.date or eventDate(args.file))
+    except (OSError,ValueError) as e:
+        print(f"Export failed: {e}",file=sys.stderr)
+        return 1
+    print(f"Results exported into '{out}'")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
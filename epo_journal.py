@@ -0,0 +1,326 @@
+"""
+EPO_OB journals
+===============
+Journal of changes made at one station and merge of journals of stations
+which worked offline on their own copies of the event CSV (e.g. start and
+finish laptop).
+
+Engine (see `epo_engine.RaceEngine`) appends one JSON line per changed field
+of runner into '<event>_<station>.journal':
+
+    {"t": [1665070000123, 0], "node": "finish", "id": 42, "field": "Finish", "value": 45010}
+
+`t` is hybrid logical clock (wall time [ms], counter), so entries of one
+station are strictly ordered even if its system clock goes back, and entries
+of all stations are totally ordered by (wall time, counter, station). Merge
+keeps the latest value of every (runner, field) (last writer wins) in one pass
+over the journals and reports fields where other station's latest value was
+overwritten. Result does not depend on order of journals.
+
+Usage:
+    python epo_journal.py EPO_221004.csv EPO_221004_start.journal EPO_221004_finish.journal -o merged.csv
+
+by vovo
+
+https://github.com/vojtavozda/EPO_OB
+
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import socket
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from epo_core import loadEvent, writeCSVAtomic, sec2str, getStandings
+
+# Fields of runner recorded in journals (others are computed)
+JOURNAL_FIELDS = ['Name','Gender','Note','Start','Finish','Score','Registered','Fee','Punches']
+# Pseudo field of removed (True) or (re)added (False) runner
+REMOVED = 'Removed'
+# Columns of event dataframe (see `epo_ob.EPOGUI.cols`)
+COLS = ['ID','Rank','Name','Gender','Start','Finish','Time','Loss','GenderRank','GenderLoss',
+    'EPORank','EPOLoss','Score','Note','Registered','Fee','Punches']
+
+def stationName():
+    """ Return name of this station (`EPO_STATION` environment variable or
+    host name) """
+
+    name = os.environ.get('EPO_STATION') or socket.gethostname()
+    return re.sub(r'[^0-9A-Za-z-]+','_',name) or 'station'
+
+def journalFilename(csvFile:str,station:str):
+    """ Return journal of `station` next to event CSV """
+
+    return f"{os.path.splitext(csvFile)[0]}_{station}.journal"
+
+class HybridClock:
+    """ Hybrid logical clock, timestamps are (wall time [ms], counter, node) """
+
+    def __init__(self,node:str,wall:int=0,counter:int=0):
+
+        self.node = node
+        self.wall = wall
+        self.counter = counter
+
+    def physical(self):
+        return int(time.time()*1000)
+
+    def now(self):
+        """ Return timestamp of local event """
+
+        pt = self.physical()
+        if pt > self.wall:
+            self.wall,self.counter = pt,0
+        else:
+            self.counter += 1
+        return (self.wall,self.counter,self.node)
+
+    def update(self,remote:tuple):
+        """ Return timestamp of receiving event stamped by `remote` """
+
+        pt = self.physical()
+        wall = max(self.wall,remote[0],pt)
+        if wall == self.wall == remote[0]:
+            counter = max(self.counter,remote[1])+1
+        elif wall == self.wall:
+            counter = self.counter+1
+        elif wall == remote[0]:
+            counter = remote[1]+1
+        else:
+            counter = 0
+        self.wall,self.counter = wall,counter
+        return (self.wall,self.counter,self.node)
+
+def toValue(value):
+    """ Return JSON value of dataframe cell (None if missing) """
+
+    if isinstance(value,np.generic): value = value.item()
+    if value is None or (not isinstance(value,str) and pd.isna(value)): return None
+    return value
+
+def diffRunners(before:pd.DataFrame,after:pd.DataFrame,IDs):
+    """ Yield (ID, field, value) of fields of runners `IDs` which differ """
+
+    for ID in sorted(IDs):
+        old = before.loc[ID,JOURNAL_FIELDS] if ID in before.index else None
+        if ID not in after.index:
+            if old is not None: yield ID,REMOVED,True
+            continue
+        new = after.loc[ID,JOURNAL_FIELDS]
+        if old is None: yield ID,REMOVED,False
+        for field in JOURNAL_FIELDS:
+            value = toValue(new[field])
+            if old is None:
+                if value is not None: yield ID,field,value
+            elif value != toValue(old[field]):
+                yield ID,field,value
+
+class Journal:
+    """ Append-only journal of one station (written from engine thread) """
+
+    def __init__(self,filename:str,station:str):
+
+        self.filename = filename
+        self.station = station
+        self.clock = HybridClock(station)
+
+        # Clock continues after the last entry of reopened journal
+        last = None
+        if os.path.isfile(filename):
+            for entry in readJournal(filename):
+                last = entry
+        if last is not None:
+            self.clock.wall,self.clock.counter = last['t']
+        self.fh = open(filename,'a',encoding='utf-8')
+
+    def record(self,changes:list):
+        """ Append changes `[(ID, field, value)]` (see `diffRunners()`) """
+
+        lines = []
+        for ID,field,value in changes:
+            wall,counter,_ = self.clock.now()
+            lines.append(json.dumps({'t':[wall,counter],'node':self.station,'id':int(ID),
+                'field':field,'value':value},ensure_ascii=False))
+        if lines:
+            self.fh.write('\n'.join(lines)+'\n')
+            self.fh.flush()
+        return len(lines)
+
+    def close(self):
+        self.fh.close()
+
+def readJournal(filename:str):
+    """ Yield entries of journal, damaged lines (e.g. the last line written
+    during crash) are skipped """
+
+    with open(filename,encoding='utf-8') as fh:
+        for line in fh:
+            try:
+                entry = json.loads(line)
+                entry['t'] = tuple(entry['t'])
+            except (ValueError,KeyError,TypeError):
+                continue
+            yield entry
+
+def stamp(entry:dict):
+    return (*entry['t'],entry['node'])
+
+def mergeJournals(filenames:list):
+    """ Merge journals, return (winners `{(ID, field): entry}`, conflicts)
+
+    Conflict is a field whose latest value written by some station was
+    overwritten by different value of other station. Conflicts are dataframe
+    sorted by ID and field.
+    """
+
+    # Latest entry of every station `{(ID, field): {node: entry}}`
+    latest = {}
+    for filename in filenames:
+        for entry in readJournal(filename):
+            nodes = latest.setdefault((entry['id'],entry['field']),{})
+            current = nodes.get(entry['node'])
+            if current is None or stamp(entry) > stamp(current):
+                nodes[entry['node']] = entry
+
+    winners = {}
+    conflicts = []
+    for key,nodes in latest.items():
+        winner = max(nodes.values(),key=stamp)
+        winners[key] = winner
+        for entry in nodes.values():
+            if entry is not winner and entry['value'] != winner['value']:
+                conflicts.append({
+                    'ID':           key[0],
+                    'Field':        key[1],
+                    'Value':        winner['value'],
+                    'Station':      winner['node'],
+                    'Written':      formatStamp(winner),
+                    'LostValue':    entry['value'],
+                    'LostStation':  entry['node'],
+                    'LostWritten':  formatStamp(entry),
+                })
+
+    conflicts = pd.DataFrame(conflicts,columns=['ID','Field','Value','Station','Written',
+        'LostValue','LostStation','LostWritten'])
+    conflicts = conflicts.sort_values(by=['ID','Field','LostStation'],kind='stable').reset_index(drop=True)
+    return winners,conflicts
+
+def formatStamp(entry:dict):
+    """ Return wall time of entry as 'HH:MM:SS.mmm' (local time) """
+
+    wall = entry['t'][0]
+    return time.strftime('%H:%M:%S',time.localtime(wall/1000))+f".{wall%1000:03d}"
+
+def addEmpty(df:pd.DataFrame,IDs:list):
+    """ Return dataframe with empty rows of runners `IDs` appended """
+
+    if not IDs: return df
+    return pd.concat([df,pd.DataFrame(index=pd.Index(IDs,name='ID'))])
+
+def setFields(df:pd.DataFrame,updates:dict):
+    """ Set values `{field: {ID: value}}` (None is missing value) of runners
+    in the dataframe, column which cannot hold the values becomes object """
+
+    for field,values in updates.items():
+        if field not in df.columns: continue
+        IDs = [ID for ID in values if ID in df.index]
+        if not IDs: continue
+        values = [np.nan if values[ID] is None else values[ID] for ID in IDs]
+        dtype = df[field].dtype
+        if pd.api.types.is_bool_dtype(dtype):
+            fits = all(isinstance(v,bool) for v in values)
+        elif pd.api.types.is_numeric_dtype(dtype):
+            fits = all(isinstance(v,(int,float)) for v in values)
+        else:
+            fits = True
+        if not fits:
+            df[field] = df[field].astype(object)
+        df.loc[IDs,field] = values
+    return df
+
+def applyChanges(df:pd.DataFrame,changes:list):
+    """ Apply changes `[(ID, field, value)]` (see `diffRunners()`) in place,
+    return (dataframe, changed IDs) """
+
+    updates = {}                # {field: {ID: value}}
+    removed = {}                # {ID: removed}
+    for ID,field,value in changes:
+        if field == REMOVED:
+            # Removed (or added) runner starts over
+            removed[ID] = value
+            for values in updates.values():
+                values.pop(ID,None)
+        else:
+            updates.setdefault(field,{})[ID] = value
+
+    df = df.drop(index=[ID for ID in removed if ID in df.index])
+    df = addEmpty(df,[ID for ID,r in removed.items() if not r])
+    df = setFields(df,updates)
+    IDs = set(removed)
+    for values in updates.values():
+        IDs.update(values)
+    return df,IDs
+
+def applyMerge(df:pd.DataFrame,winners:dict):
+    """ Return copy of event dataframe with merged values, standings are
+    recomputed """
+
+    updates = {}                # {field: {ID: value}}
+    for (ID,field),entry in winners.items():
+        updates.setdefault(field,{})[ID] = entry['value']
+
+    removed = updates.pop(REMOVED,{})
+    df = addEmpty(df.copy(),[ID for ID,r in removed.items() if not r and ID not in df.index])
+    df = setFields(df,updates)
+    df = df.drop(index=[ID for ID,r in removed.items() if r and ID in df.index])
+
+    for col in ['Start','Finish','Score','Fee']:
+        df[col] = pd.to_numeric(df[col],errors='coerce')
+    df['Time'] = df['Finish'] - df['Start']
+    if not df.empty:
+        standings,_ = getStandings(df)
+        for col in standings.columns:
+            df[col] = standings[col]
+    return df.sort_index()
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Merge journals of EPO stations into event CSV")
+    parser.add_argument('base',help="event CSV the stations started from")
+    parser.add_argument('journals',nargs='+',help="journals of stations ('<event>_<station>.journal')")
+    parser.add_argument('-o','--out',help="merged event CSV (default: <base>_merged.csv)")
+    parser.add_argument('-r','--report',help="CSV with conflicts (default: <base>_conflicts.csv)")
+    args = parser.parse_args(argv)
+
+    base = os.path.splitext(args.base)[0]
+    out = args.out or f"{base}_merged.csv"
+    report = args.report or f"{base}_conflicts.csv"
+
+    try:
+        df = loadEvent(args.base,COLS)
+        winners,conflicts = mergeJournals(args.journals)
+        df = applyMerge(df,winners)
+        writeCSVAtomic(out,df[[c for c in COLS if c != 'ID']])
+        conflicts.to_csv(report,index=False)
+    except (OSError,ValueError) as e:
+        print(f"Merge failed: {e}",file=sys.stderr)
+        return 1
+
+    print(f"{len(winners)} fields of {len(df)} runners merged into '{out}'")
+    if len(conflicts):
+        print(f"{len(conflicts)} conflicts written into '{report}':")
+        for c in conflicts.head(20).itertuples():
+            value,lost = c.Value,c.LostValue
+            if c.Field in ('Start','Finish'):
+                value,lost = (sec2str(np.nan if v is None else v) for v in (value,lost))
+            print(f"  {c.ID} {c.Field}: {value} ({c.Station}) over {lost} ({c.LostStation})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
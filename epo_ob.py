@@ -24,75 +24,60 @@ from datetime import datetime
 from timeit import default_timer as timer 
 import unidecode
 import qtawesome as qta         # run `qta-browser`
-import ftplib
-import ftp_credentials
+import itertools
+import multiprocessing
 
 from PyQt5 import QtWidgets
 from PyQt5 import QtGui
-from PyQt5.QtGui import (QColor, QBrush, QFont, QTextCursor, QRegExpValidator, QKeySequence)
-from PyQt5.QtCore import (QPoint, Qt, QTimer, QRegExp)
-from PyQt5.QtWidgets import (QAction, QDialogButtonBox, QInputDialog, QDialog, QFileDialog, QStyle, QComboBox, QApplication, QHBoxLayout, QLabel, QLineEdit, QMainWindow, QMenu, QMessageBox, QPushButton, QScrollArea, QStyleFactory, QTableWidget, QTableWidgetItem, QTextEdit, QVBoxLayout, QWidget)
+from PyQt5.QtGui import (QColor, QBrush, QFont, QPainter, QTextCursor, QRegExpValidator, QKeySequence, QStandardItem, QStandardItemModel)
+from PyQt5.QtCore import (QPoint, QRectF, Qt, QTimer, QRegExp, QThread, pyqtSignal)
+from PyQt5.QtWidgets import (QAction, QActionGroup, QCompleter, QDialogButtonBox, QInputDialog, QDialog, QFileDialog, QStyle, QComboBox, QApplication, QHBoxLayout, QLabel, QLineEdit, QListWidget, QMainWindow, QMenu, QMessageBox, QProgressBar, QPushButton, QScrollArea, QStyleFactory, QTableWidget, QTableWidgetItem, QTextEdit, QVBoxLayout, QWidget)
 
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
 from matplotlib.figure import Figure
 
-def str2sec(time_str:str):
-    
-    """ Convert string '+-HH:MM:SS' to seconds """
-
-    if time_str == '': return np.nan
-
-    try:
-        time_str = time_str.replace('+','')
-        sign = 1 if '-' not in time_str else -1
-        time_str = time_str.replace('-','')
-        h,m,s = time_str.split(':')
-        # print(f'str2sec({time_str})',sign,h,m,s)
-        return sign*(int(h)*3600 + int(m)*60 + int(s))
-    except:
-        return np.nan
-
-def sec2str(seconds:int,add_sign=False):
-
-    """ Convert seconds to string 'HH:MM:SS' """
-
-    if np.isnan(seconds): return np.nan
-    
-    if seconds >= 0:
-        if add_sign:
-            sign = '+'
-        else:
-            sign = ''
-    else:
-        sign = '-'
-    seconds = abs(seconds)
-
-    m, s = divmod(seconds,60)
-    h, m = divmod(m,60)
-    return sign + '%02d:%02d:%02d'%(h,m,s)
-
-def isNumber(num:str):
-
-    try:
-        float(num)
-        if np.isnan(float(num)):
-            return False
-        return True
-    except:
-        return False
-
-def diff_times(start_str:str,finish_str:str):
-    
-    if start_str=='' or finish_str=='': return ''
+from epo_core import (str2sec, sec2str, isNumber, diff_times, getLeader, rankOrder, iterEventCSV, loadCache, SnapshotWriter, IDPrefixIndex, DisplayCache, getPunchState, getFees, formatSeconds, formatInt, formatText, loadFeeRules, ControlTable, CATEGORIES, FEE_RULES)
+from epo_reports import (ResultsSnapshot, ReportPipeline, plotOccupancy)
+from epo_server import ResultsServer, getLocalIP
+from epo_export import exportResults, eventDate
+from epo_shm import StandingsWriter
+from epo_receipts import Receipt, ReceiptSpool
+from epo_devices import DeviceInput, BAUD_RATE
+from epo_journal import Journal, journalFilename, stationName
+from epo_replica import ReplicaServer, ReplicaClient, applySnapshot, applyBatch, REPLICA_PORT
+import epo_engine
+from epo_engine import RaceEngine
+
+# Minimal delay between redraws of the table while changes keep coming [ms]
+REDRAW_INTERVAL = 100
+
+# Leaderboard for projector: rows per page, page switching [ms], animation of
+# moved rows and flash of changed rows [ms], frame interval [ms] and number of
+# recent finishers
+LEADERBOARD_ROWS = 20
+LEADERBOARD_PAGE_INTERVAL = 10000
+LEADERBOARD_SLIDE = 600
+LEADERBOARD_FLASH = 2000
+LEADERBOARD_FRAME = 33
+LEADERBOARD_RECENT = 8
+
+def nowSec():
+    """ Return current time as seconds since midnight """
+
+    now = datetime.now()
+    return now.hour*3600+now.minute*60+now.second
+
+def sortDF(df:pd.DataFrame,sortBy:str):
+    """ Return `df` sorted by 'ID', 'Name' or 'Rank' (as the table) """
+
+    if sortBy == 'ID':
+        df = df.sort_index()
+    elif sortBy == 'Name':
+        df = df.sort_values(by='Name')
+    elif sortBy == 'Rank':
+        df = df.sort_values(by=['Score','Time'],ascending=[False,True])
 
-    sec1 = str2sec(start_str)
-    sec2 = str2sec(finish_str)
-    if sec1 is None or sec2 is None: return None
-    
-    diff = sec2-sec1
-    m, s = divmod(diff,60)
-    h, m = divmod(m,60)
-    return '%02d:%02d:%02d'%(h,m,s)
+    return df
 
 def standardIcon(icon):
     return QWidget().style().standardIcon(getattr(QStyle,icon))
@@ -127,10 +112,12 @@ class ActionDialog(QAction):
 
 class RegisterDialog(QDialog):
 
-    def __init__(self,ID:int,runner:pd.DataFrame):
+    def __init__(self,ID:int,runner:pd.DataFrame,fee:float):
         super().__init__()
 
         self.runner = runner
+        # Empty field (no fee rule matched) keeps no fee
+        self.fee = 0
 
         lblID = QLabel(f"ID: <b>{ID}</b>")
         lblName = QLabel(f"Name: <b>{runner['Name']}</b>")
@@ -141,9 +128,7 @@ class RegisterDialog(QDialog):
         qleFee.setMaximumWidth(50)
         qleFee.setValidator(QRegExpValidator(QRegExp("\\d+")))
         qleFee.textChanged.connect(self.changeFee)
-        if runner['Note'] == 'EPO':     qleFee.setText('70')
-        elif runner['Note'] == 'Late':  qleFee.setText('140')
-        else:                           qleFee.setText('90')
+        qleFee.setText(f"{fee:.0f}" if not np.isnan(fee) else '')
 
         btnCancel = QPushButton(' Cancel',self)
         btnCancel.setIcon(standardIcon('SP_DialogCancelButton'))
@@ -237,6 +222,19 @@ class StatisticsBox(QDialog):
         lblMedianTime = QLabel(f"Median time: {medianT}")
         lblTotalFee = QLabel(f"Total fee: {int(df['Fee'].sum())}")
 
+        # Leaders of categories
+        lblCategories = []
+        for category,func in CATEGORIES.items():
+            for group,gdf in df.groupby(func(df)):
+                gFinished = np.count_nonzero(~pd.isna(gdf['Finish'].to_numpy()))
+                leader = gdf.sort_values(by=f'{category}Rank').iloc[0]
+                if pd.isna(leader['Time']):
+                    leaderStr = '--:--:--'
+                else:
+                    leaderStr = f"{leader['Name']} {sec2str(leader['Time'])}"
+                lblCategories.append(QLabel(
+                    f"{group}: finished {gFinished}/{len(gdf)}, leader: {leaderStr}"))
+
         # Layout ---------------------------------------------------------------
         vbox = QVBoxLayout()
         vbox.addWidget(lblRegistered)
@@ -247,6 +245,8 @@ class StatisticsBox(QDialog):
         vbox.addWidget(lblMeanTime)
         vbox.addWidget(lblMedianTime)
         vbox.addWidget(lblTotalFee)
+        for lbl in lblCategories:
+            vbox.addWidget(lbl)
 
         self.setLayout(vbox)
         self.setWindowTitle("Statistics")
@@ -261,66 +261,526 @@ class MplCanvas(FigureCanvasQTAgg):
         super(MplCanvas, self).__init__(fig)
 
 class PlotBox(QDialog):
+    """ Non-modal window with timeline of runners, updated incrementally """
 
     def __init__(self,df:pd.DataFrame,highlight=None):
         super().__init__()
 
-        sc = MplCanvas(self, width=5, height=4, dpi=100)
+        self.sc = MplCanvas(self, width=5, height=4, dpi=100)
+        self.timeline = plotOccupancy(self.sc.ax1,self.sc.ax2,df,now=nowSec())
 
-        df = df.sort_values(by=['Score','Time'],ascending=[False,True])
+        vbox = QVBoxLayout()
+        vbox.addWidget(self.sc)
+        self.setLayout(vbox)
+
+        self.setWindowTitle("Timeline")
+        self.setModal(False)
+        self.show()
+
+    def updateData(self,df:pd.DataFrame):
+        """ Runners started or finished -> update artists and redraw """
+
+        if not self.isVisible(): return
+        self.timeline.setData(df,now=nowSec())
+        self.sc.draw_idle()
+
+    def tick(self,now:int):
+        """ Extend runners in forest to current time """
+
+        if not self.isVisible() or len(self.timeline.runStart)==0: return
+        self.timeline.tick(now)
+        self.sc.draw_idle()
+
+class LeaderboardView(QWidget):
+    """ One page of leaderboard painted by `QPainter`
+
+    Rows are diffed by ID when new standings come: unchanged rows are not
+    repainted, rows whose position changed slide to new place and rows which
+    just appeared flash. Frame timer runs only while some row is animated.
+    """
+
+    HEADER = ['#','Name','Score','Time','Loss']
+    # Relative widths of columns
+    WIDTHS = [1,6,1.2,2,2]
+
+    def __init__(self,rows:int=LEADERBOARD_ROWS,parent=None):
+        super().__init__(parent)
+
+        self.pageRows = rows
+        # Rows of page `{ID: {'cells','pos','from','to','t0','flash'}}`
+        self.rows = {}
+        self.frameTimer = QTimer(self)
+        self.frameTimer.setInterval(LEADERBOARD_FRAME)
+        self.frameTimer.timeout.connect(self.frame)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+
+    def rowHeight(self):
+        return self.height()/(self.pageRows+1)
+
+    def setRows(self,rows:list,animate:bool=True):
+        """ Show `rows` [(ID, cells)] of page, top row first """
+
+        now = timer()
+        old = self.rows
+        self.rows = {}
+        dirty = []
+        for i,(ID,cells) in enumerate(rows):
+            row = old.get(ID)
+            if row is None:
+                row = {'cells':cells,'pos':i,'from':i,'to':i,'t0':now,'flash':now if animate else None}
+                dirty.append((i,i))
+            else:
+                if row['to'] != i or row['cells'] != cells:
+                    dirty.append((row['pos'],i))
+                if row['to'] != i:
+                    row.update({'from':row['pos'],'to':i,'t0':now})
+                    if animate: row['flash'] = now
+                    else: row['pos'] = row['from'] = i
+                row['cells'] = cells
+            self.rows[ID] = row
+        for ID,row in old.items():
+            if ID not in self.rows:
+                dirty.append((row['pos'],row['pos']))
+
+        if dirty:
+            self.updateRows(dirty)
+            if animate: self.frameTimer.start()
+
+    def updateRows(self,spans:list):
+        """ Schedule repaint of rows between positions of `spans` """
+
+        h = self.rowHeight()
+        top = min(min(a,b) for a,b in spans)
+        bottom = max(max(a,b) for a,b in spans)
+        self.update(0,int((top+1)*h)-1,self.width(),int((bottom-top+1)*h)+2)
+
+    def frame(self):
+
+        now = timer()
+        spans = []
+        for row in self.rows.values():
+            moving = row['pos'] != row['to']
+            flashing = row['flash'] is not None
+            if not (moving or flashing): continue
+            if moving:
+                t = min((now-row['t0'])*1000/LEADERBOARD_SLIDE,1)
+                # Ease out
+                pos = row['from']+(row['to']-row['from'])*(1-(1-t)**3)
+                spans.append((row['pos'],pos))
+                row['pos'] = row['to'] if t >= 1 else pos
+            if flashing:
+                spans.append((row['pos'],row['pos']))
+                if (now-row['flash'])*1000 > LEADERBOARD_FLASH:
+                    row['flash'] = None
+
+        if spans:
+            self.updateRows(spans)
+        else:
+            self.frameTimer.stop()
+
+    def paintEvent(self,event):
+
+        painter = QPainter(self)
+        painter.fillRect(event.rect(),QColor(20,24,32))
+        h = self.rowHeight()
+        font = painter.font()
+        font.setPixelSize(max(int(h*0.6),8))
+        painter.setFont(font)
+
+        # Column borders
+        total = sum(self.WIDTHS)
+        xs = np.cumsum([0]+[w/total*self.width() for w in self.WIDTHS])
+
+        def drawCells(y,cells,color):
+            painter.setPen(color)
+            for c,text in enumerate(cells):
+                align = Qt.AlignLeft if c == 1 else Qt.AlignHCenter
+                painter.drawText(QRectF(xs[c]+h/4,y,xs[c+1]-xs[c]-h/2,h),align|Qt.AlignVCenter,text)
+
+        if event.rect().top() < h:
+            painter.fillRect(QRectF(0,0,self.width(),h),QColor(40,60,90))
+            drawCells(0,self.HEADER,QColor(255,255,255))
+
+        now = timer()
+        # Moving rows are painted last (above the others)
+        for row in sorted(self.rows.values(),key=lambda r: r['pos'] != r['to']):
+            y = (row['pos']+1)*h
+            if y+h < event.rect().top() or y > event.rect().bottom(): continue
+            color = QColor(32,38,50) if row['to'] % 2 else QColor(24,28,38)
+            if row['flash'] is not None:
+                k = max(1-(now-row['flash'])*1000/LEADERBOARD_FLASH,0)
+                color = QColor(int(color.red()+k*(200-color.red())),int(color.green()+k*(160-color.green())),
+                    int(color.blue()+k*(40-color.blue())))
+            painter.fillRect(QRectF(0,y,self.width(),h),color)
+            drawCells(y,row['cells'],QColor(235,235,235))
+
+class LeaderboardWindow(QWidget):
+    """ Projector window: ranked finishers (paged), recent finishers and
+    number of runners in forest
+
+    Updated from snapshots of the engine, only visible page is formatted.
+    """
+
+    def __init__(self,rows:int=LEADERBOARD_ROWS):
+        super().__init__()
+
+        self.df = None
+        self.page = 0
+        self.ranked = pd.Index([])
+
+        self.board = LeaderboardView(rows,self)
+        self.lblPage = QLabel()
+        self.lblInForest = QLabel()
+        self.lblRecent = QLabel()
+        self.lblRecent.setAlignment(Qt.AlignTop)
+
+        self.pageTimer = QTimer(self)
+        self.pageTimer.setInterval(LEADERBOARD_PAGE_INTERVAL)
+        self.pageTimer.timeout.connect(self.nextPage)
+
+        # Layout ---------------------------------------------------------------
+        side = QVBoxLayout()
+        side.addWidget(self.lblInForest)
+        side.addWidget(QLabel("Recent finishers"))
+        side.addWidget(self.lblRecent,1)
+        side.addWidget(self.lblPage)
+        hbox = QHBoxLayout()
+        hbox.addWidget(self.board,3)
+        hbox.addLayout(side,1)
+        self.setLayout(hbox)
+
+        self.setStyleSheet("background-color: rgb(20,24,32); color: rgb(235,235,235); font-size: 20pt;")
+        self.lblInForest.setStyleSheet("font-size: 32pt;")
+        self.setWindowTitle("EPO leaderboard")
+
+    def showOnProjector(self):
+        """ Show full screen on other screen than the main window, or as normal
+        window if there is only one screen (F11 toggles full screen) """
+
+        screens = QApplication.screens()
+        if len(screens) > 1:
+            parent = QApplication.activeWindow()
+            current = parent.screen() if parent is not None else QApplication.primaryScreen()
+            screen = next(s for s in screens if s is not current)
+            self.setGeometry(screen.geometry())
+            self.showFullScreen()
+        else:
+            self.resize(1024,768)
+            self.show()
+        self.pageTimer.start()
+
+    def updateData(self,df:pd.DataFrame):
+        """ New standings (snapshot, not modified later) """
+
+        self.df = df
+        if not self.isVisible(): return
+
+        finished = df['Time'].notna().to_numpy()
+        order = rankOrder(df)
+        self.ranked = df.index[order[finished[order]]]
+        self.showPage(animate=True)
+
+        started = df['Start'].notna().to_numpy()
+        self.lblInForest.setText(f"In forest: <b>{np.count_nonzero(started & ~df['Finish'].notna().to_numpy())}</b>")
+
+        recent = df.loc[df['Finish'].notna() & df['Start'].notna(),['Name','Time','Finish']]
+        recent = recent.nlargest(LEADERBOARD_RECENT,'Finish')
+        self.lblRecent.setText('<br>'.join(f"{name} <b>{time}</b>" for name,time in
+            zip(formatText(recent['Name']),formatSeconds(recent['Time']))))
+
+    def pages(self):
+        return max(int(np.ceil(len(self.ranked)/self.board.pageRows)),1)
+
+    def nextPage(self):
+
+        if self.pages() == 1: return
+        self.page = (self.page+1) % self.pages()
+        self.showPage(animate=False)
+
+    def showPage(self,animate:bool):
+
+        self.page = min(self.page,self.pages()-1)
+        n = self.board.pageRows
+        IDs = self.ranked[self.page*n:(self.page+1)*n]
+        runners = self.df.loc[IDs]
+        cells = zip(formatInt(runners['Rank']),formatText(runners['Name']),formatInt(runners['Score']),
+            formatSeconds(runners['Time']),formatSeconds(runners['Loss'],add_sign=True))
+        self.board.setRows(list(zip(IDs,cells)),animate)
+        self.lblPage.setText(f"Page {self.page+1}/{self.pages()}")
+
+    def showEvent(self,event):
+
+        if self.df is not None:
+            self.updateData(self.df)
+        return super().showEvent(event)
+
+    def keyPressEvent(self,a0:QtGui.QKeyEvent):
+
+        if a0.key() == Qt.Key_F11:
+            if self.isFullScreen(): self.showNormal()
+            else: self.showFullScreen()
+        elif a0.key() == Qt.Key_Escape and self.isFullScreen():
+            self.showNormal()
+        return super().keyPressEvent(a0)
+
+    def closeEvent(self,a0:QtGui.QCloseEvent):
 
-        start_wnan = df['Start'].to_numpy()
-        finish_wnan = df['Finish'].to_numpy()
-        # Remove entries of runners who have not finished yet
-        start = start_wnan[np.logical_and(~np.isnan(start_wnan),~np.isnan(finish_wnan))].astype(int)
-        finish = finish_wnan[np.logical_and(~np.isnan(start_wnan),~np.isnan(finish_wnan))].astype(int)
-
-        for i in range(len(start)):
-            sc.ax1.plot([start[i],finish[i]],[i,i],color='k')
-        locs = sc.ax1.get_xticks()
-        locs = locs[::2]
-        sc.ax1.set_xticks(locs)
-        sc.ax1.set_xticklabels([sec2str(t) for t in locs])
-        sc.ax1.set_xlabel('Time')
-        sc.ax1.set_ylabel('Rank')
-
-        inForestX = np.sort(np.unique(np.concatenate((start,finish))))
-        inForestN = np.empty(len(inForestX))
-
-        for i in range(len(start)):
-            i1 = np.where(inForestX == start[i])[0][0]
-            i2 = np.where(inForestX == finish[i])[0][0]+1
-            inForestN[i1:i2] += 1
-        sc.ax2.step(inForestX,inForestN,linewidth=2)
-        sc.ax2.set_ylabel('Number of people in forest')
-        # plt.show()
+        self.pageTimer.stop()
+        self.board.frameTimer.stop()
+        return super().closeEvent(a0)
+
+class BatchRegisterDialog(QDialog):
+    """ Registration desk: IDs are typed (or scanned) in succession into a
+    queue and the whole queue is registered at once """
+
+    committed = pyqtSignal(list)        # IDs of runners to register
+
+    def __init__(self,getRunner,getFee):
+        super().__init__()
+
+        # Callbacks returning runner (None if not found) and fee of given ID
+        self.getRunner = getRunner
+        self.getFee = getFee
+        self.queue = []
+
+        lblInfo = QLabel("Type or scan ID and press <b>Enter</b>. <b>Enter</b> in empty "
+            "field registers all queued runners, <b>Del</b> removes selected runner.")
+        lblInfo.setWordWrap(True)
+        self.qleID = QLineEdit()
+        # Empty field is acceptable (Enter registers the queue)
+        self.qleID.setValidator(QRegExpValidator(QRegExp("\\d*")))
+        self.qleID.returnPressed.connect(self.enterID)
+        self.lstQueue = QListWidget()
+        self.lblStatus = QLabel()
+
+        btnRegister = QPushButton(' Register',self)
+        btnRegister.setIcon(standardIcon('SP_DialogOkButton'))
+        btnRegister.clicked.connect(self.commit)
+        btnClose = QPushButton(' Close',self)
+        btnClose.setIcon(standardIcon('SP_DialogCloseButton'))
+        btnClose.clicked.connect(self.close)
+        # Enter belongs to ID field only
+        for btn in [btnRegister,btnClose]:
+            btn.setAutoDefault(False)
+            btn.setDefault(False)
+
+        # Layout ---------------------------------------------------------------
+
+        hboxButtons = QHBoxLayout()
+        hboxButtons.addWidget(self.lblStatus)
+        hboxButtons.addStretch()
+        hboxButtons.addWidget(btnClose)
+        hboxButtons.addWidget(btnRegister)
 
         vbox = QVBoxLayout()
-        vbox.addWidget(sc)
+        vbox.addWidget(lblInfo)
+        vbox.addWidget(self.qleID)
+        vbox.addWidget(self.lstQueue)
+        vbox.addLayout(hboxButtons)
         self.setLayout(vbox)
 
+        self.setWindowTitle('Batch registration')
+        self.setModal(False)
+        self.resize(400,400)
         self.show()
+        self.qleID.setFocus()
+
+    def setStatus(self,msg:str,fc:QColor=Qt.black):
+        self.lblStatus.setText(msg)
+        self.lblStatus.setStyleSheet(f"color: {QColor(fc).name()}")
+
+    def enterID(self):
+
+        text = self.qleID.text()
+        self.qleID.clear()
+        if text == '':
+            self.commit()
+            return
+
+        ID = int(text)
+        runner = self.getRunner(ID)
+        if runner is None:
+            self.setStatus(f"Runner {ID} does not exist!",Qt.red)
+        elif runner['Registered'] == True:
+            self.setStatus(f"{runner['Name']} ({ID}) already registered!",Qt.darkYellow)
+        elif ID in self.queue:
+            self.setStatus(f"{runner['Name']} ({ID}) already in queue!",Qt.darkYellow)
+        else:
+            self.queue.append(ID)
+            note = runner['Note'] if not pd.isna(runner['Note']) else ''
+            fee = self.getFee(ID)
+            fee = f"{fee:.0f}" if not np.isnan(fee) else '-'
+            self.lstQueue.addItem(f"{ID}\t{runner['Name']}\t{note}\t{fee}")
+            self.lstQueue.scrollToBottom()
+            self.setStatus(f"{len(self.queue)} in queue")
+
+    def commit(self):
+        """ Register all queued runners """
+
+        if not self.queue: return
+        queue, self.queue = self.queue, []
+        self.lstQueue.clear()
+        self.committed.emit(queue)
+        self.setStatus(f"{len(queue)} registered",Qt.darkGreen)
+        self.qleID.setFocus()
+
+    def keyPressEvent(self,a0:QtGui.QKeyEvent):
+
+        row = self.lstQueue.currentRow()
+        if a0.key() == Qt.Key_Delete and row >= 0:
+            self.lstQueue.takeItem(row)
+            del self.queue[row]
+            self.setStatus(f"{len(self.queue)} in queue")
+        elif a0.key() in [Qt.Key_Return,Qt.Key_Enter]:
+            return
+        else:
+            super().keyPressEvent(a0)
+
+class PunchDialog(QDialog):
+    """ Entry of score-O control punches read from runner's card:
+    'ID code code ...' followed by Enter """
+
+    punched = pyqtSignal(int,list)      # ID, control codes
+
+    def __init__(self):
+        super().__init__()
+
+        lblInfo = QLabel("Type ID followed by codes of punched controls separated "
+            "by spaces (e.g. <b>12 31 35 47</b>) and press <b>Enter</b>.")
+        lblInfo.setWordWrap(True)
+        self.qlePunches = QLineEdit()
+        self.qlePunches.setValidator(QRegExpValidator(QRegExp("[\\d ]*")))
+        self.qlePunches.returnPressed.connect(self.enterPunches)
+        self.lblStatus = QLabel()
+
+        vbox = QVBoxLayout()
+        vbox.addWidget(lblInfo)
+        vbox.addWidget(self.qlePunches)
+        vbox.addWidget(self.lblStatus)
+        self.setLayout(vbox)
+
+        self.setWindowTitle('Control punches')
+        self.setModal(False)
+        self.resize(400,100)
+        self.show()
+        self.qlePunches.setFocus()
+
+    def enterPunches(self):
+
+        items = self.qlePunches.text().split()
+        self.qlePunches.clear()
+        if len(items) < 2:
+            self.lblStatus.setText("ID and at least one control expected!")
+            return
+        self.punched.emit(int(items[0]),items[1:])
+        self.lblStatus.setText(f"{items[0]}: {len(items)-1} controls entered")
+
+class CSVLoader(QThread):
+    """ Parse event CSV in chunks in background thread """
+
+    chunkLoaded = pyqtSignal(object,int,int)    # chunk, bytes read, file size
+    loaded = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self,filename:str,cols:list):
+        super().__init__()
+        self.filename = filename
+        self.cols = cols
+
+    def run(self):
+
+        try:
+            for chunk,pos,total in iterEventCSV(self.filename,self.cols):
+                if self.isInterruptionRequested(): return
+                self.chunkLoaded.emit(chunk,pos,total)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.loaded.emit()
 
 class EPOGUI(QMainWindow):
 
     def __init__(self,csv_filepath:str=''):
         super().__init__()
         
-        # Dataframe holding all data
+        # Dataframe holding all data, newest snapshot of `self.engine` which
+        # is the only one changing it (never modify `self.df` in GUI!)
         self.df = None
+        self.engine = None
+        # Table is redrawn at most once per `REDRAW_INTERVAL` for all
+        # snapshots received meanwhile
+        self.redrawPending = False
 
         # Define columns
-        self.cols = ['ID','Name','Gender','Start','Finish','Time','Loss','Score','Note','Registered','Fee']
+        self.cols = ['ID','Rank','Name','Gender','Start','Finish','Time','Loss','GenderRank','GenderLoss','EPORank','EPOLoss','Score','Note','Registered','Fee','Punches']
+        # Columns computed from other columns (not editable)
+        self.rankCols = ['Rank']+[f'{c}Rank' for c in CATEGORIES]
+        self.lossCols = ['Loss']+[f'{c}Loss' for c in CATEGORIES]
 
         self.csvFile = csv_filepath
+        # Name of this station in journals (see `epo_journal`)
+        self.station = stationName()
+        # Punches of this station: 'both', 'start' or 'finish' (separate start
+        # and finish laptops)
+        self.role = 'both'
+
+        # Event CSV is written in background from snapshots
+        self.writer = SnapshotWriter(self.cols)
+        # Results are rendered and uploaded in background from snapshots
+        self.reports = ReportPipeline()
+        self.reportVersion = itertools.count(1)
+        # Optional local HTTP server with live standings
+        self.server = ResultsServer()
+        # Input devices (`epo_devices.DeviceInput`) and their punches waiting
+        # for loading of event
+        self.devices = []
+        self.devicePunches = []
+        # Result slips of finished runners are spooled in background
+        self.receipts = ReceiptSpool()
+        # Optional standings in shared memory for other local processes
+        # (`epo_shm.StandingsWriter`, None if not shared)
+        self.standings = None
+        # Hot standby (see `epo_replica`): server streaming changes to
+        # standbys, client following primary while this station is standby
+        # and its messages waiting for loading of event
+        self.replicaServer = None
+        self.replicaClient = None
+        self.replicaMessages = []
         self.maxScore = 23
         self.leaderTime = None
+        # Cached leaders of categories `{(category,group): (ID,time)}`, see
+        # `epo_core.getStandings()`
+        self.leaders = {}
+
+        # Timeline window (created on demand, updated while visible)
+        self.plotBox = None
+        # Leaderboard for projector (created on demand, updated while visible)
+        self.leaderboard = None
+        # Registration desk (created on demand)
+        self.batchDialog = None
+        # Score-O controls (`epo_core.ControlTable`), None if event has no
+        # 'controls.csv'
+        self.controls = None
+        self.punchDialog = None
 
         # Callback on changing content of the table is called although if it is
         # changed programatically. Therefore `drawingTable` is set to `True`
         # while generating table and to `False` after that. Callback on content
         # change is called only when `drawingTable == False`.
         self.drawingTable = False
+        # Row of each ID in the table `{ID: row}`
+        self.tableRows = {}
+        # Runners of table rows in order of rows (None if rows must be built)
+        # and runners whose cells were edited in the table since drawing
+        self.tableOrder = None
+        self.staleRows = set()
+        # Formatted text of table cells, reformatted only when values change
+        self.display = DisplayCache(self.cols,self.lossCols)
+
+        # CSV is loaded in background, input is disabled meanwhile
+        self.loader = None
+        self.loadedChunks = []
+        self.loading = False
 
         # Start/Finish ---------------------------------------------------------
         self.lblSF = QLabel("Start/Finish")
@@ -331,6 +791,14 @@ class EPOGUI(QMainWindow):
         self.qleID.textChanged.connect(self.qleID_changed)
         self.qleID.returnPressed.connect(self.start_stop)
 
+        # Candidates for typed digits (completer inserts ID stored in UserRole)
+        self.idIndex = None
+        self.idModel = QStandardItemModel(self)
+        self.idCompleter = QCompleter(self.idModel,self)
+        self.idCompleter.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.idCompleter.setCompletionRole(Qt.UserRole)
+        self.qleID.setCompleter(self.idCompleter)
+
         self.btnOK = QPushButton(' N/A',self)
         self.btnOK.setObjectName('btn_ok')
         self.btnOK.setMaximumWidth(100)
@@ -399,19 +867,28 @@ class EPOGUI(QMainWindow):
         self.table.setHorizontalHeaderLabels(self.cols)
 
         header.setSectionResizeMode(self.cols.index('ID'),      QtWidgets.QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(self.cols.index('Rank'),    QtWidgets.QHeaderView.ResizeToContents)
         header.setSectionResizeMode(self.cols.index('Name'),    QtWidgets.QHeaderView.Stretch)
         header.setSectionResizeMode(self.cols.index('Gender'),  QtWidgets.QHeaderView.ResizeToContents)
         header.setSectionResizeMode(self.cols.index('Start'),   QtWidgets.QHeaderView.ResizeToContents)
         header.setSectionResizeMode(self.cols.index('Finish'),  QtWidgets.QHeaderView.ResizeToContents)
         header.setSectionResizeMode(self.cols.index('Time'),    QtWidgets.QHeaderView.ResizeToContents)
         header.setSectionResizeMode(self.cols.index('Loss'),    QtWidgets.QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(self.cols.index('GenderRank'),QtWidgets.QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(self.cols.index('GenderLoss'),QtWidgets.QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(self.cols.index('EPORank'), QtWidgets.QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(self.cols.index('EPOLoss'), QtWidgets.QHeaderView.ResizeToContents)
         header.setSectionResizeMode(self.cols.index('Score'),   QtWidgets.QHeaderView.ResizeToContents)
         header.setSectionResizeMode(self.cols.index('Note'),    QtWidgets.QHeaderView.Interactive)
         header.setSectionResizeMode(self.cols.index('Registered'),QtWidgets.QHeaderView.ResizeToContents)
         header.setSectionResizeMode(self.cols.index('Fee'),     QtWidgets.QHeaderView.ResizeToContents)
         self.table.setColumnHidden(self.cols.index('Registered'),True)
+        self.table.setColumnHidden(self.cols.index('Punches'),True)
+        self.table.setColumnHidden(self.cols.index('GenderLoss'),True)
+        self.table.setColumnHidden(self.cols.index('EPOLoss'),True)
 
         self.table.cellChanged.connect(self.tableCellChanged)
+        self.tableEditTriggers = self.table.editTriggers()
         self.table.setContextMenuPolicy(Qt.CustomContextMenu)
         self.table.customContextMenuRequested.connect(self.tableContextMenu)
         
@@ -469,6 +946,11 @@ class EPOGUI(QMainWindow):
 
         self.createMenus()
 
+        self.progressBar = QProgressBar()
+        self.progressBar.setMaximumWidth(200)
+        self.progressBar.hide()
+        self.statusBar().addPermanentWidget(self.progressBar)
+
         self.setGeometry(100,100,800,800)
         self.setWindowTitle('EPO OB')
         self.show()
@@ -522,13 +1004,91 @@ class EPOGUI(QMainWindow):
             "&Save CSV",
             shortcut = QKeySequence("Ctrl+S"),
             icon=standardIcon('SP_DriveFDIcon'),
-            triggered = self.saveCSV
+            triggered = lambda: self.saveCSV()
         )
         
+        self.exportAct = QAction(
+            "&Export results",
+            shortcut = QKeySequence("Ctrl+E"),
+            icon=standardIcon('SP_DialogSaveButton'),
+            triggered = self.exportResults
+        )
+
         fileMenu = QMenu("&File",self)
         fileMenu.addAction(self.newCSVAct)
         fileMenu.addAction(self.openCSVAct)
         fileMenu.addAction(self.saveCSVAct)
+        fileMenu.addAction(self.exportAct)
+
+        self.batchRegisterAct = QAction(
+            "&Batch registration",
+            self,
+            shortcut = QKeySequence("Ctrl+B"),
+            triggered = self.openBatchRegistration
+        )
+        fileMenu.addAction(self.batchRegisterAct)
+
+        self.punchesAct = QAction(
+            "Control &punches",
+            self,
+            shortcut = QKeySequence("Ctrl+K"),
+            triggered = self.openPunchDialog
+        )
+        fileMenu.addAction(self.punchesAct)
+
+        self.printReceiptsAct = QAction(
+            "Print &receipts",
+            self,
+            icon = qta.icon('mdi.printer-pos'),
+            checkable=True
+        )
+        fileMenu.addAction(self.printReceiptsAct)
+
+        roleMenu = fileMenu.addMenu("Station ro&le")
+        roleGroup = QActionGroup(self)
+        for role,label in [('both','Start and finish'),('start','Start only'),('finish','Finish only')]:
+            act = QAction(label,self,checkable=True,triggered=lambda _,r=role: self.setRole(r))
+            act.setChecked(role == self.role)
+            roleGroup.addAction(act)
+            roleMenu.addAction(act)
+
+        self.connectDeviceAct = QAction(
+            "Connect &device",
+            self,
+            icon = qta.icon('mdi.barcode-scan'),
+            triggered = lambda: self.connectDevice()
+        )
+        self.disconnectDevicesAct = QAction(
+            "Disconnect devices",
+            self,
+            triggered = self.disconnectDevices
+        )
+        fileMenu.addAction(self.connectDeviceAct)
+        fileMenu.addAction(self.disconnectDevicesAct)
+
+        self.serveStandbyAct = QAction(
+            "Serve s&tandby",
+            self,
+            triggered = self.toggleStandbyServer,
+            icon = qta.icon('mdi.lan-connect'),
+            checkable=True
+        )
+        self.followPrimaryAct = QAction(
+            "&Follow primary",
+            self,
+            triggered = lambda: self.followPrimary(),
+            icon = qta.icon('mdi.lan-pending')
+        )
+        self.takeOverAct = QAction(
+            "Take o&ver",
+            self,
+            triggered = self.takeOver,
+            icon = qta.icon('mdi.lan-disconnect'),
+            enabled = False
+        )
+        fileMenu.addAction(self.serveStandbyAct)
+        fileMenu.addAction(self.followPrimaryAct)
+        fileMenu.addAction(self.takeOverAct)
 
         self.showStatisticsAct = QAction(
             "Show &statistics",
@@ -546,6 +1106,14 @@ class EPOGUI(QMainWindow):
             shortcut = QKeySequence("Ctrl+P")
         )
 
+        self.leaderboardAct = QAction(
+            "&Leaderboard (projector)",
+            self,
+            triggered = self.openLeaderboard,
+            icon = qta.icon('mdi.projector-screen'),
+            shortcut = QKeySequence("Ctrl+L")
+        )
+
         self.showOutputAct = QAction(
             "Show &output",
             self,
@@ -555,6 +1123,22 @@ class EPOGUI(QMainWindow):
         )
         self.showOutputAct.setChecked(True)
 
+        self.resultsServerAct = QAction(
+            "Results se&rver",
+            self,
+            triggered = self.toggleResultsServer,
+            icon = qta.icon('mdi.web'),
+            checkable=True
+        )
+
+        self.shareStandingsAct = QAction(
+            "S&hare standings",
+            self,
+            triggered = self.toggleSharedStandings,
+            icon = qta.icon('mdi.memory'),
+            checkable=True
+        )
+
         self.showAllColumnsAct = QAction(
             "Show all columns",
             self,
@@ -565,8 +1149,11 @@ class EPOGUI(QMainWindow):
         viewMenu = QMenu("&View",self)
         viewMenu.addAction(self.showStatisticsAct)
         viewMenu.addAction(self.plotStatisticsAct)
+        viewMenu.addAction(self.leaderboardAct)
         viewMenu.addAction(self.showOutputAct)
         viewMenu.addAction(self.showAllColumnsAct)
+        viewMenu.addAction(self.resultsServerAct)
+        viewMenu.addAction(self.shareStandingsAct)
 
         self.aboutAct = ActionDialog(
             parent=self,
@@ -597,10 +1184,16 @@ class EPOGUI(QMainWindow):
 
     def showTime(self):
 
-        now = datetime.now()
-        now = now.hour*3600+now.minute*60+now.second
+        now = nowSec()
         self.lblTime.setText(sec2str(now))
-        
+
+        # Report failures of background saving, reports and printing
+        sources = [self.writer,self.reports,self.receipts]
+        if self.engine is not None: sources.append(self.engine)
+        for source in sources:
+            for error in source.takeErrors():
+                self.dispMsg(error,fc=Qt.red)
+
         if self.df is None or self.df.empty: return
 
         if pd.isnull(self.df['Start'].to_numpy()).all():
@@ -609,14 +1202,33 @@ class EPOGUI(QMainWindow):
             lastStartTime = np.nanmax(self.df['Start'].to_numpy())
             self.lblTimer.setText(sec2str(now-lastStartTime))
 
+        if self.plotBox is not None:
+            self.plotBox.tick(now)
+
     def showStatistics(self):
 
         dialog = StatisticsBox(self.df)
         dialog.exec()
 
     def plotStatistics(self):
-        dialog = PlotBox(self.df)
-        dialog.exec()
+
+        if self.plotBox is None:
+            self.plotBox = PlotBox(self.df)
+        else:
+            self.plotBox.show()
+            self.plotBox.updateData(self.df)
+        self.plotBox.raise_()
+        self.plotBox.activateWindow()
+
+    def openLeaderboard(self):
+        """ Show leaderboard on projector (second screen if available) """
+
+        if self.leaderboard is None:
+            self.leaderboard = LeaderboardWindow()
+        if self.df is not None:
+            self.leaderboard.updateData(self.df)
+        self.leaderboard.showOnProjector()
+        self.leaderboard.raise_()
 
     def start_stop(self):
 
@@ -629,83 +1241,250 @@ class EPOGUI(QMainWindow):
 
         self.qleID.setText('')
 
+        # Time of punch is taken now, not when the engine applies it
+        self.punch(ID,nowSec())
+
+    def punch(self,ID:int,now:int):
+        """ Start or finish runner at time `now` """
+
+        if self.replicaClient is not None:
+            self.dispMsg(f"Standby station does not punch ({ID}), take over first!",fc=Qt.red)
+            return
+
         if ID not in self.df.index:
             self.dispMsg(f'ID {ID} not found!',fc=Qt.red)
             return
 
-        now = datetime.now()
-        now = now.hour*3600+now.minute*60+now.second
+        self.engine.submit(epo_engine.punch,ID,now,self.maxScore,self.controls,self.role,
+            callback=lambda result: self.punched(ID,now,result))
+
+    def setRole(self,role:str):
+
+        self.role = role
+        self.dispMsg(f"Station '{self.station}' punches: ",end='')
+        self.dispMsg(role,fw=QFont.Bold)
+
+    def connectDevice(self,path:str=None):
+        """ Read punches from barcode scanner or serial/RFID reader `path`
+        (serial port, pty, pipe or '-' for stdin), speed of serial port can
+        follow as `path@baud` """
+
+        if path is None:
+            path,done = QInputDialog.getText(self,'Connect device',
+                f"Device (e.g. /dev/ttyUSB0, /dev/ttyUSB0@{BAUD_RATE}, COM3 or '-' for stdin):")
+            if not done or path == '': return
+
+        baud = BAUD_RATE
+        if re.fullmatch(r'.+@\d+',path):
+            path,baud = path.rsplit('@',1)
+            baud = int(baud)
+
+        device = DeviceInput(path,clock=lambda: nowSec(),baud=baud)
+        device.punched.connect(self.devicePunched)
+        device.failed.connect(lambda error: self.dispMsg(error,fc=Qt.red))
+        device.start()
+        self.devices.append(device)
+        self.dispMsg(f"Reading punches from '{path}'",fc=Qt.darkGreen)
+
+    def disconnectDevices(self):
+
+        for device in self.devices:
+            device.stop()
+            self.dispMsg(f"Device '{device.path}' disconnected ({device.reads} reads, "
+                f"{device.duplicates} duplicates)",fc=Qt.darkYellow)
+        self.devices = []
+
+    def devicePunched(self):
+        """ Punches of device came (in a burst), times were taken at reading """
+
+        self.devicePunches += self.sender().take()
+        # Punches coming while event is loaded wait for its engine
+        if self.engine is None or self.loading: return
+        punches, self.devicePunches = self.devicePunches, []
+        for ID,now in punches:
+            self.punch(ID,now)
+
+    def toggleStandbyServer(self,start:bool):
+        """ Start/stop streaming changes to standby stations """
+
+        if start:
+            server = ReplicaServer()
+            try:
+                server.start()
+            except OSError as e:
+                self.dispMsg(f"Standby server could not be started: {e}",fc=Qt.red)
+                self.serveStandbyAct.setChecked(False)
+                return
+            server.connected.connect(lambda address: self.dispMsg(f"Standby {address} connected",fc=Qt.darkGreen))
+            server.disconnected.connect(lambda reason: self.dispMsg(reason,fc=Qt.darkYellow))
+            self.replicaServer = server
+            if self.engine is not None:
+                self.engine.setReplica(server)
+            self.dispMsg(f"Standby can follow ",fc=Qt.darkGreen,end='')
+            self.dispMsg(f"{getLocalIP()}:{server.port}",fc=Qt.darkGreen,fw=QFont.Bold)
+        elif self.replicaServer is not None:
+            server,self.replicaServer = self.replicaServer,None
+            if self.engine is not None:
+                self.engine.setReplica(None)
+            server.stop()
+            self.dispMsg("Standby server stopped!",fc=Qt.darkYellow)
+
+    def followPrimary(self,address:str=None):
+        """ Run as standby of primary station `host[:port]`, its runners
+        replace runners of the loaded event """
+
+        if address is None:
+            address,done = QInputDialog.getText(self,'Follow primary',
+                "Primary station (host or host:port):")
+            if not done or address == '': return
+
+        host,_,port = address.strip().partition(':')
+        try:
+            port = int(port) if port else REPLICA_PORT
+        except ValueError:
+            self.dispMsg(f"Port of '{address}' must be integer!",fc=Qt.red)
+            return
+
+        if self.replicaClient is not None:
+            self.replicaClient.stop()
+        client = ReplicaClient(host,port)
+        client.received.connect(self.replicaReceived)
+        client.connected.connect(lambda address: self.dispMsg(f"Following primary {address}",fc=Qt.darkGreen))
+        client.failed.connect(lambda error: self.dispMsg(error,fc=Qt.red))
+        self.replicaClient = client
+        self.replicaMessages = []
+        self.enableInput()
+        client.start()
+        self.dispMsg(f"Standby of {client.address}, take over by File → Take over",fc=Qt.darkYellow)
+
+    def replicaReceived(self):
+        """ Changes of primary came (in a burst), apply them by the engine """
+
+        if self.sender() is not self.replicaClient: return
+
+        self.replicaMessages += self.replicaClient.take()
+        # Changes coming while event is loaded wait for its engine
+        if self.engine is None or self.loading: return
+        self.applyReplicated()
+
+    def applyReplicated(self):
+
+        client = self.replicaClient
+        messages, self.replicaMessages = self.replicaMessages, []
+        if client is None or not messages: return
+
+        # Snapshot replaces everything before it, batches after it are
+        # applied as one command
+        first = max([i for i,(kind,_,_) in enumerate(messages) if kind == 'snapshot'],default=0)
+        messages = messages[first:]
+        kind,_,payload = messages[0]
+        if kind == 'snapshot':
+            self.engine.submit(applySnapshot,*payload)
+        changes = [change for kind,_,payload in messages if kind == 'changes' for change in payload]
+        # Primary learns version applied by the standby
+        version = messages[-1][1]
+        self.engine.submit(applyBatch,changes,callback=lambda _: client.ack(version))
+
+    def takeOver(self):
+        """ Stop following primary, this station punches from now on """
+
+        client = self.replicaClient
+        if client is None: return
+        client.stop()
+        # Changes received before are applied first
+        self.replicaMessages += client.take()
+        if self.engine is not None and not self.loading:
+            self.applyReplicated()
+        self.replicaClient = None
+        self.enableInput()
+        self.dispMsg(f"Took over from primary {client.address} (version {client.version})",
+            fc=Qt.darkGreen,fw=QFont.Bold)
+
+    def punched(self,ID:int,now:int,result:str):
+        """ Report start or finish of runner applied by the engine """
+
+        # Runner could be removed by the same batch
+        if result == 'missing' or ID not in self.df.index:
+            self.dispMsg(f'ID {ID} not found!',fc=Qt.red)
+            return
 
-        start = self.df.loc[ID,'Start']
         name = self.df.loc[ID,'Name']
-        if np.isnan(start):
-            # Runner not started yet -> start!
-            self.df.loc[ID,'Start'] = now
+        if result == 'started':
             self.dispMsg(f"{name}",fc=Qt.darkGreen,fw=QFont.Bold,end='')
             self.dispMsg(f' ({ID}) started at {sec2str(now)}',fc=Qt.darkGreen)
-        else:
-
-            finish = self.df.loc[ID,'Finish']
-            if not np.isnan(finish):
-                # Runner is already in finish -> print results
-                rank = self.getRank(ID)
-
-                self.dispMsg(f'{name}',fc=Qt.darkYellow,fw=QFont.Bold,end=' ')
-                self.dispMsg(f"({ID}) already finished at {sec2str(self.df.loc[ID,'Finish'])}, time =",fc=Qt.darkYellow,end=' ')
-                self.dispMsg(f"{sec2str(self.df.loc[ID,'Time'])}",fc=Qt.darkYellow,fw=QFont.Bold,end='')
-                self.dispMsg(f', loss =',fc=Qt.darkYellow,end=' ')
-                self.dispMsg(f"{sec2str(self.df.loc[ID,'Loss'])}",fc=Qt.darkYellow,fw=QFont.Bold,end='')
-                self.dispMsg(f', rank: ',fc=Qt.darkYellow,end='')
-                self.dispMsg(f'{rank}',fc=Qt.darkYellow,fw=QFont.Bold)
-                return
+            return
 
-            # Runner started but not in finish -> finish!
-            self.df.loc[ID,'Finish'] = now
-            self.df.loc[ID,'Score'] = self.maxScore
-            self.updateTimeAndLoss()
+        if result == 'already started':
+            self.dispMsg(f"{name}",fc=Qt.darkYellow,fw=QFont.Bold,end='')
+            self.dispMsg(f" ({ID}) already started at {sec2str(self.df.loc[ID,'Start'])}",fc=Qt.darkYellow)
+            return
 
-            rank = self.getRank(ID)
-            self.dispMsg(f'{name}',fc=Qt.blue,fw=QFont.Bold,end=' ')
-            self.dispMsg(f'({ID}) finished at {sec2str(now)}, time =',fc=Qt.blue,end=' ')
-            self.dispMsg(f"{sec2str(self.df.loc[ID,'Time'])}",fc=Qt.blue,fw=QFont.Bold,end='')
-            self.dispMsg(f', loss =',fc=Qt.blue,end=' ')
-            self.dispMsg(f"{sec2str(self.df.loc[ID,'Loss'])}",fc=Qt.blue,fw=QFont.Bold,end='')
-            self.dispMsg(f', rank: ',fc=Qt.blue,end='')
-            self.dispMsg(f'{rank}',fc=Qt.blue,fw=QFont.Bold)
+        if result == 'already finished':
+            # Runner is already in finish -> print results
+            clr = Qt.darkYellow
+            self.dispMsg(f'{name}',fc=clr,fw=QFont.Bold,end=' ')
+            self.dispMsg(f"({ID}) already finished at {sec2str(self.df.loc[ID,'Finish'])}",fc=clr,end='')
+        else:
+            clr = Qt.blue
+            self.dispMsg(f'{name}',fc=clr,fw=QFont.Bold,end=' ')
+            self.dispMsg(f'({ID}) finished at {sec2str(now)}',fc=clr,end='')
 
-        self.updateTable()
-        self.saveCSV()
+        if np.isnan(self.df.loc[ID,'Start']):
+            # Finish station, start is merged from journal of start station
+            self.dispMsg(f', start unknown',fc=clr)
+            return
 
+        self.dispMsg(f', time =',fc=clr,end=' ')
 
-    def getEmptyID(self):
-        """ Return smallest ID which is missing in the dataframe """
+        rank = self.getRankStr(ID)
+        self.dispMsg(f"{sec2str(self.df.loc[ID,'Time'])}",fc=clr,fw=QFont.Bold,end='')
+        self.dispMsg(f', loss =',fc=clr,end=' ')
+        self.dispMsg(f"{sec2str(self.df.loc[ID,'Loss'])}",fc=clr,fw=QFont.Bold,end='')
+        self.dispMsg(f', rank: ',fc=clr,end='')
+        self.dispMsg(f'{rank}',fc=clr,fw=QFont.Bold)
 
-        return next(i for i, e in enumerate(sorted(self.df.index.to_list())+[None],1) if i!= e)
+        if self.printReceiptsAct.isChecked():
+            self.printReceipt(ID,rank)
 
-    def getRank(self,ID):
-        """ Return integer of rank of runner with given ID """
+    def printReceipt(self,ID:int,rank:str):
+        """ Spool result slip of runner into '<event>_receipts/' """
 
-        df = self.df.sort_values(by=['Score','Time'],ascending=[False,True])
-        return df.index.get_loc(ID)+1
+        base = os.path.splitext(self.csvFile)[0]
+        runner = self.df.loc[ID]
+        self.receipts.submit(f"{base}_receipts",Receipt(
+            event = os.path.basename(base),
+            ID = int(ID),
+            name = str(runner['Name']),
+            start = float(runner['Start']),
+            finish = float(runner['Finish']),
+            time = float(runner['Time']),
+            loss = float(runner['Loss']),
+            rank = rank,
+            score = float(runner['Score']),
+        ))
+
+    def getRank(self,ID,category:str=''):
+        """ Return integer of rank of runner with given ID (within category) """
+
+        return int(self.df.loc[ID,f'{category}Rank'])
+
+    def getRankStr(self,ID):
+        """ Return overall rank followed by category ranks, e.g. '3 (M 2, EPO 1)' """
+
+        catRanks = []
+        for category,func in CATEGORIES.items():
+            group = func(self.df.loc[[ID]]).iloc[0]
+            if not pd.isna(group):
+                catRanks.append(f"{group} {self.getRank(ID,category)}")
+        rank = f"{self.getRank(ID)}"
+        if catRanks: rank += f" ({', '.join(catRanks)})"
+        return rank
 
     def updateLeaderTime(self):
         """ Update `self.leaderTime`: seconds or NaN if nobody in finish """
 
-        # Get dataframe sorted by Score and Time
-        df = self.df.sort_values(by=['Score','Time'],ascending=[False,True])
-        # Leaders time is the first one
-        self.leaderTime = df.iloc[0]['Time']
-
-    def updateTimeAndLoss(self):
-        """ Update `Time` and `Loss` """
-
-        # Update time
-        self.df['Time'] = self.df['Finish'] - self.df['Start']
-        # Update leader time
-        self.updateLeaderTime()
-        # Update loss
-        self.df['Loss'] = self.df['Time'] - self.leaderTime
-
+        # Overall leader is cached by the engine
+        self.leaderTime = getLeader(self.leaders)[1]
 
     def addRunner(self):
         """ Add entry for new runner """
@@ -720,44 +1499,129 @@ class EPOGUI(QMainWindow):
         # Get note
         newNote = self.qleNewNote.text()
 
-        # if len(self.df) == 0:
-        #     # Create new df
-        #     pass
-        # else:
-        # ID is the lowest ID which is not in the table
-        newID = self.getEmptyID()
-        # Create new dataframe line
-        newdf = pd.DataFrame({'Name':newName,'Gender':newGender,'Note':newNote},index=[newID])
-        newdf.index.name = 'ID'
-        # Concat two dataframes
-        self.df = pd.concat([self.df,newdf])
+        # ID (the lowest one which is not in the table) is given by the engine
+        self.engine.submit(epo_engine.addRunner,newName,newGender,newNote,
+            callback=lambda ID: self.dispMsg(f"New runner: {ID}, {newName}, {newGender}",fc=Qt.darkGreen))
 
         # Clear text box so it is ready for new entry
         self.qleNewName.setText('')
-        self.dispMsg(f"New runner: {newID}, {newName}, {newGender}",fc=Qt.darkGreen)
-        # Update table
-        self.updateTable()
-        # Save CSV
-        self.saveCSV()
 
-        # print('Dataframe after adding ==================================')
-        # print(self.df)
+    def getFeeRules(self):
+        """ Return fee rules of event ('fee_rules.csv' next to event CSV) """
+
+        filename = os.path.join(os.path.dirname(self.csvFile),'fee_rules.csv')
+        try:
+            return loadFeeRules(filename)
+        except (OSError,ValueError,KeyError) as e:
+            self.dispMsg(f"Fee rules '{filename}' could not be loaded ({e}), default rules used!",fc=Qt.red)
+            return FEE_RULES
+
+    def openBatchRegistration(self):
+        """ Open registration desk (non-modal) """
+
+        if self.df is None or self.loading: return
+
+        if self.batchDialog is None or not self.batchDialog.isVisible():
+            rules = self.getFeeRules()
+            self.batchDialog = BatchRegisterDialog(
+                getRunner = lambda ID: self.df.loc[ID] if ID in self.df.index else None,
+                getFee = lambda ID: getFees(self.df.loc[[ID]],rules)[0],
+            )
+            self.batchDialog.committed.connect(self.registerBatch)
+        self.batchDialog.raise_()
+        self.batchDialog.activateWindow()
+
+    def registerBatch(self,IDs:list):
+        """ Register runners with fees by rules, one update and save per batch """
+
+        self.engine.submit(epo_engine.registerRunners,IDs,self.getFeeRules(),
+            callback=self.batchRegistered)
+
+    def batchRegistered(self,result:tuple):
+
+        IDs,fees = result
+        if not IDs: return
+        self.dispMsg(f"{len(IDs)} runners registered, total fee ",fc=Qt.darkGreen,end='')
+        self.dispMsg(f"{np.nansum(fees):.0f}",fc=Qt.darkGreen,fw=QFont.Bold)
 
     def registerRunner(self,ID):
         
         runner = self.df.loc[ID]
-        dialog = RegisterDialog(ID,runner)
+        dialog = RegisterDialog(ID,runner,getFees(self.df.loc[[ID]],self.getFeeRules())[0])
         if dialog.exec():
-            self.df.loc[ID,'Fee'] = dialog.fee
-            self.df.loc[ID,'Registered'] = True
-            self.updateTable()
-            self.saveCSV()
+            name = runner['Name']
+            self.engine.submit(epo_engine.setValues,[ID],{'Fee':dialog.fee,'Registered':True})
             self.dispMsg(f"Runner ",fc=Qt.darkGreen,end='')
-            self.dispMsg(f"{self.df.loc[ID,'Name']} ",fc=Qt.darkGreen,fw=QFont.Bold,end='')
+            self.dispMsg(f"{name} ",fc=Qt.darkGreen,fw=QFont.Bold,end='')
             self.dispMsg(f"({ID}) successfully registered!",fc=Qt.darkGreen)
         else:
             self.dispMsg(f"Registration of runner {self.df.loc[ID,'Name']} ({ID}) cancelled!",fc=Qt.darkYellow)
 
+    def loadControls(self):
+        """ Load score-O controls from 'controls.csv' next to event CSV and
+        recompute scores of runners with punches """
+
+        self.controls = None
+        filename = os.path.join(os.path.dirname(self.csvFile),'controls.csv')
+        if not os.path.isfile(filename): return
+
+        try:
+            self.controls = ControlTable.load(filename)
+        except (OSError,ValueError,KeyError) as e:
+            self.dispMsg(f"Controls '{filename}' could not be loaded: {e}",fc=Qt.red)
+            return
+        self.dispMsg(f"Score-O: {len(self.controls.codes)} controls, max {self.controls.maxPoints:.0f} points",fc=Qt.darkGreen)
+
+        self.updateScores()
+
+    def updateScores(self):
+        """ Compute scores from punches of runners who punched any control
+        (loaded dataframe only, before it is passed to the engine) """
+
+        if self.controls is None or self.df.empty: return
+
+        df = self.df[self.df['Punches'].fillna('') != '']
+        if df.empty: return
+        self.df.loc[df.index,'Score'] = self.controls.getScores(
+            df['Punches'].to_numpy(),(df['Finish']-df['Start']).to_numpy(dtype=float))
+
+    def openPunchDialog(self):
+        """ Open window for entering control punches (non-modal) """
+
+        if self.df is None or self.loading: return
+        if self.controls is None:
+            self.dispMsg("Control punches need 'controls.csv' (columns Code, Points) next to event CSV!",fc=Qt.red)
+            return
+
+        if self.punchDialog is None or not self.punchDialog.isVisible():
+            self.punchDialog = PunchDialog()
+            self.punchDialog.punched.connect(self.addPunches)
+        self.punchDialog.raise_()
+        self.punchDialog.activateWindow()
+
+    def addPunches(self,ID:int,codes:list):
+        """ Add control punches of runner and update runner's score """
+
+        if ID not in self.df.index:
+            self.dispMsg(f'ID {ID} not found!',fc=Qt.red)
+            return
+
+        self.engine.submit(epo_engine.addPunches,ID,codes,self.controls,
+            callback=lambda result: self.punchesAdded(ID,result))
+
+    def punchesAdded(self,ID:int,result):
+
+        if result is None:
+            self.dispMsg(f'ID {ID} not found!',fc=Qt.red)
+            return
+
+        punched,unknown = result
+        if unknown:
+            self.dispMsg(f"Unknown controls: {', '.join(unknown)}",fc=Qt.red)
+        self.dispMsg(f"{self.df.loc[ID,'Name']}",fc=Qt.darkGreen,fw=QFont.Bold,end='')
+        self.dispMsg(f" ({ID}) punched {len(punched)} controls, score ",fc=Qt.darkGreen,end='')
+        self.dispMsg(f"{self.df.loc[ID,'Score']:.0f}",fc=Qt.darkGreen,fw=QFont.Bold)
+
     def setScore(self,ID):
 
         score, done = QInputDialog.getInt(self,'Input dialog',f"Set score of runner {self.df.loc[ID,'Name']} ({ID}):")
@@ -769,9 +1633,7 @@ class EPOGUI(QMainWindow):
             self.dispMsg(f"{int(self.df.loc[ID,'Score'])}",fc=Qt.darkGreen,fw=QFont.Bold,end='')
             self.dispMsg(f" to ",fc=Qt.darkGreen,end='')
             self.dispMsg(f"{score}",fc=Qt.darkGreen,fw=QFont.Bold)
-            self.df.loc[ID,'Score'] = score
-            self.updateTable()
-            self.saveCSV()
+            self.engine.submit(epo_engine.setValues,[ID],{'Score':score})
 
 
     def newCSV(self):
@@ -785,9 +1647,9 @@ class EPOGUI(QMainWindow):
             # Define empty dataframe
             newcols = self.cols.copy()
             newcols.remove('ID')
-            self.df = pd.DataFrame(columns=newcols)
-            self.df.index.name = 'ID'
-            self.updateTable()
+            df = pd.DataFrame(columns=newcols)
+            df.index.name = 'ID'
+            self.setDF(df)
         else:
             self.dispMsg(f"File '{filename}' not created!",fc=Qt.red)
             self.dispMsg(f"Filename should not be empty and must end with '.csv' extension!",fc=Qt.red)
@@ -800,156 +1662,319 @@ class EPOGUI(QMainWindow):
             self.dispMsg(f"New CSV file '{filename}' selected!",fc=Qt.darkGreen)
             self.loadCSV()
 
+    def exportResults(self):
+        """ Export results into IOF XML 3.0 or JSON (see `epo_export`) """
+
+        base = os.path.splitext(self.csvFile)[0]
+        filename,_ = QFileDialog.getSaveFileName(self,'Export results',f"{base}.xml",
+            "IOF XML 3.0 (*.xml);;JSON (*.json)")
+        if filename == '': return
+
+        try:
+            exportResults(self.df,filename,
+                event = os.path.basename(base),
+                date = eventDate(self.csvFile))
+        except (OSError,ValueError) as e:
+            self.dispMsg(f"Export failed: {e}",fc=Qt.red)
+            return
+        self.dispMsg(f"Results exported into '{filename}'",fc=Qt.darkGreen)
+
     def loadCSV(self):
-        """ Load CSV file into table """
+        """ Load CSV file into table
+
+        File is parsed in chunks by `CSVLoader`, rows are shown as they arrive
+        and the dataframe is set once the whole file is parsed.
+        """
 
         if not os.path.isfile(self.csvFile):
             self.dispMsg(f"File '{self.csvFile}' not found!",fc=Qt.red)
             return
 
+        # Stop loading of previous file
+        if self.loader is not None:
+            self.loader.requestInterruption()
+            self.loader.wait()
+        # Apply changes queued for previous file
+        self.stopEngine()
+
         # Clear table
         self.table.setRowCount(0)
+        self.tableRows = {}
+        self.tableOrder = None
+        self.loadedChunks = []
+
+        # Use cache of parsed file if the file was not changed since
+        df = loadCache(self.csvFile,self.cols)
+        if df is not None:
+            self.loader = None
+            self.setDF(df)
+            self.dispMsg(f"Loaded {len(self.df)} runners from cache of '{self.csvFile}'")
+            return
 
-        # Load file
-        df = pd.read_csv(self.csvFile)
+        self.setLoading(True)
 
-        # Check if file contains all required columns
-        if not {'Name'}.issubset(df.columns):
-            self.dispMsg(f"CSV file must contain at least following columns: Name",fc=Qt.red)
-            return
+        self.loader = CSVLoader(self.csvFile,self.cols)
+        self.loader.chunkLoaded.connect(self.csvChunkLoaded)
+        self.loader.loaded.connect(self.csvLoaded)
+        self.loader.failed.connect(self.csvLoadFailed)
+        self.loader.start()
+
+    def csvChunkLoaded(self,chunk:pd.DataFrame,pos:int,total:int):
+
+        if self.sender() is not self.loader: return
+
+        self.loadedChunks.append(chunk)
+        self.drawingTable = True
+        self.addRows(chunk,self.display.format(chunk))
+        self.tableOrder = None
+        self.drawingTable = False
+        self.progressBar.setValue(int(100*pos/max(total,1)))
+
+    def csvLoaded(self):
 
-        if not {'ID'}.issubset(df.columns):
-            df['ID'] = np.arange(1,len(df)+1)
+        if self.sender() is not self.loader: return
 
-        # Set column 'ID' as index
-        df = df.set_index('ID')
+        if self.loadedChunks:
+            df = pd.concat(self.loadedChunks)
+        else:
+            # Only header in the file
+            newcols = self.cols.copy()
+            newcols.remove('ID')
+            df = pd.DataFrame(columns=newcols)
+            df.index.name = 'ID'
+        self.loadedChunks = []
 
-        # Add missing columns
-        for col in self.cols:
-            if col != 'ID':
-                if not {col}.issubset(df.columns): df[col] = np.nan
+        self.setDF(df)
+        self.setLoading(False)
+        self.dispMsg(f"Loaded {len(self.df)} runners from '{self.csvFile}'")
 
-        # Convert string times to seconds
-        df['Start'] = df['Start'].apply(lambda x: str2sec(x))
-        df['Finish'] = df['Finish'].apply(lambda x: str2sec(x))
-        df['Fee'] = df['Fee'].apply(lambda x: int(float(x)) if isNumber(x) else np.nan)
+        # Build cache for next opening of unchanged file
+        self.writer.submit(self.csvFile,self.df.copy(),writeCSV=False)
 
+    def setDF(self,df:pd.DataFrame):
+        """ Replace dataframe by newly loaded one, pass it to new engine and
+        redraw table """
+
+        self.stopEngine()
         self.df = df
-        self.updateTimeAndLoss()
+        self.loadControls()
 
-        self.drawTable()
+        # Engine saves and publishes into file it was created for and records
+        # changes into journal of this station
+        try:
+            journal = Journal(journalFilename(self.csvFile,self.station),self.station)
+        except OSError as e:
+            self.dispMsg(f"Journal could not be opened: {e}",fc=Qt.red)
+            journal = None
+        self.engine = RaceEngine(self.df,self.csvFile,publish=self.saveCSV,journal=journal,
+            replica=self.replicaServer,sortBy=self.sortBy)
+        self.engine.changed.connect(self.engineChanged)
+        self.setSnapshot(self.engine.snapshot())
+        self.engine.start()
+
+        # Punches of devices read while loading
+        punches, self.devicePunches = self.devicePunches, []
+        for ID,now in punches:
+            self.punch(ID,now)
+        # Changes of primary received while loading
+        self.applyReplicated()
+
+    def stopEngine(self):
+
+        if self.engine is not None:
+            self.engine.stop()
+            self.engine = None
+
+    def setSnapshot(self,snapshot,redraw:bool=True):
+        """ Take snapshot of the engine, redraw table now or later together
+        with following snapshots (`redraw=False`) """
+
+        self.df = snapshot.df
+        self.leaders = snapshot.leaders
+        self.updateLeaderTime()
 
-    def saveCSV(self):
-        """ Save data from the table into CSV file """
+        # Leaderboard diffs its page itself, it is not redrawn as a whole
+        if self.leaderboard is not None:
+            self.leaderboard.updateData(self.df)
 
-        csvdf = self.getSortedDF(self.df)
+        if redraw:
+            self.redraw()
+        elif not self.redrawPending:
+            self.redrawPending = True
+            QTimer.singleShot(REDRAW_INTERVAL,self.redraw)
 
-        csvdf['Start'] = csvdf['Start'].apply(lambda x: sec2str(x))
-        csvdf['Finish'] = csvdf['Finish'].apply(lambda x: sec2str(x))
-        csvdf['Time'] = csvdf['Time'].apply(lambda x: sec2str(x))
-        csvdf['Loss'] = csvdf['Loss'].apply(lambda x: sec2str(x,add_sign=True))
+    def redraw(self):
 
-        csvdf.to_csv(self.csvFile)
+        self.redrawPending = False
+        self.drawTable()
 
-        self.saveHTML()
+        if self.plotBox is not None:
+            self.plotBox.updateData(self.df)
 
-    def saveHTML(self):
+    def engineChanged(self,snapshot,results:list,seq:int):
+        """ Show new snapshot and report results of applied commands """
 
-        htmlfile = f"{os.path.splitext(self.csvFile)[0]}.html"
+        if self.sender() is not self.engine: return
 
-        old_sort_by = self.sortBy
+        if snapshot is not None:
+            self.setSnapshot(snapshot,redraw=False)
+        for callback,result in results:
+            if isinstance(result,Exception):
+                self.dispMsg(f"Change failed: {result}",fc=Qt.red)
+            elif callback is not None:
+                callback(result)
 
-        self.sortBy = 'Rank'
+    def csvLoadFailed(self,error:str):
 
-        htmldf = self.getSortedDF(self.df)
+        if self.sender() is not self.loader: return
 
-        htmldf['Start'] = htmldf['Start'].apply(lambda x: sec2str(x))
-        htmldf['Finish'] = htmldf['Finish'].apply(lambda x: sec2str(x))
-        htmldf['Time'] = htmldf['Time'].apply(lambda x: sec2str(x))
-        htmldf['Loss'] = htmldf['Loss'].apply(lambda x: sec2str(x,add_sign=True))
-        htmldf.insert(0, 'Rank', range(1, 1 + len(htmldf)))
+        self.loadedChunks = []
+        self.table.setRowCount(0)
+        self.tableRows = {}
+        self.tableOrder = None
+        self.setLoading(False)
+        self.dispMsg(f"Loading of '{self.csvFile}' failed: {error}",fc=Qt.red)
+
+    def setLoading(self,loading:bool):
+        """ Show progress and disable input while CSV is being loaded """
+
+        self.loading = loading
+        self.enableInput()
+        self.progressBar.setValue(0)
+        self.progressBar.setVisible(loading)
+
+    def enableInput(self):
+        """ Disable input while CSV is being loaded, standby station only
+        shows changes of primary """
+
+        standby = self.replicaClient is not None
+        editable = not self.loading and not standby
+        for widget in [self.qleID,self.qleNewName,self.qleNewNote,self.btnAdd,self.btnUpdate]:
+            widget.setEnabled(editable)
+        for widget in [self.qleFilter,self.cmbSort]:
+            widget.setEnabled(not self.loading)
+        for act in [self.batchRegisterAct,self.punchesAct]:
+            act.setEnabled(not standby)
+        self.takeOverAct.setEnabled(standby)
+        self.saveCSVAct.setEnabled(not self.loading)
+        self.table.setEditTriggers(self.tableEditTriggers if editable
+            else QtWidgets.QAbstractItemView.NoEditTriggers)
+
+    def saveCSV(self,df:pd.DataFrame=None,csvFile:str=None,sortBy:str=None):
+        """ Save data from the table (or snapshot `df`) into CSV file
+
+        Only snapshot is taken here, it is formatted and atomically written by
+        `self.writer` in background. Called also from engine thread (with
+        `sortBy` of the engine), so it must not touch widgets and GUI state.
+        """
 
-        htmldf.to_html(
-            htmlfile,
-            columns=('Rank','Name','Gender','Start','Finish','Time','Loss','Score','Note'),
-            index=False,
-        )
+        if df is None: df = self.df
+        if csvFile is None: csvFile = self.csvFile
+        if sortBy is None: sortBy = self.sortBy
 
-        # also save a CSV version of the same table (same columns)
-        csvfile = os.path.splitext(htmlfile)[0] + '.csv'
-        htmldf.to_csv(
-            csvfile,
-            columns=('Rank','Name','Gender','Start','Finish','Time','Loss','Score','Note'),
-            index=False,
-            encoding='utf-8'
-        )
+        self.writer.submit(csvFile,sortDF(df,sortBy).copy())
 
-        try:
-            session = ftplib.FTP(
-            ftp_credentials.HOST,
-            ftp_credentials.USER,
-            ftp_credentials.PSWD
-            )
-            # upload HTML
-            with open(htmlfile,'rb') as file:
-                session.storbinary('STOR epo.html', file)
-            # upload CSV
-            with open(csvfile,'rb') as file:
-                session.storbinary('STOR epo.csv', file)
-            session.quit()
-        except:
-            print("FTP upload failed!")
-            pass
+        self.saveHTML(df,csvFile)
 
-        self.sortBy = old_sort_by
+    def saveHTML(self,df:pd.DataFrame=None,csvFile:str=None):
+        """ Pass snapshot of results to report pipeline (HTML, CSV, PDF, PNG)
 
+        Rendering and FTP upload run in background, see `epo_reports`.
+        """
 
-    def getSortedDF(self,df):
+        if df is None: df = self.df
+        if csvFile is None: csvFile = self.csvFile
 
-        # Sort dataframe
-        if self.sortBy == 'ID':
-            df = df.sort_index()
-        elif self.sortBy == 'Name':
-            df = df.sort_values(by='Name')
-        elif self.sortBy == 'Rank':
-            df = df.sort_values(by=['Score','Time'],ascending=[False,True])
+        snapshot = ResultsSnapshot(
+            version = next(self.reportVersion),
+            basename = os.path.splitext(csvFile)[0],
+            results = df.iloc[rankOrder(df)].copy()
+        )
+        self.reports.submit(snapshot)
+        self.server.publish(snapshot)
+        standings = self.standings
+        if standings is not None:
+            standings.publish(snapshot.results,snapshot.version)
+
+    def toggleResultsServer(self,start:bool):
+        """ Start/stop local HTTP server with live standings """
+
+        if start:
+            try:
+                self.server.start()
+            except OSError as e:
+                self.dispMsg(f"Results server could not be started: {e}",fc=Qt.red)
+                self.resultsServerAct.setChecked(False)
+                return
+            self.dispMsg(f"Results server running at ",fc=Qt.darkGreen,end='')
+            self.dispMsg(self.server.url,fc=Qt.darkGreen,fw=QFont.Bold)
+            if self.df is not None and not self.df.empty:
+                self.saveHTML()
         else:
-            df = self.df
+            self.server.stop()
+            self.dispMsg("Results server stopped!",fc=Qt.darkYellow)
+
+    def toggleSharedStandings(self,share:bool):
+        """ Start/stop publishing standings into shared memory """
+
+        if share:
+            try:
+                self.standings = StandingsWriter()
+            except (OSError,ValueError) as e:
+                self.dispMsg(f"Shared standings could not be created: {e}",fc=Qt.red)
+                self.shareStandingsAct.setChecked(False)
+                return
+            self.dispMsg(f"Standings shared in memory '{self.standings.name}'",fc=Qt.darkGreen)
+            if self.df is not None and not self.df.empty:
+                self.saveHTML()
+        elif self.standings is not None:
+            standings,self.standings = self.standings,None
+            standings.close()
+            self.dispMsg("Sharing of standings stopped!",fc=Qt.darkYellow)
 
-        return df
+    def getSortedDF(self,df):
+
+        return sortDF(df,self.sortBy)
 
     def qleID_changed(self,ID:str):
+        """ Show candidate runners and highlight runner in table (no redraw) """
 
-        try:
-            ID = int(ID)
-        except:
-            ID = ''
+        if self.df is None or self.loading: return
+
+        self.table.clearSelection()
+        self.idModel.clear()
 
+        if ID == '':
+            self.btnOK.setText(" N/A")
+            self.btnOK.setEnabled(False)
+            return
+
+        # Index is rebuilt only when runners were added or removed (every
+        # snapshot of the engine has its own copy of the index)
+        if self.idIndex is None or not self.idIndex.index.equals(self.df.index):
+            self.idIndex = IDPrefixIndex(self.df.index)
+
+        candidates = self.idIndex.find(ID)
+        if candidates:
+            runners = self.df.loc[candidates]
+            states = getPunchState(runners['Start'],runners['Finish'])
+            for cID,name,state in zip(candidates,runners['Name'],states):
+                item = QStandardItem(f"{cID}  {name}  {state}")
+                item.setData(str(cID),Qt.UserRole)
+                self.idModel.appendRow(item)
+
+        ID = int(ID)
         if ID not in self.df.index:
             self.btnOK.setText(" N/A")
             self.btnOK.setEnabled(False)
-            if ID == '':
-                self.drawTable()
-            else:
-                self.table.setRowCount(0)
             return
 
-        start = self.df.loc[ID,'Start']
-        finish = self.df.loc[ID,'Finish']
-        if np.isnan(start):
-            # Runner not started yet -> start!
-            self.btnOK.setText(" START!")
-        elif np.isnan(finish):
-            # Not finished yet -> finish!
-            self.btnOK.setText(" FINISH!")
-        else:
-            # Runner is already in finish -> print results
-            self.btnOK.setText(" PRINT!")
+        self.btnOK.setText(" "+getPunchState(self.df.loc[ID,'Start'],self.df.loc[ID,'Finish']))
         self.btnOK.setEnabled(True)
 
-        df = self.df.loc[[ID]]
-        self.drawTable(df)
-
+        if ID in self.tableRows:
+            self.table.selectRow(self.tableRows[ID])
+            self.table.scrollToItem(self.table.item(self.tableRows[ID],0))
 
     def setMaxScore(self):
 
@@ -1001,41 +2026,38 @@ class EPOGUI(QMainWindow):
             self.selectedRow = 0
             self.table.selectRow(self.selectedRow)
 
-    def addRow(self,row,id,name,gender,start,finish,time,loss,score,note,registered,fee):
+    def addRow(self,row,cells:dict):
+        """ Insert row with preformatted `cells` `{column: text}` """
 
         r = row
-        id = str(id)
-        start = sec2str(start) if not pd.isna(start) else ''
-        finish = sec2str(finish) if not pd.isna(finish) else ''
-        time = sec2str(time) if not pd.isna(time) else ''
-        score = str(int(float(score))) if not pd.isna(score) else ''
-        note = note if not pd.isna(note) else ''
-        registered = registered if not pd.isna(registered) else False
-        fee = str(int(float(fee))) if not pd.isna(fee) and isNumber(fee) else ''
-
-        if pd.isna(gender): gender = ''
-
-        if not pd.isna(loss):
-            sign = '+' if loss>=0 else '-'
-            loss = sign + sec2str(np.abs(loss))
-        else:
-            loss = ''
 
         self.table.insertRow(r)
         self.table.setRowHeight(r,15)
-        self.table.setItem(r,self.cols.index('ID'),QTableWidgetItem(id))
-        self.table.setItem(r,self.cols.index('Name'),QTableWidgetItem(name))
-        self.table.setItem(r,self.cols.index('Gender'),QTableWidgetItem(gender))
-        self.table.setItem(r,self.cols.index('Start'),QTableWidgetItem(start))
-        self.table.setItem(r,self.cols.index('Finish'),QTableWidgetItem(finish))
-        self.table.setItem(r,self.cols.index('Time'),QTableWidgetItem(time))
-        self.table.setItem(r,self.cols.index('Loss'),QTableWidgetItem(loss))
-        self.table.setItem(r,self.cols.index('Score'),QTableWidgetItem(score))
-        self.table.setItem(r,self.cols.index('Note'),QTableWidgetItem(note))
-        self.table.setItem(r,self.cols.index('Registered'),QTableWidgetItem(str(registered)))
-        self.table.setItem(r,self.cols.index('Fee'),QTableWidgetItem(fee))
+        for c,col in enumerate(self.cols):
+            self.table.setItem(r,c,QTableWidgetItem(cells[col]))
 
         self.table.item(r,self.cols.index('ID')).setFlags(Qt.ItemIsEnabled)
+        for col in self.rankCols+self.lossCols[1:]:
+            self.table.item(r,self.cols.index(col)).setFlags(Qt.ItemIsEnabled)
+
+        for col in ['ID','Gender','Score']+self.rankCols:
+            self.table.item(r,self.cols.index(col)).setTextAlignment(Qt.AlignHCenter)
+
+        self.setRowColors(r,cells)
+
+    def updateRow(self,row,cells:dict):
+        """ Replace text of existing row by preformatted `cells` """
+
+        for c,col in enumerate(self.cols):
+            item = self.table.item(row,c)
+            if item.text() != cells[col]: item.setText(cells[col])
+        self.setRowColors(row,cells)
+
+    def setRowColors(self,r,cells:dict):
+        """ Color row by gender and registration of runner """
+
+        gender = cells['Gender']
+        registered = cells['Registered'] == 'True'
 
         bclr = QBrush(QColor(255,255,255))
         if gender == 'M':
@@ -1048,39 +2070,48 @@ class EPOGUI(QMainWindow):
             self.table.item(r,i).setBackground(bclr)
             self.table.item(r,i).setForeground(fclr)
 
-        for i in [0,2,7]:
-            self.table.item(r,i).setTextAlignment(Qt.AlignHCenter)
-
     def drawTable(self,df=None):
-    
+        """ Show runners of `df` (all if None), existing rows are reused and
+        only rows of changed or moved runners are rewritten """
+
         if df is None: df = self.df
 
         start = timer()
 
         self.drawingTable = True
 
-        # Clear table
-        self.table.setRowCount(0)
-
         df = self.getSortedDF(df)
 
-        # Read dataframe and store data into table
-        for r,(i,row) in enumerate(df.iterrows()):
-
-            self.addRow(
-                row = r,
-                id = i,
-                name = row['Name'],
-                gender = row['Gender'],
-                start = row['Start'],
-                finish = row['Finish'],
-                time = row['Time'],
-                loss = row['Loss'],
-                score = row['Score'],
-                note = row['Note'],
-                registered = row['Registered'],
-                fee = row['Fee']
-            )
+        # Format only cells which changed since last drawing
+        changed = self.display.update(self.df)
+
+        if self.tableOrder is not None and len(df) == len(self.tableOrder) == self.table.rowCount():
+            # Rows whose runner changed, moved (e.g. new rank) or was edited
+            moved = df.index.to_numpy() != self.tableOrder.to_numpy()
+            dirty = moved | df.index.isin(changed) | df.index.isin(list(self.staleRows))
+            rows = np.flatnonzero(dirty)
+            text = self.display.get(df.index[rows])
+            # Every changed item would resize columns fitted to contents,
+            # view is notified once for all rewritten rows
+            model = self.table.model()
+            model.blockSignals(True)
+            try:
+                for i,r in enumerate(rows):
+                    self.updateRow(r,{col: text[col][i] for col in self.cols})
+            finally:
+                model.blockSignals(False)
+            if len(rows):
+                model.dataChanged.emit(model.index(int(rows[0]),0),
+                    model.index(int(rows[-1]),model.columnCount()-1))
+            if moved.any():
+                self.tableRows = dict(zip(df.index,range(len(df))))
+        else:
+            # Runners were added or removed (or filtered), rows are rebuilt
+            self.table.setRowCount(0)
+            self.tableRows = {}
+            self.addRows(df,self.display.get(df.index))
+        self.tableOrder = df.index.copy()
+        self.staleRows = set()
 
         end = timer()
 
@@ -1088,11 +2119,21 @@ class EPOGUI(QMainWindow):
 
         # self.dispMsg(f"Table drawn in {end-start}")
 
+    def addRows(self,df:pd.DataFrame,text:dict):
+        """ Append rows of `df` at the end of the table, `text` holds
+        formatted cells `{column: array}` (see `epo_core.DisplayCache`) """
+
+        start = self.table.rowCount()
+        for r,ID in enumerate(df.index):
+            self.tableRows[ID] = start+r
+            self.addRow(start+r,{col: text[col][r] for col in self.cols})
+
     def updateTable(self):
+        """ Recompute standings of all runners (table is redrawn with new
+        snapshot of the engine) """
 
-        if not self.df.empty:
-            self.updateTimeAndLoss()
-        self.drawTable()
+        if self.engine is not None:
+            self.engine.submit(epo_engine.recompute)
 
     def sortTable(self):
 
@@ -1105,54 +2146,61 @@ class EPOGUI(QMainWindow):
 
         item = self.table.item(row,col)
         ID = int(self.table.item(row,self.cols.index('ID')).text())
+        # Text of cell is replaced by value of the engine on next drawing
+        self.staleRows.add(ID)
+
+        column = self.cols[col]
+        # Invalid value is not passed to the engine, table is only redrawn
+        values = {}
 
         if col == self.cols.index('ID'):
             self.dispMsg("Manual changing of ID may lead to unexpected behaviour!",fc=Qt.red)
 
         elif col in [self.cols.index('Name'),self.cols.index('Note')]:
-            self.df.loc[ID,self.cols[col]] = item.text()
+            values[column] = item.text()
 
         elif col == self.cols.index('Gender'):
             if not (item.text()=="M" or item.text()=="W"):
                 self.dispMsg("Gender should be 'M' or 'W'!",fc=Qt.darkYellow)
-            self.df.loc[ID,self.cols[col]] = item.text()
+            values[column] = item.text()
 
         elif col in [self.cols.index('Start'),self.cols.index('Finish'),self.cols.index('Time'),self.cols.index('Loss')]:
             if item.text() == '':
-                self.df.loc[ID,self.cols[col]] = np.nan
+                values[column] = np.nan
             else:
                 time = str2sec(item.text())
                 if np.isnan(time):
                     self.dispMsg(f"Unexpected format of time (should be 'HH:MM:SS') not '{item.text()}'!",fc=Qt.red)
                 else:
-                    self.df.loc[ID,self.cols[col]] = time
+                    values[column] = time
         
         elif col == self.cols.index('Score'):
             if item.text() == '':
-                self.df.loc[ID,self.cols[col]] = np.nan
+                values[column] = np.nan
             else:
                 if not item.text().isnumeric():
                     self.dispMsg(f"Score must be a number! Not '{item.text()}'.",fc=Qt.red)
                 else:
-                    self.df.loc[ID,self.cols[col]] = float(item.text())
+                    values[column] = float(item.text())
         
         elif col == self.cols.index('Fee'):
             if item.text() == '':
-                self.df.loc[ID,self.cols[col]] = np.nan
+                values[column] = np.nan
             else:
                 if not item.text().isnumeric():
                     self.dispMsg(f"Fee must be a number! Not '{item.text()}'.",fc=Qt.red)
                 else:
-                    self.df.loc[ID,self.cols[col]] = float(item.text())
+                    values[column] = float(item.text())
 
-        self.updateTimeAndLoss()
-        self.updateTable()
-        self.saveCSV()
+        if values:
+            self.engine.submit(epo_engine.setValues,[ID],values)
+        else:
+            self.drawTable()
         
     def tableContextMenu(self,point:QPoint):
         """ Show context menu after right click on table """
 
-        if self.table.rowCount()==0: return
+        if self.table.rowCount()==0 or self.loading: return
 
         # Get row and column of clicked cell
         row = self.table.currentRow()
@@ -1172,6 +2220,9 @@ class EPOGUI(QMainWindow):
             uregisterAct = menu.addAction('Un&register')
         setScoreAct = menu.addAction('Set &score')
         removeAct = menu.addAction('&Delete row')
+        # Standby station only shows changes of primary
+        for act in [registerAct,uregisterAct,setScoreAct,removeAct]:
+            if act is not None: act.setEnabled(self.replicaClient is None)
         hideColAct = menu.addAction('&Hide column')
         showAllColsAct = menu.addAction('Show &all columns')
 
@@ -1186,9 +2237,7 @@ class EPOGUI(QMainWindow):
             self.registerRunner(ID)
             
         elif action == uregisterAct:
-            self.df.loc[ID,'Registered'] = False
-            self.updateTable()
-            self.saveCSV()
+            self.engine.submit(epo_engine.setValues,[ID],{'Registered':False})
 
         elif action == setScoreAct:
             self.setScore(ID)
@@ -1199,9 +2248,7 @@ class EPOGUI(QMainWindow):
                 self.dispMsg("Runner ",fc=Qt.red,end='')
                 self.dispMsg(self.df.loc[ID,'Name'],fc=Qt.red,fw=QFont.Bold,end='')
                 self.dispMsg(" removed!",fc=Qt.red)
-                self.df = self.df.drop(ID)
-                self.updateTable()
-                self.saveCSV()
+                self.engine.submit(epo_engine.removeRunner,ID)
             else:
                 self.dispMsg("Removing cancelled!",fc=Qt.darkYellow)
 
@@ -1213,11 +2260,13 @@ class EPOGUI(QMainWindow):
 
     def showAllColumns(self):
         for i in range(self.table.columnCount()):
-            if i != self.cols.index('Registered'):
+            if i not in [self.cols.index('Registered'),self.cols.index('Punches')]:
                 self.table.setColumnHidden(i,False)
 
     def cmbSortChanged(self,sortBy):
         self.sortBy = sortBy
+        # CSV saved by the engine follows the order of the table
+        if self.engine is not None: self.engine.sortBy = sortBy
         self.sortTable()
 
     def toggleOutputVisibility(self,setVisible=None):
@@ -1279,11 +2328,35 @@ class EPOGUI(QMainWindow):
         return super().keyPressEvent(a0)
 
     def closeEvent(self, a0: QtGui.QCloseEvent) -> None:
-        
+
+        # Apply queued changes, write last state and publish last results
+        # before exit
+        self.disconnectDevices()
+        if self.replicaClient is not None:
+            self.replicaClient.stop()
+        self.stopEngine()
+        if self.replicaServer is not None:
+            self.replicaServer.stop()
+        self.writer.close()
+        self.reports.close()
+        self.receipts.close()
+        self.server.stop()
+        if self.standings is not None:
+            self.standings.close()
+        if self.plotBox is not None:
+            self.plotBox.close()
+        if self.leaderboard is not None:
+            self.leaderboard.close()
+        if self.batchDialog is not None:
+            self.batchDialog.close()
+        if self.punchDialog is not None:
+            self.punchDialog.close()
+
         return super().closeEvent(a0)
 
 def main():
-    
+
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     app.setStyle(QStyleFactory.create("Cleanlooks"))
     app.setStyle('Fusion')
@@ -0,0 +1,286 @@
+"""
+EPO_OB publishing
+=================
+Upload of rendered results to publish targets (web host over FTP, shared
+folder of commentator, mirror accepting HTTP PUT).
+
+Every target uploads in its own thread, so one slow or unreachable target
+never delays the others, and every network operation of FTP and HTTP targets
+is limited by timeout of its target. Files submitted while a target is busy
+are merged with files waiting for it and uploaded together (newest content
+only).
+
+Targets are configured in `ftp_credentials.py`. It either defines `HOST`,
+`USER` and `PSWD` of single FTP server or list `TARGETS`, e.g.:
+
+    TARGETS = [
+        {'type': 'ftp',  'host': 'ftp.example.com', 'user': 'epo', 'password': '***'},
+        {'type': 'dir',  'path': '//commentator/share/epo'},
+        {'type': 'http', 'url': 'http://192.168.1.10:8080/epo/', 'timeout': 5},
+    ]
+
+by vovo
+
+https://github.com/vojtavozda/EPO_OB
+
+"""
+
+import os
+import ftplib
+import threading
+import urllib.request
+from urllib.parse import quote
+
+from epo_core import writeAtomic
+
+# Timeout of network operations of one target [s]
+DEFAULT_TIMEOUT = 30
+# Delay before failed upload is retried [s]
+RETRY_INTERVAL = 10
+
+CONTENT_TYPES = {
+    '.html':    'text/html; charset=utf-8',
+    '.csv':     'text/csv; charset=utf-8',
+    '.json':    'application/json',
+    '.pdf':     'application/pdf',
+    '.png':     'image/png',
+}
+
+class PublishTarget:
+    """ Base of publish targets, uploads submitted files in its own thread """
+
+    def __init__(self,name:str,timeout:float=DEFAULT_TIMEOUT):
+
+        self.name = name
+        self.timeout = timeout
+
+        # Files `{remote_name: local_path}` waiting for upload
+        self.pending = {}
+        self.error = None               # error of last upload (None if succeeded)
+        self.errors = []                # failures not taken by `takeErrors()` yet
+        self.closed = False
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def submit(self,files:dict):
+        """ Queue files `{remote_name: local_path}` for upload """
+
+        with self.cond:
+            if self.closed: return
+            self.queue(files)
+            self.cond.notify()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run,name=f'Publish {self.name}',daemon=True)
+                self.thread.start()
+
+    def queue(self,files:dict):
+        """ Add files to pending ones (called with lock held)
+
+        Files keep order of their last submission (e.g. full snapshot of
+        results feed before the feed), resubmitted file moves to the end.
+        """
+
+        for remote,local in files.items():
+            self.pending.pop(remote,None)
+            self.pending[remote] = local
+
+    def run(self):
+
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if not self.pending: break
+                files, self.pending = self.pending, {}
+
+            try:
+                self.upload(files)
+                with self.cond:
+                    self.error = None
+            except Exception as e:
+                self.disconnect()
+                with self.cond:
+                    # Retries of the same outage are reported once
+                    if self.error is None:
+                        self.errors.append(f"Upload to {self.name} failed: {e}")
+                    self.error = e
+                    if self.closed: break
+                    # Retry later with files submitted meanwhile (after
+                    # the failed ones)
+                    files, self.pending = self.pending, files
+                    self.queue(files)
+                    self.cond.wait(RETRY_INTERVAL)
+
+        self.disconnect()
+
+    def takeErrors(self):
+        """ Return failures of uploads since last call """
+
+        with self.cond:
+            errors, self.errors = self.errors, []
+        return errors
+
+    def close(self,wait:bool=True):
+        """ Stop thread after pending files are uploaded (if `wait`) """
+
+        with self.cond:
+            self.closed = True
+            if not wait: self.pending = {}
+            self.cond.notify()
+
+    def join(self):
+        """ Wait for thread, at most `timeout` """
+
+        if self.thread is not None:
+            self.thread.join(self.timeout)
+
+    def upload(self,files:dict):
+        raise NotImplementedError
+
+    def disconnect(self):
+        pass
+
+class FTPTarget(PublishTarget):
+    """ FTP server, connection is kept open between uploads """
+
+    def __init__(self,host:str,user:str,password:str,directory:str='',timeout:float=DEFAULT_TIMEOUT):
+
+        super().__init__(f"ftp://{host}/{directory}",timeout)
+        self.host = host
+        self.user = user
+        self.password = password
+        self.directory = directory
+        self.session = None
+
+    def connect(self):
+
+        if self.session is None:
+            self.session = ftplib.FTP(self.host,self.user,self.password,timeout=self.timeout)
+            if self.directory: self.session.cwd(self.directory)
+        return self.session
+
+    def upload(self,files:dict):
+
+        try:
+            self.store(files)
+        except (OSError,EOFError,ftplib.error_temp):
+            # Server closed idle connection -> reconnect once
+            self.disconnect()
+            self.store(files)
+
+    def store(self,files:dict):
+        """ Upload files under temporary names and rename them, so web
+        clients never download partially uploaded file """
+
+        session = self.connect()
+        for remote,local in files.items():
+            with open(local,'rb') as fh:
+                session.storbinary(f'STOR {remote}.tmp',fh)
+            try:
+                session.rename(f'{remote}.tmp',remote)
+            except ftplib.error_perm:
+                # Some servers do not rename over existing file
+                session.delete(remote)
+                session.rename(f'{remote}.tmp',remote)
+
+    def disconnect(self):
+
+        if self.session is None: return
+        try:
+            self.session.quit()
+        except Exception:
+            self.session.close()
+        self.session = None
+
+class DirectoryTarget(PublishTarget):
+    """ Local (or shared network) directory, files are replaced atomically
+
+    Timeout is not applied, file operations block until the OS gives up
+    (other targets are not delayed, they upload in their own threads).
+    """
+
+    def __init__(self,path:str,timeout:float=DEFAULT_TIMEOUT):
+
+        super().__init__(path,timeout)
+        self.path = path
+
+    def upload(self,files:dict):
+
+        os.makedirs(self.path,exist_ok=True)
+        for remote,local in files.items():
+            with open(local,'rb') as fh:
+                writeAtomic(os.path.join(self.path,remote),fh.read())
+
+class HTTPTarget(PublishTarget):
+    """ HTTP server accepting `PUT <url><remote_name>` """
+
+    def __init__(self,url:str,headers:dict=None,timeout:float=DEFAULT_TIMEOUT):
+
+        super().__init__(url,timeout)
+        self.url = url if url.endswith('/') else f"{url}/"
+        self.headers = headers or {}
+
+    def upload(self,files:dict):
+
+        for remote,local in files.items():
+            with open(local,'rb') as fh:
+                data = fh.read()
+            ctype = CONTENT_TYPES.get(os.path.splitext(remote)[1],'application/octet-stream')
+            request = urllib.request.Request(self.url+quote(remote),data=data,method='PUT',
+                headers={'Content-Type':ctype,**self.headers})
+            # Error status raises `urllib.error.HTTPError`
+            with urllib.request.urlopen(request,timeout=self.timeout) as response:
+                response.read()
+
+TARGET_TYPES = {
+    'ftp':  FTPTarget,
+    'dir':  DirectoryTarget,
+    'http': HTTPTarget,
+}
+
+def createTarget(type:str,**kwargs):
+    """ Return publish target of `type` (key of `TARGET_TYPES`) """
+
+    return TARGET_TYPES[type](**kwargs)
+
+def loadTargets():
+    """ Return publish targets configured in `ftp_credentials.py` """
+
+    try:
+        import ftp_credentials
+    except ImportError:
+        print("Publish targets are not configured (ftp_credentials.py not found)")
+        return []
+
+    config = getattr(ftp_credentials,'TARGETS',None)
+    if config is None:
+        config = [{'type':'ftp','host':ftp_credentials.HOST,
+            'user':ftp_credentials.USER,'password':ftp_credentials.PSWD}]
+    return [createTarget(**c) for c in config]
+
+class Publisher:
+    """ Fan out uploads to all targets in parallel """
+
+    def __init__(self,targets:list):
+
+        self.targets = targets
+
+    def submit(self,files:dict):
+        """ Queue files `{remote_name: local_path}` for upload to every target """
+
+        for target in self.targets:
+            target.submit(files)
+
+    def takeErrors(self):
+        """ Return failures of uploads of all targets since last call """
+
+        return [error for target in self.targets for error in target.takeErrors()]
+
+    def close(self,wait:bool=True):
+        """ Finish uploads (if `wait`), targets finish in parallel """
+
+        for target in self.targets:
+            target.close(wait)
+        if wait:
+            for target in self.targets:
+                target.join()
@@ -0,0 +1,185 @@
+"""
+EPO_OB receipts
+===============
+Result slips of finished runners.
+
+Slip is rendered as plain text for receipt printers or as small PDF and
+written into spool directory (next to event CSV, '<event>_receipts/') by a
+background thread, optionally followed by print command (e.g.
+`['lp','-d','receipts']`) called once for the whole batch. Slips submitted
+within `BATCH_DELAY` are written together and the same slip submitted again
+within `DEDUP_INTERVAL` (e.g. ID entered twice) is spooled only once, so
+printing never delays punches.
+
+by vovo
+
+https://github.com/vojtavozda/EPO_OB
+
+"""
+
+import os
+import subprocess
+import threading
+from io import BytesIO
+from time import monotonic
+from datetime import datetime
+from dataclasses import dataclass
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_pdf import FigureCanvasPdf
+
+from epo_core import sec2str, writeAtomic
+
+# Format of slips: 'txt' or 'pdf'
+RECEIPT_FORMAT = 'txt'
+# Command printing spooled files (files are appended), None to spool only
+PRINT_COMMAND = None
+# Characters per line of receipt printer
+RECEIPT_WIDTH = 32
+# Slips submitted within this interval are written as one batch [s]
+BATCH_DELAY = 0.3
+# Identical slip submitted again within this interval is dropped [s]
+DEDUP_INTERVAL = 10
+# Timeout of print command [s]
+PRINT_TIMEOUT = 30
+
+@dataclass(frozen=True)
+class Receipt:
+    """ Content of result slip (hashable, identical slips are equal) """
+
+    event: str
+    ID: int
+    name: str
+    start: float
+    finish: float
+    time: float
+    loss: float
+    rank: str
+    score: float
+
+    def lines(self):
+        """ Return (label, value) pairs of slip """
+
+        return [
+            ('Start',   sec2str(self.start)),
+            ('Finish',  sec2str(self.finish)),
+            ('Time',    sec2str(self.time)),
+            ('Loss',    sec2str(self.loss,add_sign=True)),
+            ('Rank',    self.rank),
+            ('Score',   '' if self.score != self.score else f"{self.score:.0f}"),
+        ]
+
+def renderText(receipt:Receipt,width:int=RECEIPT_WIDTH):
+    """ Return slip as UTF-8 text ending by form feed """
+
+    rule = '-'*width
+    lines = [receipt.event.center(width),rule,f"{receipt.name} ({receipt.ID})"[:width],rule]
+    lines += [f"{label}:".ljust(8)+value.rjust(width-8) for label,value in receipt.lines()]
+    lines += [rule,datetime.now().strftime('%H:%M:%S').center(width),'','','']
+    return ('\n'.join(lines)+'\f').encode('utf-8')
+
+def renderPDF(receipt:Receipt):
+    """ Return slip as PDF page of 80 mm wide receipt paper """
+
+    fig = Figure(figsize=(3.15,3.5))
+    fig.text(0.5,0.92,receipt.event,ha='center',fontsize=9)
+    fig.text(0.5,0.82,f"{receipt.name} ({receipt.ID})",ha='center',fontsize=11,weight='bold')
+    for i,(label,value) in enumerate(receipt.lines()):
+        y = 0.68-i*0.1
+        fig.text(0.08,y,label,fontsize=9)
+        fig.text(0.92,y,value,ha='right',fontsize=9,weight='bold')
+    fig.text(0.5,0.04,datetime.now().strftime('%H:%M:%S'),ha='center',fontsize=7)
+
+    buffer = BytesIO()
+    FigureCanvasPdf(fig).print_pdf(buffer)
+    return buffer.getvalue()
+
+RENDERERS = {
+    'txt':  renderText,
+    'pdf':  renderPDF,
+}
+
+class ReceiptSpool:
+    """ Render and spool slips in background thread """
+
+    def __init__(self,format:str=RECEIPT_FORMAT,command:list=PRINT_COMMAND):
+
+        self.format = format
+        self.command = command
+
+        # Slips waiting for rendering `{ID: (directory, receipt)}`, newer slip
+        # of runner replaces older one
+        self.pending = {}
+        # Recently spooled slips `{receipt: time}`
+        self.spooled = {}
+        self.errors = []                # errors not taken by `takeErrors()` yet
+        self.closed = False
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def submit(self,directory:str,receipt:Receipt):
+        """ Queue slip for spooling into `directory` """
+
+        with self.cond:
+            if self.closed: return
+            self.pending[receipt.ID] = (directory,receipt)
+            self.cond.notify()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run,name='ReceiptSpool',daemon=True)
+                self.thread.start()
+
+    def run(self):
+
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if not self.pending: return
+                # Collect slips coming in a burst into one batch
+                deadline = monotonic()+BATCH_DELAY
+                while not self.closed and monotonic() < deadline:
+                    self.cond.wait(deadline-monotonic())
+                batch, self.pending = list(self.pending.values()), {}
+
+            try:
+                self.spool(batch)
+            except Exception as e:
+                with self.cond:
+                    self.errors.append(f"Spooling of receipts failed: {e}")
+
+    def takeErrors(self):
+        """ Return errors of batches since last call """
+
+        with self.cond:
+            errors, self.errors = self.errors, []
+        return errors
+
+    def spool(self,batch:list):
+        """ Write slips of `batch` [(directory, receipt)] and print them """
+
+        now = monotonic()
+        self.spooled = {r: t for r,t in self.spooled.items() if now-t < DEDUP_INTERVAL}
+
+        files = []
+        for directory,receipt in batch:
+            if receipt in self.spooled: continue
+            os.makedirs(directory,exist_ok=True)
+            stamp = datetime.now().strftime('%H%M%S%f')
+            filename = os.path.join(directory,f"{stamp}_{receipt.ID}.{self.format}")
+            writeAtomic(filename,RENDERERS[self.format](receipt))
+            self.spooled[receipt] = now
+            files.append(filename)
+
+        if files and self.command:
+            subprocess.run(list(self.command)+files,timeout=PRINT_TIMEOUT,check=True,
+                stdout=subprocess.DEVNULL,stderr=subprocess.PIPE)
+
+    def close(self,wait:bool=True):
+        """ Stop thread after pending slips are spooled (if `wait`) """
+
+        with self.cond:
+            self.closed = True
+            if not wait: self.pending = {}
+            self.cond.notify()
+        if wait and self.thread is not None:
+            self.thread.join(PRINT_TIMEOUT)
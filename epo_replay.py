@@ -0,0 +1,219 @@
+"""
+EPO_OB replay
+=============
+Accelerated replay of a finished event for load testing of the GUI.
+
+Starts and finishes of the event are re-issued in time order through the real
+`EPOGUI.start_stop()` (including engine, table update, saving and report
+pipeline), `speed` times faster than they happened. Application clock follows
+replayed time, FTP is replaced by a stub and Qt runs offscreen. For every punch
+it measures latency (from the moment the punch was due until the GUI receives
+snapshot of the engine containing it), service time (queueing of the punch by
+the GUI) and backlog (punches due but not yet issued).
+
+Usage:
+    python epo_replay.py EPO_221004.csv --speed 10 60 300 --report replay.csv
+
+by vovo
+
+https://github.com/vojtavozda/EPO_OB
+
+"""
+
+import os
+import sys
+import types
+import argparse
+import tempfile
+from time import perf_counter
+
+os.environ.setdefault('QT_QPA_PLATFORM','offscreen')
+
+import numpy as np
+import pandas as pd
+
+class StubFTP:
+    """ Stand-in of `ftplib.FTP` which only reads uploaded files """
+
+    uploads = 0
+
+    def __init__(self,*args,**kwargs):
+        pass
+
+    def storbinary(self,cmd,fh,*args,**kwargs):
+        fh.read()
+        StubFTP.uploads += 1
+
+    def rename(self,src,dst):
+        pass
+
+    def quit(self):
+        pass
+
+def getEvents(df:pd.DataFrame):
+    """ Return dataframe of punches (Time, ID, Kind) sorted by time """
+
+    starts = df['Start'].dropna()
+    finishes = df.loc[df['Start'].notna(),'Finish'].dropna()
+    events = pd.concat([
+        pd.DataFrame({'Time':starts.to_numpy(),'ID':starts.index,'Kind':'start'}),
+        pd.DataFrame({'Time':finishes.to_numpy(),'ID':finishes.index,'Kind':'finish'}),
+    ])
+    # Start goes first if start and finish happened in the same second
+    events['Order'] = (events['Kind']=='finish').astype(int)
+    return events.sort_values(by=['Time','Order'],kind='stable').drop(columns='Order').reset_index(drop=True)
+
+class Replay:
+    """ Issue punches from QTimer callbacks at accelerated pace """
+
+    def __init__(self,app,gui,events:pd.DataFrame,speed:float):
+
+        self.app = app
+        self.gui = gui
+        self.events = events
+        self.speed = speed
+
+        self.simStart = events['Time'].iloc[0]
+        self.wallStart = None
+        # Wall clock time when each punch is due
+        self.due = None
+        self.i = 0
+        self.latency = np.full(len(events),np.nan)
+        self.service = np.full(len(events),np.nan)
+        self.backlog = np.zeros(len(events),dtype=int)
+        # Engine command of each punch, punches before `self.done` are shown
+        self.seq = np.zeros(len(events),dtype=int)
+        self.done = 0
+
+    def now(self):
+        """ Replayed time of the day in seconds (replaces `epo_ob.nowSec`) """
+
+        return int(self.simStart+(perf_counter()-self.wallStart)*self.speed)
+
+    def run(self):
+
+        from PyQt5.QtCore import QTimer
+
+        # Connected after the GUI, so it is called when snapshot is taken by the GUI
+        self.gui.engine.changed.connect(self.applied)
+
+        self.wallStart = perf_counter()
+        self.due = self.wallStart+(self.events['Time'].to_numpy(dtype=float)-self.simStart)/self.speed
+        QTimer.singleShot(0,self.step)
+        self.app.exec_()
+
+    def step(self):
+
+        from PyQt5.QtCore import QTimer
+
+        if self.i >= len(self.events):
+            # Wait for the engine to apply remaining punches
+            if self.done < len(self.events):
+                QTimer.singleShot(1,self.step)
+            else:
+                self.app.quit()
+            return
+
+        wall = perf_counter()
+        if wall < self.due[self.i]:
+            QTimer.singleShot(int((self.due[self.i]-wall)*1000),self.step)
+            return
+
+        self.backlog[self.i] = np.searchsorted(self.due,wall,side='right')-self.i
+        self.gui.qleID.setText(str(self.events['ID'].iloc[self.i]))
+        self.gui.start_stop()
+        self.seq[self.i] = self.gui.engine.submitted
+        self.service[self.i] = perf_counter()-wall
+        self.i += 1
+
+        # Let Qt process other events (timers, repaints) between punches
+        QTimer.singleShot(0,self.step)
+
+    def applied(self,snapshot,results,seq:int):
+
+        done = np.searchsorted(self.seq[:self.i],seq,side='right')
+        self.latency[self.done:done] = perf_counter()-self.due[self.done:done]
+        self.done = max(self.done,done)
+
+def replay(app,filename:str,speed:float,workdir:str):
+    """ Replay event `filename` at `speed` and return dataframe of punches """
+
+    import epo_ob
+    from epo_core import iterEventCSV
+
+    # Event without punches
+    cols = ['ID','Name','Gender','Note','Start','Finish','Score','Registered','Fee']
+    df = pd.concat([chunk for chunk,_,_ in iterEventCSV(filename,cols)])
+    events = getEvents(df)
+    csvfile = os.path.join(workdir,f"replay_{speed:g}.csv")
+    df[['Name','Gender','Note','Registered','Fee']].to_csv(csvfile)
+
+    gui = epo_ob.EPOGUI(csvfile)
+    while gui.loading: app.processEvents()
+
+    player = Replay(app,gui,events,speed)
+    nowSec = epo_ob.nowSec
+    epo_ob.nowSec = player.now
+    try:
+        player.run()
+    finally:
+        epo_ob.nowSec = nowSec
+        gui.close()
+
+    events['Due'] = (player.due-player.wallStart)*speed+player.simStart
+    events['Latency'] = player.latency
+    events['Service'] = player.service
+    events['Backlog'] = player.backlog
+    events['Speed'] = speed
+    return events
+
+def summarize(events:pd.DataFrame):
+    """ Return summary of one replay as dictionary """
+
+    duration = (events['Time'].iloc[-1]-events['Time'].iloc[0])/events['Speed'].iloc[0]
+    latency = events['Latency'].to_numpy()*1000
+    return {
+        'Speed':            events['Speed'].iloc[0],
+        'Punches':          len(events),
+        'Rate [1/s]':       len(events)/duration if duration > 0 else np.inf,
+        'P50 [ms]':         np.percentile(latency,50),
+        'P90 [ms]':         np.percentile(latency,90),
+        'P99 [ms]':         np.percentile(latency,99),
+        'Max [ms]':         np.max(latency),
+        'Service P50 [ms]': np.percentile(events['Service'].to_numpy()*1000,50),
+        'Max backlog':      events['Backlog'].max(),
+    }
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Accelerated replay of finished EPO event")
+    parser.add_argument('file',help="event CSV with Start and Finish times")
+    parser.add_argument('-s','--speed',type=float,nargs='+',default=[60],help="speed-up factors (default: %(default)s)")
+    parser.add_argument('-r','--report',help="CSV file for latency and backlog of every punch")
+    parser.add_argument('-w','--workdir',help="directory for replayed event files (default: temporary)")
+    args = parser.parse_args(argv)
+
+    # Stub FTP upload
+    credentials = types.ModuleType('ftp_credentials')
+    credentials.HOST,credentials.USER,credentials.PSWD = 'localhost','replay',''
+    sys.modules['ftp_credentials'] = credentials
+    import epo_publish
+    epo_publish.ftplib.FTP = StubFTP
+
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication(sys.argv[:1])
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='epo_replay_')
+    os.makedirs(workdir,exist_ok=True)
+
+    results = [replay(app,args.file,speed,workdir) for speed in args.speed]
+
+    summary = pd.DataFrame([summarize(events) for events in results])
+    print(summary.to_string(index=False,float_format=lambda x: f"{x:.1f}"))
+    print(f"FTP uploads: {StubFTP.uploads}, files in '{workdir}'")
+
+    if args.report:
+        pd.concat(results).to_csv(args.report,index=False)
+
+if __name__ == "__main__":
+    main()
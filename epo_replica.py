@@ -0,0 +1,381 @@
+"""
+EPO_OB replication
+==================
+Hot standby: state of the primary station streamed to standby laptop over
+the local network, so the standby can take over punching when the primary
+dies.
+
+Primary (`ReplicaServer`) sends changed fields of runners of every engine
+batch (the same entries as journal, see `epo_journal`) as JSON lines to
+connected standbys, standby which connects gets snapshot of all runners
+first. Standby (`ReplicaClient`) applies them by its own engine, so its CSV,
+table and reports are always current, and acknowledges applied version.
+
+Lag of standby is bounded: when more than `MAX_PENDING` batches wait for a
+slow standby, they are replaced by one fresh snapshot. Primary sends heartbeat
+every `HEARTBEAT_INTERVAL`, standby which hears nothing for `TIMEOUT` reports
+the primary lost and keeps reconnecting until the operator takes over.
+
+Messages of primary (`v` is engine version, `t` wall time [ms]):
+
+    {"type": "snapshot", "v": 12, "t": 1665070000123, "fields": [...], "runners": [[ID, [values]], ...]}
+    {"type": "changes", "v": 13, "t": 1665070000456, "changes": [[ID, field, value], ...]}
+    {"type": "heartbeat", "v": 13, "t": 1665070001456}
+
+Standby answers `{"ack": 13}` when version 13 is applied and repeats the
+last applied version to every message (the primary drops standby silent for
+`TIMEOUT`).
+
+by vovo
+
+https://github.com/vojtavozda/EPO_OB
+
+"""
+
+import json
+import time
+import socket
+import threading
+from collections import deque
+from time import monotonic
+
+import pandas as pd
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from epo_journal import JOURNAL_FIELDS, REMOVED, toValue, applyChanges
+
+REPLICA_PORT = 8765
+# Batches waiting for standby, more are replaced by snapshot
+MAX_PENDING = 1000
+# Interval of heartbeats of idle primary [s]
+HEARTBEAT_INTERVAL = 1
+# Standby which hears nothing (or primary which cannot send) for this long
+# considers the connection lost [s]
+TIMEOUT = 5
+# Interval of reconnecting of standby [s]
+RECONNECT_INTERVAL = 2
+
+def encode(message:dict):
+
+    return (json.dumps(message,ensure_ascii=False,separators=(',',':'))+'\n').encode('utf-8')
+
+def wallTime():
+    return int(time.time()*1000)
+
+# Commands of standby engine (see `epo_engine`) ---------------------------------
+
+def applySnapshot(df:pd.DataFrame,fields:list,runners:list):
+    """ Replace runners by snapshot of primary `[[ID, [values of fields]]]` """
+
+    IDs = {ID for ID,_ in runners}
+    changes = [(ID,REMOVED,True) for ID in df.index if ID not in IDs]
+    for ID,values in runners:
+        if ID not in df.index: changes.append((ID,REMOVED,False))
+        changes += [(ID,field,value) for field,value in zip(fields,values)]
+    df,IDs = applyChanges(df,changes)
+    return df,None,IDs
+
+def applyBatch(df:pd.DataFrame,changes:list):
+    """ Apply changes `[[ID, field, value]]` streamed from primary """
+
+    df,IDs = applyChanges(df,[tuple(change) for change in changes])
+    return df,IDs,IDs
+
+# Primary ----------------------------------------------------------------------
+
+class Replica:
+    """ Connection of one standby, messages are sent by its own thread """
+
+    def __init__(self,server,conn:socket.socket,address:tuple):
+
+        self.server = server
+        self.conn = conn
+        self.address = f"{address[0]}:{address[1]}"
+        self.pending = deque()          # encoded messages
+        self.resync = True              # snapshot must be sent first
+        self.acked = None               # version applied by standby
+        self.closed = False
+        self.cond = threading.Condition()
+
+        conn.settimeout(TIMEOUT)
+        threading.Thread(target=self.send,name=f'Replica {self.address}',daemon=True).start()
+        threading.Thread(target=self.receive,name=f'Replica {self.address} acks',daemon=True).start()
+
+    def queue(self,message:bytes):
+        """ Queue message (called with lock of the server held) """
+
+        with self.cond:
+            if len(self.pending) >= MAX_PENDING:
+                # Standby is too slow, it catches up by snapshot
+                self.pending.clear()
+                self.resync = True
+            elif not self.resync:
+                self.pending.append(message)
+            self.cond.notify()
+
+    def send(self):
+
+        try:
+            while True:
+                with self.cond:
+                    if not self.pending and not self.resync and not self.closed:
+                        self.cond.wait(HEARTBEAT_INTERVAL)
+                    if self.closed: return
+                    resync = self.resync
+                    messages, self.pending = list(self.pending), deque()
+                if resync:
+                    snapshot = self.server.snapshot(self)
+                    if snapshot is None:
+                        # Nothing published yet
+                        with self.cond: self.cond.wait(HEARTBEAT_INTERVAL)
+                        continue
+                    messages = [snapshot]
+                elif not messages:
+                    messages = [self.server.heartbeat()]
+                for message in messages:
+                    self.conn.sendall(message)
+        except OSError as e:
+            self.server.drop(self,f"Standby {self.address} lost: {e}")
+
+    def receive(self):
+
+        try:
+            for line in self.conn.makefile('rb'):
+                try:
+                    self.acked = json.loads(line)['ack']
+                except (ValueError,KeyError,TypeError):
+                    continue
+        except OSError:
+            pass
+        self.server.drop(self,f"Standby {self.address} disconnected")
+
+    def close(self):
+
+        with self.cond:
+            if self.closed: return
+            self.closed = True
+            self.cond.notify()
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.conn.close()
+
+class ReplicaServer(QObject):
+    """ Stream changes of the engine to standby stations
+
+    `publish()` is called from the engine thread after every batch.
+    """
+
+    connected = pyqtSignal(str)
+    disconnected = pyqtSignal(str)
+
+    def __init__(self,host:str='0.0.0.0',port:int=REPLICA_PORT):
+        super().__init__()
+
+        self.host = host
+        self.port = port
+        self.lock = threading.Lock()
+        self.df = None                  # last published state
+        self.version = 0
+        self.replicas = []
+        self.sock = None
+
+    def start(self):
+        """ Listen for standbys (raises OSError if port is taken) """
+
+        self.sock = socket.create_server((self.host,self.port))
+        threading.Thread(target=self.accept,args=(self.sock,),name='ReplicaServer',daemon=True).start()
+
+    def accept(self,sock:socket.socket):
+
+        while True:
+            try:
+                conn,address = sock.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+            with self.lock:
+                replica = Replica(self,conn,address)
+                self.replicas.append(replica)
+            self.connected.emit(replica.address)
+
+    def publish(self,df:pd.DataFrame,version:int,changes:list):
+        """ Send `changes` of snapshot `df` (None if standbys should get
+        snapshot, e.g. new event was loaded) """
+
+        with self.lock:
+            self.df, self.version = df, version
+            if changes is None:
+                for replica in self.replicas:
+                    with replica.cond:
+                        replica.pending.clear()
+                        replica.resync = True
+                        replica.cond.notify()
+                return
+            if not changes: return
+            message = encode({'type':'changes','v':version,'t':wallTime(),
+                'changes':[[int(ID),field,value] for ID,field,value in changes]})
+            for replica in self.replicas:
+                replica.queue(message)
+
+    def snapshot(self,replica:Replica):
+        """ Return snapshot message for `replica` (None if there is no state
+        yet), changes queued meanwhile are part of it """
+
+        with self.lock:
+            with replica.cond:
+                if self.df is None: return None
+                replica.pending.clear()
+                replica.resync = False
+            df = self.df[JOURNAL_FIELDS]
+            runners = [[int(ID),[toValue(v) for v in row]] for ID,row in zip(df.index,df.itertuples(index=False))]
+            return encode({'type':'snapshot','v':self.version,'t':wallTime(),
+                'fields':JOURNAL_FIELDS,'runners':runners})
+
+    def heartbeat(self):
+
+        return encode({'type':'heartbeat','v':self.version,'t':wallTime()})
+
+    def status(self):
+        """ Return [(address, versions not applied by standby)] """
+
+        with self.lock:
+            return [(r.address,None if r.acked is None else self.version-r.acked) for r in self.replicas]
+
+    def drop(self,replica:Replica,reason:str):
+
+        with self.lock:
+            if replica not in self.replicas: return
+            self.replicas.remove(replica)
+        replica.close()
+        self.disconnected.emit(reason)
+
+    def stop(self):
+
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        with self.lock:
+            replicas, self.replicas = self.replicas, []
+        for replica in replicas:
+            replica.close()
+
+# Standby ----------------------------------------------------------------------
+
+class ReplicaClient(QObject):
+    """ Follow primary station `host:port` in background thread
+
+    Messages `[(type, version, payload)]` are collected in `self.messages` and
+    `received` is emitted when the first of them arrives, receiver takes all
+    of them by `take()` and reports applied version by `ack()`.
+    """
+
+    received = pyqtSignal()
+    connected = pyqtSignal(str)
+    failed = pyqtSignal(str)
+
+    def __init__(self,host:str,port:int=REPLICA_PORT):
+        super().__init__()
+
+        self.host = host
+        self.port = port
+        self.address = f"{host}:{port}"
+        self.version = None             # last version heard from primary
+        self.lastHeard = None           # monotonic time of last message
+        self.lost = False               # failure was reported
+        self.applied = None             # version applied by standby
+        self.sendLock = threading.Lock()
+        self.sock = None
+        self.messages = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run,name=f'ReplicaClient {self.address}',daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        """ Stop following (e.g. standby takes over) """
+
+        self.stopped.set()
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def take(self):
+        """ Return messages received since last call, messages before the
+        last snapshot are dropped """
+
+        with self.lock:
+            messages, self.messages = self.messages, []
+        return messages
+
+    def ack(self,version:int=None):
+        """ Report version applied by standby (or the last one) to primary """
+
+        if version is not None: self.applied = version
+        sock = self.sock
+        if sock is None: return
+        try:
+            with self.sendLock:
+                sock.sendall(encode({'ack':self.applied}))
+        except OSError:
+            pass
+
+    def run(self):
+
+        while not self.stopped.is_set():
+            try:
+                sock = socket.create_connection((self.host,self.port),timeout=TIMEOUT)
+            except OSError as e:
+                self.fail(f"Primary {self.address} not reachable: {e}")
+                self.stopped.wait(RECONNECT_INTERVAL)
+                continue
+
+            sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+            self.sock = sock
+            self.lost = False
+            self.connected.emit(self.address)
+            try:
+                for line in sock.makefile('rb'):
+                    self.receive(json.loads(line))
+                self.fail(f"Primary {self.address} closed connection")
+            except socket.timeout:
+                self.fail(f"Primary {self.address} silent for {TIMEOUT} s")
+            except (OSError,ValueError) as e:
+                self.fail(f"Primary {self.address} lost: {e}")
+            finally:
+                self.sock = None
+                sock.close()
+            self.stopped.wait(RECONNECT_INTERVAL)
+
+    def fail(self,error:str):
+        """ Report failure once until connected again """
+
+        if self.lost or self.stopped.is_set(): return
+        self.lost = True
+        self.failed.emit(error)
+
+    def receive(self,message:dict):
+
+        self.version = message['v']
+        self.lastHeard = monotonic()
+        # Standby is alive even if its engine is busy
+        self.ack()
+        if message['type'] == 'heartbeat': return
+        if message['type'] == 'snapshot':
+            item = ('snapshot',message['v'],(message['fields'],message['runners']))
+        else:
+            item = ('changes',message['v'],message['changes'])
+
+        with self.lock:
+            notify = not self.messages
+            # Snapshot replaces everything before it
+            if item[0] == 'snapshot': self.messages = []
+            self.messages.append(item)
+        # One signal per burst, receiver takes all messages at once
+        if notify: self.received.emit()
@@ -0,0 +1,643 @@
+"""
+EPO_OB reports
+==============
+Rendering of results (HTML pages, CSV, PDF, PNG chart and delta feed for web
+clients) and their upload.
+
+GUI only takes a snapshot of results and passes it to `ReportPipeline`. Outputs
+are rendered in a pool of worker processes so the operator never waits for
+them. If several snapshots are submitted while rendering, only the newest one
+is rendered. HTML pages are assembled from cached rows of runners by the
+pipeline itself (`HTMLTables`), so they cost only rows which changed.
+
+by vovo
+
+https://github.com/vojtavozda/EPO_OB
+
+"""
+
+import os
+import re
+import gzip
+import html
+import json
+import time
+import threading
+import multiprocessing
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter, MaxNLocator
+from matplotlib.collections import LineCollection
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+
+from epo_core import sec2str, rankOrder, formatTimes, DisplayCache, CATEGORIES
+from epo_publish import Publisher, loadTargets
+
+# Columns of published results
+RESULT_COLS = ['Rank','Name','Gender','Start','Finish','Time','Loss','GenderRank','GenderLoss','EPORank','EPOLoss','Score','Note']
+# Columns of category pages (`Rank` and `Loss` are taken from the category)
+CATEGORY_COLS = ['Rank','Name','Gender','Start','Finish','Time','Loss','Score','Note']
+# Number of table rows on one page of PDF
+PDF_ROWS_PER_PAGE = 45
+# Maximum number of start-finish lines in timeline, larger fields are decimated
+TIMELINE_MAX_LINES = 1000
+# Number of runners on one page of static results site
+SITE_PAGE_SIZE = 50
+# Number of deltas in results feed after which full snapshot is written again
+FEED_FULL_INTERVAL = 20
+
+SITE_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8" />
+<meta name="viewport" content="width=device-width, initial-scale=1" />
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; font-size: 0.9rem; }}
+table {{ border-collapse: collapse; }}
+td, th {{ padding: 0.2rem 0.4rem; text-align: center; border: 1px solid #ddd; }}
+nav a {{ margin-right: 0.5rem; }}
+</style>
+</head>
+<body>
+<h3>{title}</h3>
+<nav>{categories}</nav>
+{table}
+<nav>{pages}</nav>
+</body>
+</html>
+"""
+
+@dataclass(frozen=True)
+class ResultsSnapshot:
+    """ Immutable state of results passed to report workers
+
+    `results` is a copy of runners (seconds, not strings) sorted by rank which
+    must not be modified after the snapshot is created. Outputs are written
+    next to `basename` (path without extension).
+    """
+
+    version: int
+    basename: str
+    results: pd.DataFrame
+
+def getCategoryResults(df:pd.DataFrame):
+    """ Yield (category, group, dataframe) of runners sorted within category """
+
+    for category,func in CATEGORIES.items():
+        for group,gdf in df.groupby(func(df)):
+            gdf = gdf.sort_values(by=f'{category}Rank')
+            gdf = gdf.assign(Rank=gdf[f'{category}Rank'],Loss=gdf[f'{category}Loss'])
+            yield category,group,gdf
+
+def categoryFilename(basename:str,group,ext:str):
+    """ Return filename of page of category group, e.g. 'event_EPO.html' """
+
+    return f"{basename}_{re.sub(r'[^0-9A-Za-z]+','_',str(group))}{ext}"
+
+def replaceFile(write,filename:str):
+    """ Call `write(tmpname)` and atomically move result to `filename` """
+
+    tmpname = f"{filename}.tmp{os.getpid()}"
+    write(tmpname)
+    os.replace(tmpname,filename)
+    return filename
+
+class HTMLTables:
+    """ HTML tables of results assembled from cached rows
+
+    Text of cells is kept by `epo_core.DisplayCache`, so only changed cells
+    are formatted. Rendered row `<tr>...</tr>` is cached under the texts of
+    its cells, so a finish renders only rows of the finisher and of runners
+    whose rank or loss changed, the table is concatenation of cached rows.
+    Layout is the same as of `DataFrame.to_html()`. Rows not used by the last
+    two snapshots are dropped.
+    """
+
+    def __init__(self):
+
+        self.display = DisplayCache(RESULT_COLS,[c for c in RESULT_COLS if c.endswith('Loss')])
+        self.rows = {}                  # {texts of cells: row} of current snapshot
+        self.previous = {}              # the same of previous snapshot
+        self.rendered = 0               # rows rendered for current snapshot
+
+    def update(self,results:pd.DataFrame):
+        """ Take new snapshot of results (all of `RESULT_COLS`) """
+
+        self.display.update(results)
+        self.previous, self.rows = self.rows, {}
+        self.rendered = 0
+
+    def render(self,index,cols:list,category:str=None):
+        """ Return table of runners `index` (`Rank` and `Loss` of `category`) """
+
+        text = self.display.get(index)
+        if category is not None:
+            text['Rank'],text['Loss'] = text[f'{category}Rank'],text[f'{category}Loss']
+
+        head = ''.join(f"      <th>{html.escape(col)}</th>\n" for col in cols)
+        parts = ['<table border="1" class="dataframe">\n  <thead>\n    <tr style="text-align: right;">\n',
+            head,'    </tr>\n  </thead>\n  <tbody>\n']
+        for cells in zip(*(text[col] for col in cols)):
+            row = self.rows.get(cells)
+            if row is None:
+                row = self.previous.get(cells)
+                if row is None:
+                    row = '    <tr>\n'+''.join(f"      <td>{html.escape(c)}</td>\n" for c in cells)+'    </tr>\n'
+                    self.rendered += 1
+                self.rows[cells] = row
+            parts.append(row)
+        parts.append('  </tbody>\n</table>')
+        return ''.join(parts)
+
+def getTables(snapshot:ResultsSnapshot,tables:HTMLTables=None):
+    """ Return `tables` (already updated with snapshot) or new ones """
+
+    if tables is None:
+        tables = HTMLTables()
+        tables.update(snapshot.results)
+    return tables
+
+def writeText(text:str):
+    """ Return function writing `text` (for `replaceFile()`) """
+
+    def write(filename):
+        with open(filename,'w',encoding='utf-8') as fh: fh.write(text)
+    return write
+
+def writeHTML(snapshot:ResultsSnapshot,tables:HTMLTables=None):
+    """ Write overall results into '<basename>.html' """
+
+    table = getTables(snapshot,tables).render(snapshot.results.index,RESULT_COLS)
+    htmlfile = replaceFile(writeText(table),f"{snapshot.basename}.html")
+    return [htmlfile]
+
+def writeCategoryHTML(snapshot:ResultsSnapshot,tables:HTMLTables=None):
+    """ Write results of each category group into '<basename>_<group>.html' """
+
+    tables = getTables(snapshot,tables)
+    files = []
+    for category,group,gdf in getCategoryResults(snapshot.results):
+        files.append(replaceFile(
+            writeText(tables.render(gdf.index,CATEGORY_COLS,category)),
+            categoryFilename(snapshot.basename,group,'.html')
+        ))
+    return files
+
+def writeCSV(snapshot:ResultsSnapshot):
+    """ Write overall results into '<basename>_results.csv' """
+
+    df = formatTimes(snapshot.results)
+    csvfile = replaceFile(lambda f: df.to_csv(f,columns=RESULT_COLS,index=False,encoding='utf-8'),
+        f"{snapshot.basename}_results.csv")
+    return [csvfile]
+
+def writePDF(snapshot:ResultsSnapshot):
+    """ Write printable results (overall and categories) into '<basename>.pdf' """
+
+    tables = [('Overall',snapshot.results)]
+    tables += [(group,gdf) for _,group,gdf in getCategoryResults(snapshot.results)]
+
+    def write(filename):
+        with PdfPages(filename) as pdf:
+            for title,df in tables:
+                df = formatTimes(df)[CATEGORY_COLS].fillna('').astype(str)
+                for page in range(0,max(len(df),1),PDF_ROWS_PER_PAGE):
+                    fig = Figure(figsize=(8.27,11.69))      # A4
+                    ax = fig.add_subplot(111)
+                    ax.axis('off')
+                    ax.set_title(title)
+                    rows = df.iloc[page:page+PDF_ROWS_PER_PAGE]
+                    if len(rows):
+                        table = ax.table(cellText=rows.to_numpy(),colLabels=CATEGORY_COLS,loc='upper center')
+                        table.auto_set_font_size(False)
+                        table.set_fontsize(7)
+                    pdf.savefig(fig)
+
+    return [replaceFile(write,f"{snapshot.basename}.pdf")]
+
+def getInForest(start:np.ndarray,finish:np.ndarray):
+    """ Return times and number of runners in forest at these times
+
+    Runner is counted in forest from start to finish (both inclusive).
+    """
+
+    inForestX = np.unique(np.concatenate((start,finish)))
+    inForestN = (np.searchsorted(np.sort(start),inForestX,side='right')
+        - np.searchsorted(np.sort(finish),inForestX,side='left'))
+    return inForestX, inForestN
+
+def decimate(n:int,maxCount:int):
+    """ Return indices of at most `maxCount` items evenly picked from `n` """
+
+    if n <= maxCount: return np.arange(n)
+    return np.unique(np.linspace(0,n-1,maxCount).astype(int))
+
+class Timeline:
+    """ Start-finish lines of runners and number of runners in forest
+
+    Finished runners (sorted by rank) are drawn as one `LineCollection` into
+    `ax1`, runners still in forest as another one whose segments end at current
+    time (see `tick()`). Number of runners in forest is drawn into `ax2`. Data
+    are updated by changing artists, axes are never cleared. Fields larger
+    than `maxLines` are decimated (evenly picked ranks).
+    """
+
+    def __init__(self,ax1,ax2,maxLines:int=TIMELINE_MAX_LINES):
+
+        self.ax1 = ax1
+        self.ax2 = ax2
+        self.maxLines = maxLines
+
+        self.finished = LineCollection([],colors='k',linewidths=1)
+        self.running = LineCollection([],colors='tab:green',linewidths=1)
+        ax1.add_collection(self.finished)
+        ax1.add_collection(self.running)
+        self.inForest, = ax2.plot([],[],drawstyle='steps-pre',linewidth=2)
+
+        ax1.xaxis.set_major_locator(MaxNLocator(nbins=5))
+        ax1.xaxis.set_major_formatter(FuncFormatter(lambda t,pos: sec2str(t)))
+        ax1.set_xlabel('Time')
+        ax1.set_ylabel('Rank')
+        ax2.set_ylabel('Number of people in forest')
+
+        self.runStart = np.empty(0)
+        self.runY = np.empty(0)
+        self.forestX = np.empty(0)
+        self.forestN = np.empty(0)
+        self.xlim = None
+        self.nRunners = 0
+
+    def setData(self,df:pd.DataFrame,now=None):
+        """ Replace data by runners from `df` (runners in forest end at `now`) """
+
+        df = df.iloc[rankOrder(df)]
+        start = df['Start'].to_numpy(dtype=float)
+        finish = df['Finish'].to_numpy(dtype=float)
+        started = ~np.isnan(start)
+        finished = np.logical_and(started,~np.isnan(finish))
+        running = np.logical_and(started,np.isnan(finish))
+
+        # Finished runners sorted by rank, runners in forest above them
+        fStart, fFinish = start[finished], finish[finished]
+        idx = decimate(len(fStart),self.maxLines)
+        self.finished.set_segments(np.stack((
+            np.column_stack((fStart[idx],idx)),
+            np.column_stack((fFinish[idx],idx))
+        ),axis=1) if len(idx) else [])
+
+        rStart = start[running]
+        idx = decimate(len(rStart),self.maxLines)
+        self.runStart = rStart[idx]
+        self.runY = len(fStart)+idx
+
+        # Runners in forest have no finish, they are counted up to now
+        self.forestX, self.forestN = getInForest(start[started],fFinish)
+
+        self.nRunners = np.count_nonzero(started)
+        if self.nRunners:
+            self.xlim = (np.min(start[started]),np.max(np.concatenate((start[started],fFinish))))
+        else:
+            self.xlim = None
+
+        self.tick(now)
+
+    def tick(self,now=None):
+        """ Extend segments of runners in forest (and their count) to `now` """
+
+        forestX, forestN = self.forestX, self.forestN
+        if now is None or len(self.runStart) == 0:
+            self.running.set_segments([])
+        else:
+            self.running.set_segments(np.stack((
+                np.column_stack((self.runStart,self.runY)),
+                np.column_stack((np.maximum(self.runStart,now),self.runY))
+            ),axis=1))
+            if len(forestX) and now > forestX[-1]:
+                forestX = np.append(forestX,now)
+                forestN = np.append(forestN,forestN[-1])
+        self.inForest.set_data(forestX,forestN)
+
+        if self.xlim is not None:
+            xmin, xmax = self.xlim
+            if now is not None and len(self.runStart): xmax = max(xmax,now)
+            pad = max((xmax-xmin)*0.02,60)
+            self.ax1.set_xlim(xmin-pad,xmax+pad)
+            self.ax1.set_ylim(-1,self.nRunners)
+            self.ax2.set_ylim(0,max(np.max(forestN),1)*1.05)
+
+def plotOccupancy(ax1,ax2,df:pd.DataFrame,now=None):
+    """ Plot start-finish lines of runners sorted by rank into `ax1` and number
+    of runners in forest into `ax2`, return `Timeline` for later updates """
+
+    timeline = Timeline(ax1,ax2)
+    timeline.setData(df,now)
+    return timeline
+
+def writePNG(snapshot:ResultsSnapshot):
+    """ Write chart of runners in forest into '<basename>_plot.png' """
+
+    fig = Figure(figsize=(10,6),dpi=100)
+    FigureCanvasAgg(fig)
+    ax1 = fig.add_subplot(111)
+    ax2 = ax1.twinx()
+    plotOccupancy(ax1,ax2,snapshot.results)
+    fig.tight_layout()
+    return [replaceFile(lambda f: fig.savefig(f,format='png'),f"{snapshot.basename}_plot.png")]
+
+def resultsJSON(df:pd.DataFrame):
+    """ Return compact JSON (`{"columns":[...],"data":[[...],...]}`) of results """
+
+    return formatTimes(df)[RESULT_COLS].to_json(orient='split',index=False,force_ascii=False)
+
+def siteFilename(group,page:int):
+    """ Return filename of page of static site ('index.html' is overall page 1) """
+
+    prefix = 'index' if group is None else re.sub(r'[^0-9A-Za-z]+','_',str(group))
+    if page == 1: return f"{prefix}.html"
+    if group is None: return f"page-{page}.html"
+    return f"{prefix}-page-{page}.html"
+
+def writeIfChanged(filename:str,data:bytes):
+    """ Write `data` and its '.gz' variant only if content of file changed
+
+    Unchanged files keep their mtime, so ETag and Last-Modified derived by web
+    server stay valid and clients get '304 Not Modified'.
+    """
+
+    try:
+        with open(filename,'rb') as fh:
+            if fh.read() == data: return False
+    except FileNotFoundError:
+        pass
+
+    def write(data):
+        def _write(tmpname):
+            with open(tmpname,'wb') as fh: fh.write(data)
+        return _write
+
+    # mtime=0 makes compressed file depend only on content
+    replaceFile(write(gzip.compress(data,compresslevel=9,mtime=0)),f"{filename}.gz")
+    replaceFile(write(data),filename)
+    return True
+
+def writeSite(snapshot:ResultsSnapshot,tables:HTMLTables=None):
+    """ Write static results site into '<basename>_site/'
+
+    Overall and category results are split into pages of `SITE_PAGE_SIZE`
+    runners, all results are also in compact 'results.json'. Every file has
+    stable name and precompressed '.gz' variant and is rewritten only if its
+    content changed. Files of pages which no longer exist are removed.
+    """
+
+    sitedir = f"{snapshot.basename}_site"
+    os.makedirs(sitedir,exist_ok=True)
+
+    htmlTables = getTables(snapshot,tables)
+    tables = [(None,'Results',RESULT_COLS,None,snapshot.results.index)]
+    tables += [(group,f'Results: {group}',CATEGORY_COLS,category,gdf.index)
+        for category,group,gdf in getCategoryResults(snapshot.results)]
+    categories = ' '.join(f'<a href="{siteFilename(group,1)}">{"Overall" if group is None else group}</a>'
+        for group,_,_,_,_ in tables)
+
+    files = {}
+    for group,title,cols,category,index in tables:
+        nPages = max(1,-(-len(index)//SITE_PAGE_SIZE))
+        for page in range(1,nPages+1):
+            pages = ' '.join(str(p) if p==page else f'<a href="{siteFilename(group,p)}">{p}</a>'
+                for p in range(1,nPages+1))
+            rows = index[(page-1)*SITE_PAGE_SIZE:page*SITE_PAGE_SIZE]
+            files[siteFilename(group,page)] = SITE_TEMPLATE.format(
+                title = title,
+                categories = categories,
+                table = htmlTables.render(rows,cols,category),
+                pages = pages if nPages > 1 else '',
+            ).encode('utf-8')
+
+    files['results.json'] = resultsJSON(snapshot.results).encode('utf-8')
+
+    written = [os.path.join(sitedir,name) for name,data in files.items()
+        if writeIfChanged(os.path.join(sitedir,name),data)]
+
+    # Remove pages which are not generated anymore
+    keep = set(files) | {f"{name}.gz" for name in files}
+    for name in os.listdir(sitedir):
+        if name not in keep:
+            os.remove(os.path.join(sitedir,name))
+
+    return written
+
+# Functions rendering one output each, called in worker processes
+RENDERERS = [writeCSV, writePDF, writePNG]
+# Functions writing HTML from cached rows (`HTMLTables`), called by pipeline
+HTML_RENDERERS = [writeHTML, writeCategoryHTML, writeSite]
+
+def feedRows(df:pd.DataFrame):
+    """ Return published columns of results as strings ('' if missing) """
+
+    df = formatTimes(df)[RESULT_COLS]
+    rows = pd.DataFrame(index=df.index)
+    for col in RESULT_COLS:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            rows[col] = df[col].map(lambda x: '' if pd.isna(x) else f"{x:.0f}" if float(x).is_integer() else str(x))
+        else:
+            rows[col] = df[col].fillna('').astype(str)
+    return rows
+
+class DeltaFeed:
+    """ Versioned feed of changed results for web clients
+
+    Two files are written next to `basename`:
+
+    - '<basename>_full.json'  all rows, rewritten every `fullInterval` versions
+      or when deltas hold more rows than the full snapshot
+    - '<basename>_feed.json'  deltas (changed and removed rows, new order if it
+      changed) since the last full snapshot
+
+    A client holding version `v` applies deltas chained from `v` (`from` equals
+    its version), otherwise it loads the full snapshot first. `epoch` changes
+    with every start of the application, so versions of different runs are
+    never mixed. Rows are keyed by ID.
+    """
+
+    def __init__(self,fullInterval:int=FEED_FULL_INTERVAL):
+
+        self.fullInterval = fullInterval
+        self.epoch = int(time.time()*1000)
+        self.rows = None                # rows of last published version
+        self.version = None
+        self.full = None                # version of last full snapshot
+        self.deltas = []
+
+    def update(self,snapshot:ResultsSnapshot):
+        """ Write feed (and full snapshot if due), return written files """
+
+        rows = feedRows(snapshot.results)
+        files = []
+
+        if (self.rows is None or len(self.deltas) >= self.fullInterval or
+                sum(len(d['ids']) for d in self.deltas) >= len(rows)):
+            self.full = snapshot.version
+            self.deltas = []
+            files.append(self.write(f"{snapshot.basename}_full.json",{
+                'epoch':    self.epoch,
+                'version':  snapshot.version,
+                'columns':  RESULT_COLS,
+                'ids':      rows.index.tolist(),
+                'data':     rows.values.tolist(),
+            }))
+        else:
+            old = self.rows
+            common = rows.index.intersection(old.index)
+            changed = (rows.loc[common] != old.loc[common]).any(axis=1)
+            changed = rows.index.isin(common[changed.to_numpy()]) | ~rows.index.isin(old.index)
+            self.deltas.append({
+                'from':     self.version,
+                'version':  snapshot.version,
+                'ids':      rows.index[changed].tolist(),
+                'data':     rows.values[changed].tolist(),
+                'removed':  old.index.difference(rows.index).tolist(),
+                # Order is sent only if it changed
+                'order':    None if rows.index.equals(old.index) else rows.index.tolist(),
+            })
+
+        self.rows = rows
+        self.version = snapshot.version
+        files.append(self.write(f"{snapshot.basename}_feed.json",{
+            'epoch':    self.epoch,
+            'version':  snapshot.version,
+            'full':     self.full,
+            'columns':  RESULT_COLS,
+            'deltas':   self.deltas,
+        }))
+        return files
+
+    @staticmethod
+    def write(filename:str,data:dict):
+
+        def _write(tmpname):
+            with open(tmpname,'w',encoding='utf-8') as fh:
+                json.dump(data,fh,ensure_ascii=False,separators=(',',':'))
+        return replaceFile(_write,filename)
+
+class ReportPipeline:
+    """ Render snapshots of results in worker processes (newest only)
+
+    Failures of rendering and of uploads are collected for the GUI, see
+    `takeErrors()`. Failure repeating for following snapshots is reported
+    once.
+    """
+
+    def __init__(self,workers:int=2,upload:bool=True,targets:list=None):
+
+        self.workers = workers
+        self.upload = upload
+        # Publish targets (`epo_publish`), loaded from configuration if None
+        self.targets = targets
+        self.publisher = None
+
+        # Newest snapshot waiting for rendering (older ones are dropped)
+        self.snapshot = None
+        self.rendered = None            # version of last rendered snapshot
+        self.feed = DeltaFeed()
+        self.tables = HTMLTables()
+        self.errors = []                # failures not taken by `takeErrors()` yet
+        self.failing = set()            # failures of last rendered snapshot
+        self.closed = False
+        self.cond = threading.Condition()
+        self.thread = None
+        self.pool = None
+
+    def submit(self,snapshot:ResultsSnapshot):
+        """ Queue snapshot for rendering, replacing any not yet started one """
+
+        with self.cond:
+            if self.closed: return
+            self.snapshot = snapshot
+            self.cond.notify()
+            if self.thread is None:
+                # Spawn (not fork) workers, parent process runs Qt
+                self.pool = ProcessPoolExecutor(self.workers,
+                    mp_context=multiprocessing.get_context('spawn'))
+                self.thread = threading.Thread(target=self.run,name='ReportPipeline',daemon=True)
+                self.thread.start()
+
+    def run(self):
+        """ Dispatcher loop: render newest snapshot, then upload outputs """
+
+        while True:
+            with self.cond:
+                while self.snapshot is None and not self.closed:
+                    self.cond.wait()
+                if self.snapshot is None: return
+                snapshot, self.snapshot = self.snapshot, None
+
+            errors = []
+            try:
+                self.render(snapshot,errors)
+            except Exception as e:
+                errors.append(f"Rendering of results failed: {e}")
+
+            with self.cond:
+                self.errors += [e for e in errors if e not in self.failing]
+                self.failing = set(errors)
+
+    def takeErrors(self):
+        """ Return failures of rendering and uploads since last call """
+
+        with self.cond:
+            errors, self.errors = self.errors, []
+            publisher = self.publisher
+        if publisher is not None:
+            errors += publisher.takeErrors()
+        return errors
+
+    def render(self,snapshot:ResultsSnapshot,errors:list):
+        """ Render `snapshot` and upload outputs, append failures to `errors` """
+
+        futures = [self.pool.submit(func,snapshot) for func in RENDERERS]
+        # Rows of HTML tables are cached here (not in workers) meanwhile
+        self.tables.update(snapshot.results)
+        for func in HTML_RENDERERS:
+            try:
+                func(snapshot,self.tables)
+            except Exception as e:
+                errors.append(f"Rendering of results ({func.__name__}) failed: {e}")
+        wait(futures)
+        for func,future in zip(RENDERERS,futures):
+            if future.exception() is not None:
+                errors.append(f"Rendering of results ({func.__name__}) failed: {future.exception()}")
+        self.rendered = snapshot.version
+
+        # Feed depends on previous version, it is written here (not in workers)
+        feedFiles = self.feed.update(snapshot)
+
+        if self.upload:
+            # Full snapshot goes first so feed never refers to missing one
+            files = {f"epo{f[len(snapshot.basename):]}": f for f in feedFiles}
+            if self.publisher is None:
+                publisher = Publisher(loadTargets() if self.targets is None else self.targets)
+                with self.cond: self.publisher = publisher
+            self.publisher.submit({
+                'epo.html': f"{snapshot.basename}.html",
+                'epo.csv':  f"{snapshot.basename}_results.csv",
+                **files,
+            })
+
+    def close(self,wait:bool=True):
+        """ Render pending snapshot (if `wait`) and shut down workers """
+
+        with self.cond:
+            self.closed = True
+            if not wait: self.snapshot = None
+            self.cond.notify()
+        if self.thread is not None:
+            if wait: self.thread.join()
+            self.pool.shutdown(wait=wait)
+        if self.publisher is not None:
+            self.publisher.close(wait)
@@ -0,0 +1,286 @@
+"""
+EPO_OB results server
+=====================
+Lightweight HTTP server publishing current standings on the local network.
+
+Server runs `asyncio` loop in its own thread so it never blocks the GUI and
+handles many concurrent (mostly idle) phone clients. Routes:
+
+- `/`               standings page updated live from `/events`
+- `/results.json`   current standings as compact JSON (with ETag)
+- `/events`         server-sent events, new standings after every change
+- `/site/<file>`    static results site (see `epo_reports.writeSite()`)
+
+by vovo
+
+https://github.com/vojtavozda/EPO_OB
+
+"""
+
+import os
+import socket
+import asyncio
+import threading
+from email.utils import formatdate
+
+from epo_reports import resultsJSON
+
+# Interval of SSE comments keeping idle connections open [s]
+KEEPALIVE_INTERVAL = 15
+# Timeout for reading request [s]
+REQUEST_TIMEOUT = 10
+
+STANDINGS_PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8" />
+<meta name="viewport" content="width=device-width, initial-scale=1" />
+<title>EPO Results</title>
+<style>
+body { font-family: sans-serif; font-size: 0.9rem; }
+table { border-collapse: collapse; margin: auto; }
+td, th { padding: 0.2rem 0.4rem; text-align: center; border: 1px solid #ddd; }
+</style>
+</head>
+<body>
+<table id="results"><thead></thead><tbody></tbody></table>
+<script>
+const cols = ["Rank", "Name", "Time", "Loss", "Score", "Note"];
+// Cells are filled by textContent, names and notes are never parsed as HTML
+function makeRow(tag, values) {
+  const tr = document.createElement("tr");
+  for (const value of values) {
+    const cell = document.createElement(tag);
+    cell.textContent = value ?? "";
+    tr.appendChild(cell);
+  }
+  return tr;
+}
+function render(results) {
+  const idx = cols.map((c) => results.columns.indexOf(c));
+  document.querySelector("#results thead").replaceChildren(makeRow("th", cols));
+  document.querySelector("#results tbody").replaceChildren(
+    ...results.data.map((row) => makeRow("td", idx.map((i) => row[i]))));
+}
+new EventSource("events").addEventListener("standings", (e) => render(JSON.parse(e.data)));
+</script>
+</body>
+</html>
+"""
+
+def getLocalIP():
+    """ Return IP address of this computer in local network """
+
+    try:
+        with socket.socket(socket.AF_INET,socket.SOCK_DGRAM) as s:
+            s.connect(('10.255.255.255',1))
+            return s.getsockname()[0]
+    except OSError:
+        return '127.0.0.1'
+
+class ResultsServer:
+    """ HTTP server with current standings running in its own thread """
+
+    def __init__(self,host:str='0.0.0.0',port:int=8000):
+
+        self.host = host
+        self.port = port
+
+        self.loop = None
+        self.thread = None
+        self.server = None
+
+        # Current standings (accessed only from server loop)
+        self.version = 0
+        self.json = b'{"columns":[],"data":[]}'
+        self.sitedir = None
+        # Queue of each connected SSE client (holds only newest standings)
+        self.clients = set()
+        # Tasks handling open connections
+        self.tasks = set()
+
+    @property
+    def url(self):
+        return f"http://{getLocalIP()}:{self.port}/"
+
+    def start(self):
+        """ Start server thread, raise `OSError` if port cannot be bound """
+
+        started = threading.Event()
+        error = []
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.server = self.loop.run_until_complete(
+                    asyncio.start_server(self.handle,self.host,self.port))
+            except OSError as e:
+                error.append(e)
+                started.set()
+                self.loop.close()
+                return
+            started.set()
+            self.loop.run_forever()
+            self.loop.close()
+
+        self.thread = threading.Thread(target=run,name='ResultsServer',daemon=True)
+        self.thread.start()
+        started.wait()
+        if error:
+            self.thread = None
+            raise error[0]
+
+    def stop(self):
+
+        if self.thread is None: return
+
+        async def shutdown():
+            self.server.close()
+            for queue in self.clients:
+                self.putLatest(queue,None)
+            if self.tasks:
+                _,pending = await asyncio.wait(self.tasks,timeout=2)
+                for task in pending: task.cancel()
+                await asyncio.gather(*pending,return_exceptions=True)
+            await self.server.wait_closed()
+
+        future = asyncio.run_coroutine_threadsafe(shutdown(),self.loop)
+        try:
+            future.result(timeout=5)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.thread = None
+
+    def publish(self,snapshot):
+        """ Publish new standings from `epo_reports.ResultsSnapshot` (thread-safe) """
+
+        if self.thread is None: return
+        asyncio.run_coroutine_threadsafe(self.update(snapshot),self.loop)
+
+    async def update(self,snapshot):
+
+        # Format outside of the loop so clients are served meanwhile
+        data = await self.loop.run_in_executor(None,resultsJSON,snapshot.results)
+        # Snapshots formatted out of order -> keep the newest
+        if snapshot.version <= self.version: return
+
+        self.version = snapshot.version
+        self.json = data.encode('utf-8')
+        self.sitedir = f"{snapshot.basename}_site"
+
+        for queue in self.clients:
+            self.putLatest(queue,self.json)
+
+    @staticmethod
+    def putLatest(queue:asyncio.Queue,item):
+        """ Put item into queue of size 1, replacing not yet sent item """
+
+        if queue.full(): queue.get_nowait()
+        queue.put_nowait(item)
+
+    async def handle(self,reader:asyncio.StreamReader,writer:asyncio.StreamWriter):
+        """ Handle one HTTP connection """
+
+        self.tasks.add(asyncio.current_task())
+        try:
+            request = await asyncio.wait_for(reader.readline(),REQUEST_TIMEOUT)
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(),REQUEST_TIMEOUT)
+                if line in (b'\r\n',b'\n',b''): break
+                key,_,value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+
+            try:
+                method,path,_ = request.decode('latin-1').split()
+            except ValueError:
+                return await self.respond(writer,400,b'Bad request')
+            path = path.split('?')[0]
+
+            if method not in ('GET','HEAD'):
+                await self.respond(writer,405,b'Method not allowed')
+            elif path == '/':
+                await self.respond(writer,200,STANDINGS_PAGE.encode('utf-8'),'text/html; charset=utf-8')
+            elif path == '/results.json':
+                etag = f'"{self.version}"'
+                if headers.get('if-none-match') == etag:
+                    await self.respond(writer,304,b'',extra={'ETag':etag})
+                else:
+                    await self.respond(writer,200,self.json,'application/json',{'ETag':etag})
+            elif path == '/events':
+                await self.events(writer)
+            elif path.startswith('/site/'):
+                await self.site(writer,path[len('/site/'):] or 'index.html',headers)
+            else:
+                await self.respond(writer,404,b'Not found')
+
+        except (asyncio.TimeoutError,ConnectionError):
+            pass
+        finally:
+            writer.close()
+            self.tasks.discard(asyncio.current_task())
+
+    async def respond(self,writer,status:int,body:bytes,ctype:str='text/plain',extra:dict=None):
+
+        reasons = {200:'OK',304:'Not Modified',400:'Bad Request',404:'Not Found',405:'Method Not Allowed'}
+        head = [f"HTTP/1.1 {status} {reasons[status]}",
+            f"Content-Type: {ctype}",
+            f"Content-Length: {len(body)}",
+            "Connection: close",
+            "Access-Control-Allow-Origin: *"]
+        head += [f"{k}: {v}" for k,v in (extra or {}).items()]
+        writer.write(('\r\n'.join(head)+'\r\n\r\n').encode('latin-1')+body)
+        await writer.drain()
+
+    async def events(self,writer):
+        """ Stream standings to one client as server-sent events """
+
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: keep-alive\r\n"
+            b"Access-Control-Allow-Origin: *\r\n\r\n")
+
+        queue = asyncio.Queue(maxsize=1)
+        queue.put_nowait(self.json)
+        self.clients.add(queue)
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(queue.get(),KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    writer.write(b": keepalive\n\n")
+                else:
+                    if data is None: break
+                    writer.write(b"event: standings\ndata: "+data+b"\n\n")
+                await writer.drain()
+        finally:
+            self.clients.discard(queue)
+
+    async def site(self,writer,name:str,headers:dict):
+        """ Serve file of static site, precompressed variant if accepted """
+
+        name = os.path.basename(name)
+        filename = os.path.join(self.sitedir or '',name)
+        if self.sitedir is None or not os.path.isfile(filename):
+            return await self.respond(writer,404,b'Not found')
+
+        extra = {}
+        if 'gzip' in headers.get('accept-encoding','') and os.path.isfile(f"{filename}.gz"):
+            filename = f"{filename}.gz"
+            extra['Content-Encoding'] = 'gzip'
+        stat = os.stat(filename)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        extra['ETag'] = etag
+        extra['Last-Modified'] = formatdate(stat.st_mtime,usegmt=True)
+        extra['Vary'] = 'Accept-Encoding'
+        if headers.get('if-none-match') == etag:
+            return await self.respond(writer,304,b'',extra=extra)
+
+        with open(filename,'rb') as fh:
+            body = fh.read()
+        ctype = 'application/json' if name.endswith('.json') else 'text/html; charset=utf-8'
+        await self.respond(writer,200,body,ctype,extra)
@@ -0,0 +1,250 @@
+"""
+EPO_OB shared standings
+=======================
+Current standings published into shared memory for other local processes
+(results screen, analytics scripts, ...), which read them without parsing
+files or asking the GUI.
+
+Segment (default name `epo_standings`) starts with header of eight uint64
+words followed by one array per column of `FIELDS`, each `capacity` long,
+rows sorted by rank:
+
+    0 magic ('EPOSTAND')    2 seq          4 count        6 closed
+    1 layout version        3 version      5 capacity     7 reserved
+
+Writes are guarded by seqlock: `seq` is odd while the writer changes arrays,
+so reader which sees the same even `seq` before and after reading got a
+consistent snapshot. When the field outgrows `capacity`, the writer marks the
+segment closed and creates a bigger one under the same name, readers attach
+to it again.
+
+Usage:
+    python epo_shm.py --top 10 --watch 2
+
+by vovo
+
+https://github.com/vojtavozda/EPO_OB
+
+"""
+
+import sys
+import time
+import argparse
+import threading
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_NAME = 'epo_standings'
+MAGIC = int.from_bytes(b'EPOSTAND','little')
+LAYOUT = 1
+HEADER_WORDS = 8
+SEQ, VERSION, COUNT, CAPACITY, CLOSED = 2, 3, 4, 5, 6
+
+# Columns of shared standings (ID is index of results)
+FIELDS = [('ID',np.int64),('Rank',np.float64),('Start',np.float64),('Finish',np.float64),
+    ('Time',np.float64),('Loss',np.float64),('Score',np.float64)]
+
+def segmentSize(capacity:int):
+
+    return 8*HEADER_WORDS+capacity*sum(np.dtype(t).itemsize for _,t in FIELDS)
+
+def mapSegment(shm:shared_memory.SharedMemory,capacity:int):
+    """ Return header and column arrays `{field: array}` viewing segment """
+
+    header = np.ndarray(HEADER_WORDS,dtype=np.uint64,buffer=shm.buf)
+    arrays = {}
+    offset = 8*HEADER_WORDS
+    for field,dtype in FIELDS:
+        arrays[field] = np.ndarray(capacity,dtype=dtype,buffer=shm.buf,offset=offset)
+        offset += capacity*np.dtype(dtype).itemsize
+    return header,arrays
+
+class StandingsWriter:
+    """ Publish standings into shared memory (thread-safe) """
+
+    def __init__(self,name:str=DEFAULT_NAME,capacity:int=1024):
+
+        self.name = name
+        self.lock = threading.Lock()
+        self.shm = None
+        self.closed = False
+        self.create(capacity)
+
+    def create(self,capacity:int):
+
+        try:
+            shm = shared_memory.SharedMemory(self.name,create=True,size=segmentSize(capacity))
+        except FileExistsError:
+            # Segment left by crashed (or replaced) writer
+            old = shared_memory.SharedMemory(self.name)
+            old.close()
+            old.unlink()
+            shm = shared_memory.SharedMemory(self.name,create=True,size=segmentSize(capacity))
+
+        self.shm = shm
+        self.capacity = capacity
+        self.header,self.arrays = mapSegment(shm,capacity)
+        self.header[:] = 0
+        self.header[0] = MAGIC
+        self.header[1] = LAYOUT
+        self.header[CAPACITY] = capacity
+
+    def release(self):
+        """ Mark segment closed (readers attach again) and remove it """
+
+        self.header[SEQ] += 2
+        self.header[CLOSED] = 1
+        del self.header,self.arrays
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    def publish(self,results:pd.DataFrame,version:int):
+        """ Write `results` (runners sorted by rank, index ID) unless newer
+        version was already published """
+
+        with self.lock:
+            if self.closed or version <= self.header[VERSION]: return
+
+            n = len(results)
+            if n > self.capacity:
+                seq = int(self.header[SEQ])
+                self.release()
+                self.create(max(2*self.capacity,n))
+                self.header[SEQ] = seq+2
+
+            self.header[SEQ] += 1               # odd: writing
+            self.arrays['ID'][:n] = results.index.to_numpy(dtype=np.int64)
+            for field,dtype in FIELDS[1:]:
+                self.arrays[field][:n] = pd.to_numeric(results[field],errors='coerce').to_numpy(dtype=dtype,na_value=np.nan)
+            self.header[COUNT] = n
+            self.header[VERSION] = version
+            self.header[SEQ] += 1               # even: consistent
+
+    def close(self):
+
+        with self.lock:
+            if self.closed: return
+            self.closed = True
+            self.release()
+
+class StandingsReader:
+    """ Read standings published by `StandingsWriter` of another process """
+
+    def __init__(self,name:str=DEFAULT_NAME):
+
+        self.name = name
+        self.shm = None
+
+    def attach(self):
+        """ Attach segment, return False if it does not exist """
+
+        if self.shm is not None: return True
+        try:
+            try:
+                shm = shared_memory.SharedMemory(self.name,track=False)
+            except TypeError:
+                # Python < 3.13 tracks attached segments too and would remove
+                # the segment of the writer at exit
+                shm = shared_memory.SharedMemory(self.name)
+                resource_tracker.unregister(shm._name,'shared_memory')
+        except FileNotFoundError:
+            return False
+
+        header = np.ndarray(HEADER_WORDS,dtype=np.uint64,buffer=shm.buf)
+        if header[0] != MAGIC or header[1] != LAYOUT:
+            del header
+            shm.close()
+            raise ValueError(f"Shared memory '{self.name}' does not hold EPO standings")
+        self.shm = shm
+        self.header,self.arrays = mapSegment(shm,int(header[CAPACITY]))
+        return True
+
+    def detach(self):
+
+        if self.shm is None: return
+        del self.header,self.arrays
+        try:
+            self.shm.close()
+        except BufferError:
+            # Views returned by `views()` are still used, memory is released
+            # once they are gone
+            pass
+        self.shm = None
+
+    def views(self):
+        """ Return (seq, `{field: array}`) viewing shared memory (no copy)
+
+        Arrays change under the reader, values are consistent only if
+        `isValid(seq)` holds after they were used. Seq is None if nothing is
+        published (or writer is busy).
+        """
+
+        if not self.attach(): return None,{}
+        if self.header[CLOSED]:
+            self.detach()
+            if not self.attach(): return None,{}
+        seq = int(self.header[SEQ])
+        if seq == 0 or seq % 2: return None,{}
+        n = int(self.header[COUNT])
+        return seq,{field: array[:n] for field,array in self.arrays.items()}
+
+    def isValid(self,seq:int):
+        """ Return True if nothing was written since `views()` returned `seq` """
+
+        return seq is not None and self.shm is not None and \
+            not self.header[CLOSED] and int(self.header[SEQ]) == seq
+
+    def read(self,timeout:float=1):
+        """ Return (version, dataframe indexed by ID) of consistent copy of
+        standings, (None, None) if nothing is published within `timeout` """
+
+        deadline = time.monotonic()+timeout
+        while True:
+            seq,views = self.views()
+            if seq is not None:
+                version = int(self.header[VERSION])
+                data = {field: array.copy() for field,array in views.items()}
+                # Views must be released before segment can be detached
+                del views
+                if self.isValid(seq):
+                    return version,pd.DataFrame(data).set_index('ID')
+            if time.monotonic() > deadline:
+                return None,None
+            time.sleep(0.001)
+
+    def close(self):
+
+        self.detach()
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Print standings shared by running EPO_OB")
+    parser.add_argument('--name',default=DEFAULT_NAME,help="name of shared memory (default: %(default)s)")
+    parser.add_argument('--top',type=int,default=10,help="number of runners (default: %(default)s)")
+    parser.add_argument('--watch',type=float,help="print again every WATCH seconds when standings change")
+    args = parser.parse_args(argv)
+
+    reader = StandingsReader(args.name)
+    last = None
+    try:
+        while True:
+            version,df = reader.read()
+            if version is None:
+                print(f"No standings in shared memory '{args.name}'",file=sys.stderr)
+                if args.watch is None: return 1
+            elif version != last:
+                print(f"Version {version}, {len(df)} runners")
+                print(df.head(args.top).to_string())
+                last = version
+            if args.watch is None: return 0
+            time.sleep(args.watch)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        reader.close()
+
+if __name__ == "__main__":
+    sys.exit(main())